@@ -0,0 +1,58 @@
+"""
+Benchmark attribute extraction: high level `attrs[key]` access against the
+low level bulk reader used by the attribute-only plugins.
+
+Usage: PYTHONPATH=. python benchmarks/bench_attributes.py [PATH] [REPEAT]
+"""
+import sys
+import time
+import porekit
+from porekit.plugins import Channel, Tracking, Read
+
+
+CHANNEL_KEYS = ["channel_number", "sampling_rate", "digitisation", "offset"]
+TRACKING_KEYS = ["run_id", "asic_id", "version_name", "asic_temp", "heatsink_temp",
+                 "exp_script_purpose", "flow_cell_id", "device_id"]
+READ_KEYS = ["start_time", "duration", "read_id", "read_number"]
+
+
+def high_level(fast5):
+    attrs = fast5['UniqueGlobalKey/channel_id'].attrs
+    channel = {k: attrs[k] for k in CHANNEL_KEYS}
+    attrs = fast5['UniqueGlobalKey/tracking_id'].attrs
+    tracking = {k: attrs[k] for k in TRACKING_KEYS}
+    attrs = fast5.get_read_node().attrs
+    read = {k: attrs[k] for k in READ_KEYS}
+    return channel, tracking, read
+
+
+def bulk(fast5, plugins=(Channel(), Tracking(), Read())):
+    requirements = {}
+    for plugin in plugins:
+        for node, names in plugin.required_attributes().items():
+            requirements.setdefault(node, []).extend(names)
+    fast5.prefetch_attributes(requirements)
+    return [plugin.run_on_fast5(fast5) for plugin in plugins]
+
+
+def timed(function, fast5s, repeat):
+    t = time.perf_counter()
+    for i in range(repeat):
+        for fast5 in fast5s:
+            fast5.__dict__.pop("_attribute_cache", None)
+            function(fast5)
+    return (time.perf_counter() - t) / (repeat * len(fast5s))
+
+
+def main(path="tests/data", repeat=20):
+    fast5s = list(porekit.open_fast5_files(path))
+    try:
+        for name, function in [("high level attrs", high_level), ("low level bulk", bulk)]:
+            print("%-18s %8.1f us/file" % (name, timed(function, fast5s, repeat) * 1e6))
+    finally:
+        for fast5 in fast5s:
+            fast5.close()
+
+
+if __name__ == "__main__":
+    main(*[int(a) if a.isdigit() else a for a in sys.argv[1:]])
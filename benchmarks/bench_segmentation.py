@@ -0,0 +1,61 @@
+"""
+Benchmark event detection from raw signal in samples per second per core,
+for a single long synthetic signal and for the Fast5 files under PATH with
+an increasing number of worker processes.
+
+Usage: PYTHONPATH=. python benchmarks/bench_segmentation.py [PATH] [MAX_WORKERS]
+"""
+import sys
+import time
+import numpy as np
+import porekit
+from porekit.segmentation import EventDetector, segment_files
+
+
+def synthetic(n=10000000, seed=0):
+    rng = np.random.RandomState(seed)
+    lengths = rng.geometric(1 / 10.0, size=n // 5)
+    levels = rng.normal(400, 60, size=len(lengths))
+    signal = np.repeat(levels, lengths)[:n] + rng.normal(0, 8, size=n)
+    return signal.astype("int16")
+
+
+def bench_stream(signal, chunk_size=1 << 18):
+    t = time.perf_counter()
+    detector = EventDetector()
+    n_events = 0
+    for i in range(0, len(signal), chunk_size):
+        n_events += len(detector.feed(signal[i:i + chunk_size]))
+    n_events += len(detector.finish())
+    return len(signal) / (time.perf_counter() - t), n_events
+
+
+def raw_references(path):
+    references = []
+    for reference in porekit.find_fast5_references(path):
+        with porekit.open_fast5(reference) as fast5:
+            if 'Raw' in fast5:
+                references.append((reference, len(fast5.get_raw_node()['Signal'])))
+    return references
+
+
+def main(path="tests/data", max_workers=4):
+    rate, n_events = bench_stream(synthetic())
+    print("synthetic stream   %6.1f M samples/s/core (%i events)" % (rate / 1e6, n_events))
+    references = raw_references(path)
+    if not references:
+        return
+    names = [name for name, length in references] * 20
+    n_samples = sum(length for name, length in references) * 20
+    workers = 1
+    while workers <= max_workers:
+        t = time.perf_counter()
+        for name, events in segment_files(names, workers=workers):
+            pass
+        rate = n_samples / (time.perf_counter() - t)
+        print("%2i worker(s)       %6.1f M samples/s/core" % (workers, rate / workers / 1e6))
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main(*[int(a) if a.isdigit() else a for a in sys.argv[1:]])
@@ -4,8 +4,50 @@ __author__ = 'Andreas Klostermann'
 __email__ = 'andreasklostermann@gmail.com'
 __version__ = '0.1.0'
 
-from . import plugins
-from .porekit import find_fast5_files, open_fast5_files, sanity_check
-from .porekit import get_fast5_file_metadata
-from .porekit import gather_metadata, Fast5File, make_squiggle
-from . import plots
+# The public API is loaded lazily on first attribute access, so that
+# `import porekit` doesn't pay for h5py, pandas, Bio or matplotlib until
+# they are actually needed. This keeps CLI startup and worker processes fast.
+import importlib
+
+_submodules = ['aio', 'batch', 'export', 'kmers', 'models', 'packing', 'plugins', 'plots',
+               'porekit', 'profiles', 'pyramid', 'report', 'scoring', 'segmentation', 'simulate',
+               'storage', 'utils']
+
+_attributes = {
+    'find_fast5_files': 'porekit',
+    'open_fast5_files': 'porekit',
+    'sanity_check': 'porekit',
+    'get_fast5_file_metadata': 'porekit',
+    'gather_metadata': 'porekit',
+    'Fast5File': 'porekit',
+    'make_squiggle': 'porekit',
+    'open_fast5': 'porekit',
+    'PackedFast5Read': 'porekit',
+    'Fast5Container': 'porekit',
+    'StalePackedReadError': 'porekit',
+    'find_fast5_containers': 'porekit',
+    'find_fast5_references': 'porekit',
+    'update_metadata': 'porekit',
+    'repack': 'packing',
+    'EventBatch': 'batch',
+    'OpenProfile': 'profiles',
+    'set_default_profile': 'profiles',
+    'load_metadata': 'storage',
+    'aopen_fast5_files': 'aio',
+}
+
+
+def __getattr__(name):
+    if name in _attributes:
+        module = importlib.import_module('.' + _attributes[name], __name__)
+        value = getattr(module, name)
+    elif name in _submodules:
+        value = importlib.import_module('.' + name, __name__)
+    else:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + _submodules + list(_attributes.keys()))
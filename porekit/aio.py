@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio interface to Fast5 files.
+
+All HDF5 work runs in the executor of an `AsyncReader`, never on the event
+loop. The reader bounds the number of calls in flight with a semaphore:
+once `max_pending` calls are queued, further calls wait for a free slot
+instead of piling up in the executor queue, so a burst of requests can't
+grow memory without bound and the event loop stays responsive.
+
+Two ways of reading are offered:
+
+* `aopen_fast5_files` and `aopen_fast5` return `AsyncFast5` objects, open
+  files whose accessors (`get_events`, `get_fastq`, ...) are coroutines.
+  These run in threads; h5py serialises calls into the HDF5 library, so
+  threads keep the loop free but don't read in parallel.
+* `AsyncReader.read_events`, `read_fastq` and `read_raw_signal` open a file
+  by reference, read and close it again in one call. Only the reference and
+  the result cross the executor boundary, so these also work with a
+  `concurrent.futures.ProcessPoolExecutor` for reads in parallel.
+
+::
+
+    async with AsyncReader(max_workers=4) as reader:
+        async for fast5 in aopen_fast5_files(path, reader=reader):
+            async with fast5:
+                events = await fast5.get_events()
+"""
+import os
+import asyncio
+import functools
+import weakref
+
+
+DEFAULT_WORKERS = 4
+
+# Files opened ahead of the consumer of `aopen_fast5_files`
+DEFAULT_PREFETCH = 4
+
+
+class AsyncReader(object):
+    """
+    A bounded executor for blocking Fast5 calls.
+
+    `executor` is any `concurrent.futures.Executor`; by default a thread
+    pool with `max_workers` threads is created and shut down with the
+    reader. At most `max_pending` calls (default: twice the number of
+    workers) are submitted at a time.
+    """
+    def __init__(self, max_workers=DEFAULT_WORKERS, max_pending=None, executor=None,
+                 profile=None):
+        if max_workers < 1:
+            raise ValueError("`max_workers` parameter needs a positive integer")
+        if max_pending is None:
+            max_pending = 2 * max_workers
+        if max_pending < 1:
+            raise ValueError("`max_pending` parameter needs a positive integer")
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.profile = profile
+        self._own_executor = executor is None
+        self._executor = executor
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(self.max_workers,
+                                                thread_name_prefix="porekit-aio")
+        return self._executor
+
+    @property
+    def semaphore(self):
+        # One per event loop, as asyncio primitives are bound to a loop
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.max_pending)
+        return self._semaphores[loop]
+
+    async def run(self, func, *args, **kwargs):
+        """ Run `func(*args, **kwargs)` in the executor and return its result. """
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor,
+                                              functools.partial(func, *args, **kwargs))
+
+    async def read_events(self, reference, start=None, end=None):
+        """ The events of a file or packed read as a DataFrame, see `Fast5Base.get_events`. """
+        return await self.run(_read_events, reference, start, end, self.profile)
+
+    async def read_fastq(self, reference, which=("template", "complement", "2D")):
+        """ The basecalls of a file or packed read in FASTQ format. """
+        return await self.run(_read_fastq, reference, list(which), self.profile)
+
+    async def read_raw_signal(self, reference, start=None, end=None, scaled=True):
+        """ The raw signal of a file, see `Fast5Base.get_raw_signal`. """
+        return await self.run(_read_raw_signal, reference, start, end, scaled, self.profile)
+
+    def close(self):
+        """ Shut down the executor if the reader created it. """
+        if self._own_executor and self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def aclose(self):
+        if self._own_executor and self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.get_running_loop().run_in_executor(
+                None, functools.partial(executor.shutdown, wait=True))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+
+def _read_events(reference, start, end, profile):
+    from .porekit import open_fast5
+    with open_fast5(reference, profile=profile) as fast5:
+        return fast5.get_events(start, end)
+
+
+def _read_fastq(reference, which, profile):
+    from .porekit import open_fast5
+    with open_fast5(reference, profile=profile) as fast5:
+        return fast5.get_fastq(which)
+
+
+def _read_raw_signal(reference, start, end, scaled, profile):
+    from .porekit import open_fast5
+    with open_fast5(reference, profile=profile) as fast5:
+        return fast5.get_raw_signal(start, end, scaled)
+
+
+_default_reader = None
+
+
+def get_default_reader():
+    """ The reader used when none is given, created on first use. """
+    global _default_reader
+    if _default_reader is None:
+        _default_reader = AsyncReader()
+    return _default_reader
+
+
+class AsyncFast5(object):
+    """
+    An open Fast5 file or packed read whose accessors are coroutines run in
+    `reader`. The underlying object is `fast5`; use it directly only from
+    code running in the reader's executor.
+    """
+    def __init__(self, fast5, reader=None):
+        self.fast5 = fast5
+        self.reader = reader or get_default_reader()
+
+    @property
+    def filename(self):
+        return self.fast5.filename
+
+    def _call(self, name, *args, **kwargs):
+        return self.reader.run(getattr(self.fast5, name), *args, **kwargs)
+
+    def get_read_id(self):
+        return self._call("get_read_id")
+
+    def get_channel_info(self):
+        return self._call("get_channel_info")
+
+    def get_tracking_info(self):
+        return self._call("get_tracking_info")
+
+    def get_read_info(self):
+        return self._call("get_read_info")
+
+    def get_basecalling_info(self):
+        return self._call("get_basecalling_info")
+
+    def get_events(self, start=None, end=None):
+        return self._call("get_events", start, end)
+
+    def get_events_by_index(self, start_index=None, end_index=None):
+        return self._call("get_events_by_index", start_index, end_index)
+
+    def get_fastq(self, which=("template", "complement", "2D")):
+        return self._call("get_fastq", list(which))
+
+    def get_template_fastq(self):
+        return self._call("get_template_fastq")
+
+    def get_complement_fastq(self):
+        return self._call("get_complement_fastq")
+
+    def get_2D_fastq(self):
+        return self._call("get_2D_fastq")
+
+    def get_raw_signal(self, start=None, end=None, scaled=True):
+        return self._call("get_raw_signal", start, end, scaled)
+
+    def get_kmer_model(self, strand="template"):
+        return self._call("get_kmer_model", strand)
+
+    def close(self):
+        return self._call("close")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def __repr__(self):
+        return "<AsyncFast5 %r>" % (self.fast5,)
+
+
+async def aopen_fast5(reference, mode="r", profile=None, reader=None):
+    """ Open a Fast5 file or packed read (see `open_fast5`) as an `AsyncFast5`. """
+    from .porekit import open_fast5
+    reader = reader or get_default_reader()
+    fast5 = await reader.run(open_fast5, reference, mode=mode, profile=profile)
+    return AsyncFast5(fast5, reader)
+
+
+def _open_checked(reference, mode, profile):
+    from .porekit import open_fast5, sanity_check
+    try:
+        fast5 = open_fast5(reference, mode=mode, profile=profile)
+    except (OSError, KeyError):
+        return None
+    try:
+        if sanity_check(fast5):
+            return fast5
+    except OSError:
+        pass
+    fast5.close()
+    return None
+
+
+def _list_references(path, profile):
+    from .porekit import find_fast5_references
+    return list(find_fast5_references(path, profile=profile))
+
+
+async def aopen_fast5_files(path, mode="r", profile=None, reader=None, prefetch=DEFAULT_PREFETCH):
+    """
+    Asynchronous version of `open_fast5_files`: yields an `AsyncFast5` for
+    every Fast5 file and packed read under `path` which opens and passes
+    `sanity_check`, in the same order.
+
+    Up to `prefetch` files are opened ahead of the consumer; a slow consumer
+    stops further opens. Files are not closed by the iterator.
+    """
+    if prefetch < 1:
+        raise ValueError("`prefetch` parameter needs a positive integer")
+    reader = reader or get_default_reader()
+    if os.path.isfile(path):
+        references = [path]
+    else:
+        references = await reader.run(_list_references, path, profile)
+    pending = []
+    references = iter(references)
+    try:
+        while True:
+            while len(pending) < prefetch:
+                reference = next(references, None)
+                if reference is None:
+                    break
+                pending.append(asyncio.ensure_future(
+                    reader.run(_open_checked, reference, mode, profile)))
+            if not pending:
+                break
+            fast5 = await pending.pop(0)
+            if fast5 is not None:
+                yield AsyncFast5(fast5, reader)
+    finally:
+        # Close files opened ahead which were never handed out. The opens
+        # can't be cancelled once they run in the executor, so wait for them.
+        for future in pending:
+            fast5 = await future
+            if fast5 is not None:
+                await reader.run(fast5.close)
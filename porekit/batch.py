@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Events of many reads in a few flat arrays.
+
+An `EventBatch` stores the events of all reads in one structured array,
+read after read, plus an `offsets` array: the events of read `i` are
+`events[offsets[i]:offsets[i + 1]]`. Per read access returns views into the
+flat array, and per read reductions are single `ufunc.reduceat` calls, so
+there is no per read Python object unless one is asked for.
+
+Batches are saved as a single file: a short header followed by the raw
+arrays, each aligned to 64 bytes. `EventBatch.load` maps the arrays from
+the file without reading them, so batches larger than memory can be opened
+and sliced.
+"""
+import ast
+import numpy as np
+
+
+EVENT_FIELDS = ['start', 'length', 'mean', 'stdv']
+
+MAGIC = b"PKEVENTS"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+
+class EventBatch(object):
+    """
+    `events` is a structured array with the events of all reads, `offsets`
+    an int64 array with one entry more than there are reads, `read_ids` a
+    bytes array of read ids and `time_scales` the units per second of the
+    `start` and `length` columns of every read (see
+    `Fast5Base.get_event_time_scale`).
+    """
+    def __init__(self, events, offsets, read_ids, time_scales=None):
+        offsets = np.asarray(offsets, dtype="int64")
+        if len(offsets) != len(read_ids) + 1 or offsets[0] != 0 or offsets[-1] != len(events):
+            raise ValueError("`offsets` doesn't match `events` and `read_ids`")
+        self.events = events
+        self.offsets = offsets
+        self.read_ids = np.asarray(read_ids, dtype="S")
+        if time_scales is None:
+            time_scales = np.ones(len(read_ids))
+        self.time_scales = np.asarray(time_scales, dtype="float64")
+        self._index = None
+
+    @classmethod
+    def from_arrays(cls, arrays, read_ids, time_scales=None):
+        """ Create a batch from a list of per read event arrays. """
+        lengths = [len(a) for a in arrays]
+        offsets = np.concatenate([[0], np.cumsum(lengths, dtype="int64")])
+        if arrays:
+            events = np.concatenate(arrays)
+        else:
+            events = np.empty(0, dtype=[(field, "float64") for field in EVENT_FIELDS])
+        return cls(events, offsets, read_ids, time_scales)
+
+    @classmethod
+    def concatenate(cls, batches):
+        """ Join several batches into one. """
+        batches = list(batches)
+        if not batches:
+            return cls.from_arrays([], [])
+        events = np.concatenate([batch.events for batch in batches])
+        ends = np.cumsum([len(batch.events) for batch in batches])
+        offsets = [np.zeros(1, dtype="int64")]
+        for batch, base in zip(batches, np.concatenate([[0], ends[:-1]])):
+            offsets.append(batch.offsets[1:] + base)
+        return cls(events, np.concatenate(offsets),
+                   np.concatenate([batch.read_ids for batch in batches]),
+                   np.concatenate([batch.time_scales for batch in batches]))
+
+    def __len__(self):
+        return len(self.read_ids)
+
+    @property
+    def lengths(self):
+        """ Number of events of every read. """
+        return np.diff(self.offsets)
+
+    def index(self, read_id):
+        """ Position of a read in the batch. """
+        if self._index is None:
+            self._index = {read_id: i for i, read_id in enumerate(self.read_ids)}
+        if isinstance(read_id, str):
+            read_id = read_id.encode("ascii")
+        return self._index[read_id]
+
+    def __getitem__(self, key):
+        """
+        The events of a read as a view into the flat array, by position or
+        read id.
+        """
+        if isinstance(key, (str, bytes)):
+            key = self.index(key)
+        if key < 0:
+            key += len(self)
+        return self.events[self.offsets[key]:self.offsets[key + 1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def reduce(self, field, ufunc=np.add, empty=np.nan):
+        """
+        Reduce `field` per read with `ufunc` (e.g. `np.add`, `np.minimum`).
+        Reads without events get `empty`.
+        """
+        return self._reduce_values(self.events[field], ufunc, empty)
+
+    def _reduce_values(self, values, ufunc, empty):
+        lengths = self.lengths
+        result = np.full(len(self), empty, dtype="float64")
+        has_events = lengths > 0
+        if has_events.any():
+            reduced = ufunc.reduceat(values, self.offsets[:-1][has_events])
+            result[has_events] = reduced
+        return result
+
+    def sum(self, field):
+        return self.reduce(field, np.add, empty=0.0)
+
+    def mean(self, field):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.sum(field) / self.lengths
+
+    def std(self, field):
+        mean = self.mean(field)
+        deviations = self.events[field] - np.repeat(mean, self.lengths)
+        squares = self._reduce_values(deviations * deviations, np.add, 0.0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.sqrt(squares / self.lengths)
+
+    def min(self, field):
+        return self.reduce(field, np.minimum)
+
+    def max(self, field):
+        return self.reduce(field, np.maximum)
+
+    def durations(self):
+        """ Time in seconds from the start of the first to the end of the last event. """
+        last = np.maximum(self.offsets[1:] - 1, 0)
+        first = self.offsets[:-1]
+        if len(self.events) == 0:
+            return np.full(len(self), np.nan)
+        end = self.events['start'][last] + self.events['length'][last]
+        result = (end - self.events['start'][first]) / self.time_scales
+        return np.where(self.lengths > 0, result, np.nan)
+
+    def save(self, path):
+        """ Write the batch into a single file which `load` can memory map. """
+        arrays = [("events", np.ascontiguousarray(self.events)),
+                  ("offsets", self.offsets),
+                  ("read_ids", self.read_ids),
+                  ("time_scales", self.time_scales)]
+        header = {"version": FORMAT_VERSION, "arrays": []}
+        position = 0
+        for name, array in arrays:
+            header["arrays"].append((name, np.lib.format.dtype_to_descr(array.dtype),
+                                     len(array), position))
+            position += _aligned(array.nbytes)
+        header_bytes = repr(header).encode("ascii")
+        data_start = _aligned(len(MAGIC) + 8 + len(header_bytes))
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            f.write(np.array(len(header_bytes), dtype="<u8").tobytes())
+            f.write(header_bytes)
+            for (name, array), (n, descr, count, offset) in zip(arrays, header["arrays"]):
+                f.seek(data_start + offset)
+                f.write(array.tobytes())
+            f.truncate(data_start + position)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Open a batch written by `save`. With `mmap`, the arrays are read only
+        views of the file and only the pages that are accessed are read.
+        """
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("%s is not an event batch file" % path)
+            size = int(np.frombuffer(f.read(8), dtype="<u8")[0])
+            header = ast.literal_eval(f.read(size).decode("ascii"))
+        if header["version"] > FORMAT_VERSION:
+            raise ValueError("Event batch format version %i is not supported" % header["version"])
+        data_start = _aligned(len(MAGIC) + 8 + size)
+        arrays = {}
+        for name, descr, count, offset in header["arrays"]:
+            dtype = np.lib.format.descr_to_dtype(descr)
+            if mmap and count > 0:
+                arrays[name] = np.memmap(path, dtype=dtype, mode="r", shape=(count,),
+                                         offset=data_start + offset)
+            else:
+                with open(path, "rb") as f:
+                    f.seek(data_start + offset)
+                    arrays[name] = np.fromfile(f, dtype=dtype, count=count)
+        return cls(arrays["events"], np.asarray(arrays["offsets"]), arrays["read_ids"],
+                   arrays["time_scales"])
+
+    def __repr__(self):
+        return "<EventBatch reads=%i events=%i>" % (len(self), len(self.events))
+
+
+def _aligned(n):
+    return -(-n // ALIGNMENT) * ALIGNMENT
+
+
+def read_event_array(fast5, fields=EVENT_FIELDS):
+    """ The events of a read as a structured array of float64 `fields`. """
+    events = fast5.get_read_node()['Events'][:]
+    result = np.empty(len(events), dtype=[(field, "float64") for field in fields])
+    for field in fields:
+        result[field] = events[field]
+    return result
+
+
+def _batch_chunk(task):
+    from .porekit import open_fast5
+    references, fields, profile = task
+    arrays, read_ids, time_scales = [], [], []
+    for reference in references:
+        try:
+            fast5 = open_fast5(reference, profile=profile)
+        except (OSError, KeyError):
+            continue
+        try:
+            events = read_event_array(fast5, fields)
+            read_id = fast5.get_read_id()
+            time_scale = fast5.get_event_time_scale()
+        except (KeyError, ValueError):
+            continue
+        finally:
+            fast5.close()
+        arrays.append(events)
+        read_ids.append(read_id)
+        time_scales.append(time_scale)
+    if not arrays:
+        return None, len(references)
+    return EventBatch.from_arrays(arrays, read_ids, time_scales), len(references)
+
+
+def read_event_batch(file_names, fields=EVENT_FIELDS, workers=1, progress_callback=None,
+                     profile=None):
+    """
+    Read the events of Fast5 files and packed reads into an `EventBatch`,
+    using `workers` processes. Files without events are skipped. Reads keep
+    the order of `file_names`.
+    """
+    from .profiles import get_profile
+    if workers < 1:
+        raise ValueError("`workers` parameter needs a positive integer")
+    profile = get_profile(profile)
+    files_total = len(file_names)
+    chunk_size = max(1, min(1000, files_total // (workers * 4)))
+    tasks = [(file_names[i:i + chunk_size], list(fields), profile)
+             for i in range(0, files_total, chunk_size)]
+    if workers == 1:
+        results = map(_batch_chunk, tasks)
+        pool = None
+    else:
+        import multiprocessing
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap(_batch_chunk, tasks)
+    batches = []
+    files_read = 0
+    try:
+        for batch, n_files in results:
+            if batch is not None:
+                batches.append(batch)
+            files_read += n_files
+            if progress_callback:
+                progress_callback(files_read, files_total)
+    finally:
+        if pool is not None:
+            pool.close()
+    if not batches:
+        return EventBatch.from_arrays([], [])
+    return EventBatch.concatenate(batches)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Export of the event tables of a whole run into a Parquet dataset.
+
+Every worker process streams the events of its share of the files into its
+own Parquet file, `events-<task>.parquet`, one row per event with the
+`read_id` and `channel` of its read. Rows are buffered only until a row
+group is full, so the memory of a worker is bounded by the row group size
+no matter how many reads it exports, and nothing but counts is sent back to
+the main process.
+
+The result is a directory which `load_events` or any Parquet reader can
+scan with vectorised queries, e.g.
+`pyarrow.dataset.dataset(path).to_table(filter=...)`.
+"""
+import os
+import glob
+from .batch import EVENT_FIELDS, read_event_array
+
+
+# Rows per row group: large enough for efficient scans, small enough to
+# bound the memory of a worker
+ROW_GROUP_SIZE = 1 << 20
+
+PART_PATTERN = "events-%05i.parquet"
+
+
+def event_schema(fields=EVENT_FIELDS):
+    """ The Arrow schema of exported events. """
+    import pyarrow as pa
+    return pa.schema([("read_id", pa.string()), ("channel", pa.int32()),
+                      ("time_scale", pa.float64())]
+                     + [(field, pa.float64()) for field in fields])
+
+
+def read_event_table(fast5, fields=EVENT_FIELDS):
+    """
+    The events of a read as an Arrow table in the layout of `event_schema`.
+    `time_scale` are the units of `start` and `length` per second.
+    """
+    import pyarrow as pa
+    events = read_event_array(fast5, fields)
+    n = len(events)
+    channel = int(fast5.get_attributes('channel', ['channel_number'])['channel_number'])
+    columns = [pa.repeat(pa.scalar(fast5.get_read_id(), pa.string()), n),
+               pa.repeat(pa.scalar(channel, pa.int32()), n),
+               pa.repeat(pa.scalar(fast5.get_event_time_scale(), pa.float64()), n)]
+    columns += [pa.array(events[field]) for field in fields]
+    return pa.Table.from_arrays(columns, schema=event_schema(fields))
+
+
+class _PartWriter(object):
+    """ Writes tables into a Parquet file in row groups of exactly `row_group_size` rows. """
+    def __init__(self, path, schema, row_group_size, compression):
+        self.path = path
+        self.schema = schema
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.writer = None
+        self.buffer = []
+        self.buffered = 0
+
+    def write(self, table):
+        self.buffer.append(table)
+        self.buffered += len(table)
+        if self.buffered >= self.row_group_size:
+            self.flush(complete_only=True)
+
+    def flush(self, complete_only=False):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if not self.buffered:
+            return
+        table = pa.concat_tables(self.buffer)
+        size = len(table)
+        if complete_only:
+            size -= size % self.row_group_size
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, self.schema, compression=self.compression)
+        self.writer.write_table(table.slice(0, size), row_group_size=self.row_group_size)
+        rest = table.slice(size)
+        self.buffer = [rest] if len(rest) else []
+        self.buffered = len(rest)
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+
+
+def _export_chunk(task):
+    from .porekit import open_fast5
+    number, references, output, fields, row_group_size, compression, profile = task
+    writer = _PartWriter(os.path.join(output, PART_PATTERN % number), event_schema(fields),
+                         row_group_size, compression)
+    reads, events = 0, 0
+    try:
+        for reference in references:
+            try:
+                fast5 = open_fast5(reference, profile=profile)
+            except (OSError, KeyError):
+                continue
+            try:
+                table = read_event_table(fast5, fields)
+            except (KeyError, ValueError, OSError):
+                continue
+            finally:
+                fast5.close()
+            writer.write(table)
+            reads += 1
+            events += len(table)
+    finally:
+        writer.close()
+    return len(references), reads, events
+
+
+def export_events(file_names, output, fields=EVENT_FIELDS, workers=1, row_group_size=ROW_GROUP_SIZE,
+                  compression="zstd", progress_callback=None, profile=None):
+    """
+    Export the events of Fast5 files and packed reads into a Parquet
+    dataset in the directory `output`, using `workers` processes. Files
+    without events are skipped. Part files of an earlier export into
+    `output` are replaced.
+
+    Returns the number of reads and events exported.
+    """
+    from .profiles import get_profile
+    if workers < 1:
+        raise ValueError("`workers` parameter needs a positive integer")
+    profile = get_profile(profile)
+    os.makedirs(output, exist_ok=True)
+    for stale in glob.glob(os.path.join(output, "events-*.parquet")):
+        os.remove(stale)
+    files_total = len(file_names)
+    chunk_size = max(1, min(1000, files_total // (workers * 4)))
+    tasks = [(i // chunk_size, file_names[i:i + chunk_size], output, list(fields),
+              row_group_size, compression, profile)
+             for i in range(0, files_total, chunk_size)]
+    if workers == 1:
+        results = map(_export_chunk, tasks)
+        pool = None
+    else:
+        import multiprocessing
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap_unordered(_export_chunk, tasks)
+    files_read, reads, events = 0, 0, 0
+    try:
+        for n_files, n_reads, n_events in results:
+            files_read += n_files
+            reads += n_reads
+            events += n_events
+            if progress_callback:
+                progress_callback(files_read, files_total)
+    finally:
+        if pool is not None:
+            pool.close()
+    return reads, events
+
+
+def load_events(path, columns=None, filters=None):
+    """
+    Load (part of) an exported event dataset as a DataFrame. `columns` and
+    `filters` work like for `porekit.load_metadata`, e.g.
+    `filters=[("channel", "=", 126)]`. Only the selected columns are read,
+    and row groups whose statistics exclude the filters are skipped.
+    """
+    import pyarrow.dataset as ds
+    from .storage import _filter_expression
+    dataset = ds.dataset(path, format="parquet")
+    return dataset.to_table(columns=columns, filter=_filter_expression(filters)).to_pandas()
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Fault isolation for metadata collection.
+
+`supervised_metadata_records` runs `_iter_fast5_metadata` in worker
+processes it supervises itself instead of a `multiprocessing.Pool`. Every
+worker reports each file as soon as it is done, so the supervisor knows
+which file a worker is busy with and for how long. A worker which takes
+longer than `timeout` seconds for a single file, or dies, is killed and
+replaced; the file gets an error record and the rest of its chunk goes back
+into the queue. The time `collect` waits for any one file is thereby
+bounded by the timeout.
+
+Files which fail to open or read, time out or crash a worker are
+remembered in a `Quarantine`, a JSON file, and skipped by later runs
+without being opened, as long as their size and modification time are
+unchanged. Files still
+being written by MinKNOW are tried again once they change.
+"""
+import os
+import json
+import time
+
+
+# Error stages which put a file into quarantine. Plugin errors don't: the
+# file itself is readable.
+QUARANTINE_STAGES = ("open", "file", "timeout", "crash")
+
+
+def _file_state(reference):
+    from .porekit import split_reference
+    file_name = split_reference(reference)[0]
+    try:
+        stat = os.stat(file_name)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class Quarantine(object):
+    """
+    A persistent list of files which couldn't be read, with the reasons.
+
+    `path` is the JSON file the list is loaded from and saved to; without a
+    path the list only lives in memory.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, reference):
+        """ True if `reference` is quarantined and its file didn't change since. """
+        entry = self.entries.get(reference)
+        return entry is not None and entry["state"] == _file_state(reference)
+
+    def add(self, reference, errors):
+        """ Quarantine `reference` for a list of error records. """
+        self.entries[reference] = {
+            "state": _file_state(reference),
+            "time": time.time(),
+            "errors": errors,
+        }
+
+    def discard(self, reference):
+        self.entries.pop(reference, None)
+
+    def update(self, record):
+        """
+        Quarantine the file of a metadata record if it has a file level
+        error, release it otherwise.
+        """
+        from .porekit import record_errors
+        errors = [error for error in record_errors(record) if error["stage"] in QUARANTINE_STAGES]
+        if errors:
+            self.add(record["absolute_filename"], errors)
+        else:
+            self.discard(record["absolute_filename"])
+
+    def split(self, references):
+        """ Split `references` into the ones to read and the quarantined ones. """
+        keep, skipped = [], []
+        for reference in references:
+            (skipped if reference in self else keep).append(reference)
+        return keep, skipped
+
+    def save(self):
+        if self.path is None:
+            return
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(temporary, self.path)
+
+    def __repr__(self):
+        return "<Quarantine %r files=%i>" % (self.path, len(self))
+
+
+def as_quarantine(quarantine):
+    """ Accept a `Quarantine`, a file name or None. """
+    if quarantine is None or isinstance(quarantine, Quarantine):
+        return quarantine
+    return Quarantine(quarantine)
+
+
+def _worker_main(connection, plugin_classes, raise_errors, profile, where):
+    from .porekit import _iter_fast5_metadata
+    plugins = None
+    if plugin_classes is not None:
+        plugins = [plugin_class() for plugin_class in plugin_classes]
+    while True:
+        references = connection.recv()
+        if references is None:
+            break
+        try:
+            for record in _iter_fast5_metadata(references, plugins, raise_errors=raise_errors,
+                                               profile=profile, where=where):
+                connection.send(("record", record))
+        except Exception as e:
+            try:
+                connection.send(("exception", e))
+            except Exception:
+                # Exceptions which can't be pickled
+                connection.send(("exception", RuntimeError("%s: %s" % (type(e).__name__, e))))
+            break
+        connection.send(("done", None))
+    connection.close()
+
+
+class _Worker(object):
+    def __init__(self, context, args):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child,) + args, daemon=True)
+        self.process.start()
+        child.close()
+        self.references = None
+
+    def assign(self, references):
+        self.references = references
+        self.position = 0
+        self.since = time.monotonic()
+        self.connection.send(references)
+
+    @property
+    def current(self):
+        return self.references[self.position]
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+
+
+def supervised_metadata_records(file_names, plugins=None, workers=1, timeout=60.0,
+                                raise_errors=False, profile=None, where=None, chunk_size=None):
+    """
+    Yield `(reference, record)` for every reference of `file_names`, with
+    `record` None for files rejected by `where`, using `workers` supervised
+    processes. Records come in the order they are finished.
+
+    A file taking longer than `timeout` seconds gets a record with a
+    "timeout" error, a file whose worker dies one with a "crash" error.
+    """
+    import multiprocessing
+    from multiprocessing.connection import wait
+    from .porekit import failed_file_record, WhereError
+    if workers < 1:
+        raise ValueError("`workers` parameter needs a positive integer")
+    if timeout is None or timeout <= 0:
+        raise ValueError("`timeout` needs to be a positive number of seconds")
+    plugin_classes = None
+    if plugins is not None:
+        plugin_classes = [type(plugin) for plugin in plugins]
+    if chunk_size is None:
+        chunk_size = max(1, min(100, len(file_names) // (workers * 4)))
+    queue = [file_names[i:i + chunk_size] for i in range(0, len(file_names), chunk_size)]
+    queue.reverse()
+
+    context = multiprocessing.get_context()
+    args = (plugin_classes, raise_errors, profile, where)
+    pool = [_Worker(context, args) for i in range(min(workers, len(queue)))]
+    try:
+        for worker in pool:
+            worker.assign(queue.pop())
+        while any(worker.references is not None for worker in pool):
+            busy = {worker.connection: worker for worker in pool if worker.references is not None}
+            now = time.monotonic()
+            deadline = min(worker.since for worker in busy.values()) + timeout
+            ready = wait(list(busy), max(0.0, deadline - now))
+            failed = {}
+            for connection in ready:
+                worker = busy[connection]
+                try:
+                    kind, value = connection.recv()
+                except (EOFError, OSError):
+                    failed[worker] = ("crash", None)
+                    continue
+                if kind == "record":
+                    yield worker.current, value
+                    worker.position += 1
+                    worker.since = time.monotonic()
+                elif kind == "done":
+                    worker.references = None
+                    if queue:
+                        worker.assign(queue.pop())
+                elif raise_errors or isinstance(value, WhereError):
+                    raise value
+                else:
+                    # The worker gave up on its chunk; record the file and
+                    # go on with the rest of the chunk in a new worker
+                    failed[worker] = ("file", value)
+            now = time.monotonic()
+            for worker in busy.values():
+                if worker.references is not None and now - worker.since > timeout:
+                    failed.setdefault(worker, ("timeout", None))
+            for worker, (stage, error) in failed.items():
+                reference = worker.current
+                remaining = worker.references[worker.position + 1:]
+                worker.kill()
+                if stage == "timeout":
+                    error = TimeoutError("No result after %g seconds" % timeout)
+                elif stage == "crash":
+                    error = RuntimeError("Worker process exited with code %s"
+                                         % worker.process.exitcode)
+                yield reference, failed_file_record(reference, stage, error)
+                if remaining:
+                    queue.append(remaining)
+                if queue:
+                    replacement = _Worker(context, args)
+                    replacement.assign(queue.pop())
+                    pool[pool.index(worker)] = replacement
+                else:
+                    pool.remove(worker)
+    finally:
+        for worker in pool:
+            if worker.references is None:
+                worker.stop()
+            else:
+                worker.kill()
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+K-mer spectrum and base composition of the basecalls of a run.
+
+`KmerCounts` holds the counts of every k-mer, the base counts, a histogram
+of the GC content of the reads and the homopolymer runs by base and length.
+Counts of different files can be merged by adding them, so worker processes
+each count a share of the files and the results are summed at the end.
+
+Sequences are counted in batches: the batch is joined with `N` separators
+into one buffer, encoded with the 2-bit lookup table of `porekit.utils` and
+counted with `np.bincount`. K-mers and homopolymer runs spanning a separator
+contain an N and are not counted.
+"""
+import numpy as np
+from itertools import chain
+from .utils import encode_bases, kmer_codes, split_fastq, dataset_bytes
+
+
+STRANDS = ['template', 'complement', '2D']
+
+# Longer homopolymer runs are counted in the last bin
+MAX_HOMOPOLYMER = 20
+
+# Bins of the per read GC content histogram, in percent
+GC_BINS = 101
+
+
+class KmerCounts(object):
+    """
+    Mergeable k-mer and composition counts.
+
+    `kmers` has one entry per k-mer code (see `porekit.utils.kmer_codes`),
+    `bases` counts A, C, G, T and everything else, `gc_histogram` counts
+    reads by GC percentage and `homopolymers[base, length]` counts runs.
+    `failed_files` counts the files whose basecalls couldn't be read.
+    """
+    def __init__(self, k, max_homopolymer=MAX_HOMOPOLYMER):
+        self.k = k
+        self.max_homopolymer = max_homopolymer
+        self.reads = 0
+        self.failed_files = 0
+        self.kmers = np.zeros(4 ** k, dtype="int64")
+        self.bases = np.zeros(5, dtype="int64")
+        self.gc_histogram = np.zeros(GC_BINS, dtype="int64")
+        self.homopolymers = np.zeros((4, max_homopolymer + 1), dtype="int64")
+
+    def add_sequences(self, sequences):
+        """ Count a batch of sequences given as bytes. """
+        sequences = [s for s in sequences if len(s)]
+        if not sequences:
+            return self
+        joined = b"N".join(sequences)
+        bases = encode_bases(joined)
+
+        codes = kmer_codes(joined, self.k)
+        self.kmers += np.bincount(codes[codes >= 0], minlength=4 ** self.k)
+        self.bases += np.bincount(np.where(bases >= 0, bases, 4), minlength=5)
+        self.bases[4] -= len(sequences) - 1
+
+        # Per read GC content, reads start after every separator
+        starts = np.cumsum([0] + [len(s) + 1 for s in sequences[:-1]])
+        gc = np.add.reduceat(((bases == 1) | (bases == 2)).astype("int64"), starts)
+        valid = np.add.reduceat((bases >= 0).astype("int64"), starts)
+        has_bases = valid > 0
+        percent = np.round(100.0 * gc[has_bases] / valid[has_bases]).astype("int64")
+        self.gc_histogram += np.bincount(percent, minlength=GC_BINS)
+        self.reads += len(sequences)
+
+        # Homopolymer runs: boundaries where the base changes
+        change = np.flatnonzero(np.diff(bases)) + 1
+        run_starts = np.concatenate([[0], change])
+        run_lengths = np.diff(np.concatenate([run_starts, [len(bases)]]))
+        run_bases = bases[run_starts]
+        keep = run_bases >= 0
+        lengths = np.minimum(run_lengths[keep], self.max_homopolymer)
+        index = run_bases[keep].astype("int64") * (self.max_homopolymer + 1) + lengths
+        self.homopolymers += np.bincount(
+            index, minlength=self.homopolymers.size).reshape(self.homopolymers.shape)
+        return self
+
+    def __iadd__(self, other):
+        if (other.k, other.max_homopolymer) != (self.k, self.max_homopolymer):
+            raise ValueError("Can only merge counts with the same k and homopolymer limit")
+        self.reads += other.reads
+        self.failed_files += other.failed_files
+        self.kmers += other.kmers
+        self.bases += other.bases
+        self.gc_histogram += other.gc_histogram
+        self.homopolymers += other.homopolymers
+        return self
+
+    def __add__(self, other):
+        result = KmerCounts(self.k, self.max_homopolymer)
+        result += self
+        result += other
+        return result
+
+    @property
+    def gc_content(self):
+        """ Fraction of G and C among all ACGT bases. """
+        total = self.bases[:4].sum()
+        return float(self.bases[1] + self.bases[2]) / total if total else float("nan")
+
+    def kmer_strings(self):
+        """ The k-mer of every entry of `kmers`, in code order. """
+        codes = np.arange(4 ** self.k)
+        letters = np.array(list(b"ACGT"), dtype="uint8")
+        digits = (codes[:, None] // 4 ** np.arange(self.k - 1, -1, -1)) % 4
+        return letters[digits].view("S%i" % self.k).ravel()
+
+    def to_frame(self):
+        """ K-mer counts as a `pandas.Series` indexed by k-mer, largest first. """
+        import pandas as pd
+        series = pd.Series(self.kmers, index=[kmer.decode("ascii") for kmer in self.kmer_strings()])
+        return series.sort_values(ascending=False)
+
+    def save(self, path):
+        """ Save the counts into a compressed `.npz` file. """
+        np.savez_compressed(path, k=self.k, reads=self.reads, failed_files=self.failed_files,
+                            kmers=self.kmers,
+                            bases=self.bases, gc_histogram=self.gc_histogram,
+                            homopolymers=self.homopolymers)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            counts = cls(int(data['k']), data['homopolymers'].shape[1] - 1)
+            counts.reads = int(data['reads'])
+            if 'failed_files' in data:
+                counts.failed_files = int(data['failed_files'])
+            for key in ['kmers', 'bases', 'gc_histogram', 'homopolymers']:
+                setattr(counts, key, data[key])
+        return counts
+
+    def __repr__(self):
+        return "<KmerCounts k=%i reads=%i bases=%i failed_files=%i>" % (
+            self.k, self.reads, self.bases.sum(), self.failed_files)
+
+
+def read_basecalls(fast5, strands=STRANDS):
+    """
+    Return the sequences of the basecalls `strands` which exist in a file, as
+    bytes. Like `plugins.Basecall`, the 2D analyses are searched before the
+    1D ones, and the first basecall of each strand found is used.
+    """
+    fastqs = {}
+    if 'Analyses' in fast5:
+        basecallers = chain(fast5.find_analysis_base("Basecall_2D"),
+                            fast5.find_analysis_base("Basecall_1D"))
+        for basename, number in basecallers:
+            node = fast5["Analyses"][basename + '_' + number]
+            for strand in strands:
+                path = 'BaseCalled_%s/Fastq' % strand
+                if strand not in fastqs and path in node:
+                    fastqs[strand] = node[path]
+    return [split_fastq(dataset_bytes(fastqs[strand]))[1] for strand in strands if strand in fastqs]
+
+
+def count_fast5(fast5, k=5, strands=STRANDS):
+    """ Return the `KmerCounts` of the basecalls of a single file. """
+    return KmerCounts(k).add_sequences(read_basecalls(fast5, strands))
+
+
+def _count_chunk(task):
+    from .porekit import open_fast5
+    references, k, strands, batch_size, profile = task
+    counts = KmerCounts(k)
+    batch = []
+    for reference in references:
+        try:
+            fast5 = open_fast5(reference, profile=profile)
+        except Exception:
+            counts.failed_files += 1
+            continue
+        try:
+            batch += read_basecalls(fast5, strands)
+        except Exception:
+            counts.failed_files += 1
+        finally:
+            fast5.close()
+        if len(batch) >= batch_size:
+            counts.add_sequences(batch)
+            batch = []
+    counts.add_sequences(batch)
+    return counts, len(references)
+
+
+def count_kmers(file_names, k=5, strands=STRANDS, workers=1, batch_size=256,
+                progress_callback=None, profile=None):
+    """
+    Count k-mers and composition over the basecalls of Fast5 files and
+    packed reads, using `workers` processes. Files which can't be opened or
+    whose basecalls can't be read are skipped and counted in `failed_files`
+    of the returned `KmerCounts`.
+    """
+    from .profiles import get_profile
+    if workers < 1:
+        raise ValueError("`workers` parameter needs a positive integer")
+    profile = get_profile(profile)
+    files_total = len(file_names)
+    chunk_size = max(1, min(1000, files_total // (workers * 4)))
+    tasks = [(file_names[i:i + chunk_size], k, strands, batch_size, profile)
+             for i in range(0, files_total, chunk_size)]
+    if workers == 1:
+        results = map(_count_chunk, tasks)
+        pool = None
+    else:
+        import multiprocessing
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap_unordered(_count_chunk, tasks)
+    total = KmerCounts(k)
+    files_read = 0
+    try:
+        for counts, n_files in results:
+            total += counts
+            files_read += n_files
+            if progress_callback:
+                progress_callback(files_read, files_total)
+    finally:
+        if pool is not None:
+            pool.close()
+    return total
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+A process wide registry of k-mer models.
+
+All reads of a run share a handful of identical k-mer models, but every
+Fast5 file carries its own copy. The registry deduplicates models by a hash
+of their content, so each distinct model is turned into NumPy lookup arrays
+and a DataFrame only once per process.
+
+The digest covers every row and every column of a model, so two models
+which differ anywhere are never confused.
+
+Reading and hashing a model costs as much as reading it, so `from_dataset`
+first tries two lookups which don't touch the data: the digest stored in
+the `porekit_model_digest` attribute, which `porekit repack` writes, and
+the location of the dataset, for models read before from the same file.
+
+Models built from DataFrames or arrays passed to `porekit.scoring` and
+friends are kept in a small separate cache instead of the registry.
+"""
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from .utils import kmer_codes
+
+
+MODEL_FIELDS = ['kmer', 'level_mean', 'level_stdv', 'sd_mean', 'sd_stdv', 'weight']
+
+# Attribute of `Model` datasets holding their `model_digest`
+DIGEST_ATTRIBUTE = 'porekit_model_digest'
+
+# Dataset locations remembered by a registry
+MAX_LOCATIONS = 4096
+
+# Models converted from DataFrames and arrays by `as_kmer_model`
+MAX_CONVERSIONS = 16
+
+
+def _field_bytes(values):
+    if values.dtype.kind in "biuf":
+        return np.ascontiguousarray(values, dtype="<f8").tobytes()
+    if values.dtype.kind != "S":
+        values = [v if isinstance(v, bytes) else str(v).encode("utf-8") for v in values]
+    values = np.asarray(values, dtype="S")
+    return str(values.dtype.itemsize).encode("ascii") + values.tobytes()
+
+
+def model_digest(records):
+    """
+    Content hash of all columns of a model's records, independent of where
+    it was read from and of the byte order and width of numeric columns.
+    Non-numeric columns are hashed by their bytes, str encoded as UTF-8.
+    """
+    digest = hashlib.sha1()
+    for name in records.dtype.names:
+        digest.update(name.encode("utf-8") + b"\0")
+        digest.update(_field_bytes(records[name]))
+    return digest.hexdigest()
+
+
+class _LRUCache(object):
+    """ A thread safe mapping which forgets the least recently used entries. """
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _dataset_location(dataset):
+    """
+    A key identifying a dataset without reading it: file, file modification
+    time, object address, shape and type. None if the file can't be stat'ed.
+    """
+    import h5py
+    file_name = dataset.file.filename
+    try:
+        stat = os.stat(file_name)
+    except OSError:
+        return None
+    address = h5py.h5o.get_info(dataset.id).addr
+    return (os.path.realpath(file_name), stat.st_mtime_ns, stat.st_size, address,
+            dataset.shape, dataset.dtype.str)
+
+
+class KmerModel(object):
+    """
+    A k-mer model in array form.
+
+    `records` is a structured array with at least the fields `kmer`,
+    `level_mean` and `level_stdv`, like the `Model` datasets in Fast5 files.
+    `table` maps 2-bit k-mer codes (see `porekit.utils.kmer_codes`) to rows,
+    with -1 for k-mers the model doesn't contain.
+    """
+    def __init__(self, records, digest=None):
+        self.records = records
+        self.kmers = np.asarray(records['kmer'], dtype="S")
+        self.level_mean = np.asarray(records['level_mean'], dtype="float64")
+        self.level_stdv = np.asarray(records['level_stdv'], dtype="float64")
+        self.k = len(self.kmers[0])
+        self.digest = model_digest(records) if digest is None else digest
+
+        self.table = np.full(4 ** self.k, -1, dtype="int64")
+        codes = kmer_codes(b"".join(self.kmers), self.k)[::self.k]
+        valid = codes >= 0
+        self.table[codes[valid]] = np.arange(len(self.kmers))[valid]
+        self._frame = None
+
+    @staticmethod
+    def frame_records(frame):
+        """ The records of a DataFrame like returned by `Fast5File.get_model()`. """
+        kmers = np.asarray(frame["kmer"].values, dtype="S")
+        dtype = [("kmer", kmers.dtype)]
+        dtype += [(f, "float64") for f in MODEL_FIELDS[1:] if f in frame.columns]
+        records = np.empty(len(frame), dtype=dtype)
+        records["kmer"] = kmers
+        for field, field_type in dtype[1:]:
+            records[field] = frame[field].values
+        return records
+
+    @classmethod
+    def from_frame(cls, frame):
+        """ Create a model from a DataFrame like returned by `Fast5File.get_model()`. """
+        return cls(cls.frame_records(frame))
+
+    @property
+    def frame(self):
+        """ The model as a `pandas.DataFrame` indexed by k-mer. Built once and shared. """
+        if self._frame is None:
+            import pandas as pd
+            frame = pd.DataFrame(self.records)
+            frame.index = frame.kmer
+            self._frame = frame
+        return self._frame
+
+    def arrays(self):
+        """ Return `(k, table, level_mean, level_stdv)` as used by `porekit.scoring`. """
+        return self.k, self.table, self.level_mean, self.level_stdv
+
+    def kmer_rows(self, sequence):
+        """ Return the model row of every k-mer in `sequence`, -1 if unknown. """
+        codes = kmer_codes(sequence, self.k)
+        return np.where(codes >= 0, self.table[np.maximum(codes, 0)], -1)
+
+    def __len__(self):
+        return len(self.kmers)
+
+    def __repr__(self):
+        return "<KmerModel k=%i digest=%s>" % (self.k, self.digest[:12])
+
+
+class ModelRegistry(object):
+    """
+    Deduplicating store of `KmerModel` objects, keyed by content digest.
+    """
+    def __init__(self):
+        self._models = {}
+        self._locations = _LRUCache(MAX_LOCATIONS)
+        self._lock = threading.Lock()
+
+    def add(self, records):
+        """ Register a model given as a structured array, return the shared instance. """
+        model = KmerModel(records)
+        return self._register(model)
+
+    def add_frame(self, frame):
+        """ Register a model given as a DataFrame, return the shared instance. """
+        return self._register(KmerModel.from_frame(frame))
+
+    def _register(self, model):
+        with self._lock:
+            return self._models.setdefault(model.digest, model)
+
+    def from_dataset(self, dataset):
+        """
+        Return the shared model for an HDF5 `Model` dataset.
+
+        A known model is found without reading the dataset by its digest
+        attribute, or by its location if it was read before. Otherwise the
+        dataset is read and hashed completely, and a known model is
+        returned without building its lookup table again.
+        """
+        digest = dataset.attrs.get(DIGEST_ATTRIBUTE)
+        if digest is not None:
+            if isinstance(digest, bytes):
+                digest = digest.decode("ascii")
+            with self._lock:
+                model = self._models.get(digest)
+            if model is not None:
+                return model
+        location = _dataset_location(dataset)
+        model = self._locations.get(location) if location is not None else None
+        if model is not None:
+            return model
+        records = dataset[:]
+        digest = model_digest(records)
+        with self._lock:
+            model = self._models.get(digest)
+        if model is None:
+            model = self._register(KmerModel(records, digest))
+        if location is not None:
+            self._locations.put(location, model)
+        return model
+
+    def get(self, digest):
+        return self._models[digest]
+
+    def __contains__(self, digest):
+        return digest in self._models
+
+    def __len__(self):
+        return len(self._models)
+
+    def __iter__(self):
+        return iter(list(self._models.values()))
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+        self._locations.clear()
+
+    def save(self, path):
+        """ Save all registered models into a single `.npz` file. """
+        arrays = {}
+        for digest, model in self._models.items():
+            # h5py attaches dtype metadata which npz can't store
+            names = model.records.dtype.names
+            dtype = [(name, model.records.dtype[name].str) for name in names]
+            arrays[digest] = model.records.astype(dtype)
+        np.savez_compressed(path, **arrays)
+
+    def load(self, path):
+        """ Add all models from a file written by `save`. Returns the models. """
+        with np.load(path) as data:
+            return [self.add(data[key]) for key in data.files]
+
+
+registry = ModelRegistry()
+
+
+_conversions = _LRUCache(MAX_CONVERSIONS)
+
+
+def as_kmer_model(model):
+    """
+    Return a `KmerModel` for `model`, which may be a `KmerModel`, a model
+    DataFrame or a structured array of model records.
+
+    Models already in the registry are returned as the shared instance.
+    Others are not registered, but the last few conversions are cached, so
+    passing the same DataFrame repeatedly is cheap.
+    """
+    if isinstance(model, KmerModel):
+        return model
+    records = KmerModel.frame_records(model) if hasattr(model, "columns") else model
+    digest = model_digest(records)
+    if digest in registry:
+        return registry.get(digest)
+    converted = _conversions.get(digest)
+    if converted is None:
+        converted = KmerModel(records, digest)
+        _conversions.put(digest, converted)
+    return converted
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Consolidate many single read Fast5 files into a few large containers.
+
+A container is an HDF5 file with the extension `.fast5pack`. Every read is
+stored as a group below `Reads` which mirrors the layout of the original
+file, with array datasets (events, models, raw signal...) rewritten as
+compressed, chunked datasets. FASTQ strings are stored as compressed 1-d
+uint8 arrays. The `Index` dataset lists group name, original file name,
+read id and channel number of every read, so the reads of a container can
+be listed without touching the reads themselves. It also records path, size
+and modification time of every source file, so reads whose source was
+rewritten after packing can be recognised as stale, see the `check_stale`
+options of `Fast5Container` and `open_fast5`. K-mer models carry their
+digest as an attribute, so `porekit.models` can share them between reads
+without reading them.
+"""
+import os
+import h5py
+import numpy as np
+from .porekit import Fast5File, sanity_check, find_fast5_files
+from .porekit import CONTAINER_EXTENSION
+from .models import DIGEST_ATTRIBUTE, model_digest
+
+
+CONTAINER_VERSION = 2
+
+
+def _copy_attrs(source, target):
+    for key in source.attrs.keys():
+        attr_id = source.attrs.get_id(key)
+        target.attrs.create(key, source.attrs[key], dtype=attr_id.dtype)
+
+
+def _copy_dataset(dataset, target, name, compression, compression_opts):
+    if dataset.shape == () and name == "Fastq":
+        data = np.frombuffer(bytes(dataset[()]), dtype="uint8")
+    else:
+        data = dataset[()]
+    if np.ndim(data) >= 1 and np.size(data) > 0:
+        new = target.create_dataset(name, data=data, chunks=True, shuffle=True,
+                                    compression=compression,
+                                    compression_opts=compression_opts)
+    else:
+        new = target.create_dataset(name, data=data, dtype=dataset.dtype)
+    _copy_attrs(dataset, new)
+    if name == "Model" and data.dtype.names and "kmer" in data.dtype.names:
+        new.attrs[DIGEST_ATTRIBUTE] = model_digest(data)
+
+
+def _copy_group(source, target, compression, compression_opts):
+    _copy_attrs(source, target)
+    for name, node in source.items():
+        if isinstance(node, h5py.Group):
+            _copy_group(node, target.create_group(name), compression, compression_opts)
+        elif isinstance(node, h5py.Dataset):
+            _copy_dataset(node, target, name, compression, compression_opts)
+
+
+def _read_index_entry(fast5):
+    try:
+        read_id = fast5.get_read_id()
+    except (KeyError, ValueError):
+        read_id = b""
+    try:
+        channel_number = int(fast5['UniqueGlobalKey/channel_id'].attrs["channel_number"])
+    except (KeyError, ValueError):
+        channel_number = -1
+    if isinstance(read_id, str):
+        read_id = read_id.encode("ascii")
+    return read_id, channel_number
+
+
+def _write_index(container, entries):
+    def width(values):
+        return max([len(v) for v in values] + [1])
+    dtype = [("group", "S%d" % width([e[0] for e in entries])),
+             ("filename", "S%d" % width([e[1] for e in entries])),
+             ("read_id", "S%d" % width([e[2] for e in entries])),
+             ("channel_number", "int32"),
+             ("source", "S%d" % width([e[4] for e in entries])),
+             ("source_size", "int64"),
+             ("source_mtime_ns", "int64"),
+             ]
+    index = np.array(entries, dtype=dtype)
+    container.create_dataset("Index", data=index, compression="gzip",
+                             chunks=True if len(index) else None)
+
+
+def write_container(file_names, output_name, compression="gzip", compression_opts=4):
+    """
+    Write the given Fast5 files into a single container.
+
+    Files which can't be opened or don't pass `sanity_check` are skipped.
+    Returns the number of reads written.
+    """
+    entries = []
+    with h5py.File(output_name, "w") as container:
+        container.attrs["porekit_container_version"] = CONTAINER_VERSION
+        reads = container.create_group("Reads")
+        for file_name in file_names:
+            try:
+                fast5 = Fast5File(file_name)
+            except OSError:
+                continue
+            try:
+                if not sanity_check(fast5):
+                    continue
+                # Taken before copying, so a write during the copy makes the read stale
+                stat = os.stat(file_name)
+                group_name = "Read_%08d" % len(entries)
+                _copy_group(fast5, reads.create_group(group_name),
+                            compression, compression_opts)
+                read_id, channel_number = _read_index_entry(fast5)
+                filename = os.path.split(file_name)[-1].encode("utf-8")
+                source = os.path.abspath(file_name).encode("utf-8")
+                entries.append((group_name.encode("ascii"), filename, read_id, channel_number,
+                                source, stat.st_size, stat.st_mtime_ns))
+            finally:
+                fast5.close()
+        _write_index(container, entries)
+    return len(entries)
+
+
+def _write_container_task(task):
+    file_names, output_name, compression, compression_opts = task
+    write_container(file_names, output_name, compression=compression,
+                    compression_opts=compression_opts)
+    return output_name, len(file_names)
+
+
+def repack(path, output, reads_per_container=100000, prefix=None,
+           compression="gzip", compression_opts=4, progress_callback=None, workers=1):
+    """
+    Repack all Fast5 files under `path` into containers in directory `output`.
+
+    Containers are named `<prefix>_<number>.fast5pack` and hold at most
+    `reads_per_container` reads each. `prefix` defaults to the name of the
+    input directory. Up to `workers` containers are written in parallel.
+    Returns the list of container file names.
+    """
+    if reads_per_container < 1:
+        raise ValueError("`reads_per_container` needs to be a positive integer")
+    if workers < 1:
+        raise ValueError("`workers` parameter needs a positive integer")
+    if prefix is None:
+        prefix = os.path.basename(os.path.normpath(path)) or "reads"
+    os.makedirs(output, exist_ok=True)
+    file_names = sorted(find_fast5_files(path))
+    tasks = [(file_names[i:i + reads_per_container],
+              os.path.join(output, "%s_%04d%s" % (prefix, number, CONTAINER_EXTENSION)),
+              compression, compression_opts)
+             for number, i in enumerate(range(0, len(file_names), reads_per_container))]
+    if workers == 1:
+        results = map(_write_container_task, tasks)
+        pool = None
+    else:
+        import multiprocessing
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap(_write_container_task, tasks)
+    containers = []
+    files_done = 0
+    try:
+        for output_name, n_files in results:
+            containers.append(output_name)
+            files_done += n_files
+            if progress_callback:
+                progress_callback(files_done, len(file_names))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return containers
@@ -4,21 +4,30 @@ import matplotlib.pyplot as plt
 import porekit
 
 
+def _plot_columns(meta):
+    """ Rename collected metadata columns (e.g. from `porekit.load_metadata`)
+        to the names the plots use.
+    """
+    from .report import PLOT_COLUMNS
+    renames = {source: name for name, source in PLOT_COLUMNS.items()
+               if name not in meta.columns and source in meta.columns}
+    return meta.rename(columns=renames) if renames else meta
+
+
 def read_length_distribution(meta, ax=None):
     """ Plot the distribution of the read length.
         "read length" is measured as the maximum of template vs complement length.
 
     """
+    meta = _plot_columns(meta)
     if ax is None:
         f, ax = plt.subplots()
         f.set_figwidth(14)
         f.set_figheight(4)
         f.suptitle("Read length distribution")
     ax.xaxis.set_label_text("Read length")
-    a = meta.template_length.values
-    a[np.isnan(a)] = 0
-    b = meta.complement_length.values
-    b[np.isnan(b)] = 0
+    a = np.nan_to_num(meta.template_length.values.astype(float))
+    b = np.nan_to_num(meta.complement_length.values.astype(float))
     v = np.maximum(a, b)
     vmax = np.percentile(v, 99)
     v = v[v < vmax]
@@ -29,6 +38,7 @@ def read_length_distribution(meta, ax=None):
 def template_vs_complement(meta, ax=None):
     """ Plot template length vs complement length.
     """
+    meta = _plot_columns(meta)
     if ax is None:
         f, ax = plt.subplots()
         f.set_figwidth(5)
@@ -40,11 +50,12 @@ def template_vs_complement(meta, ax=None):
     nan = np.isnan(a) | np.isnan(b)
     a = a[~nan]
     b = b[~nan]
-    amax = np.percentile(a, 99.5)
-    bmax = np.percentile(b, 99.5)
-    both_max = max(amax, bmax)
-    ax.set_xlim(0, both_max)
-    ax.set_ylim(0, both_max)
+    if len(a):
+        amax = np.percentile(a, 99.5)
+        bmax = np.percentile(b, 99.5)
+        both_max = max(amax, bmax)
+        ax.set_xlim(0, both_max)
+        ax.set_ylim(0, both_max)
     ax.xaxis.set_label_text("Template length")
     ax.yaxis.set_label_text("Complement length")
     ax.scatter(a, b, s=3, alpha=0.5);
@@ -55,6 +66,7 @@ def reads_vs_time(meta, ax=None):
     """ Plot reads vs time.
         Useful to assess the degradation of channels over time.
     """
+    meta = _plot_columns(meta)
     if ax is None:
         f, ax = plt.subplots()
         f.set_figwidth(14)
@@ -72,6 +84,7 @@ def reads_vs_time(meta, ax=None):
 def occupancy(meta, ax=None):
     """ Show channel occupancy over time.
     """
+    meta = _plot_columns(meta)
     if ax is None:
         f, ax = plt.subplots()
         f.set_figwidth(14)
@@ -81,12 +94,18 @@ def occupancy(meta, ax=None):
     end_time = meta.read_end_time.max() / 10000 / 60
     total_minutes = end_time - start_time
     num_channels = meta.channel_number.max()+1
-    X = np.zeros((num_channels, int(np.ceil(total_minutes))))
-
-    for channel, group in meta.groupby("channel_number"):
-        for index, read in group.iterrows():
-            a, b = read.read_start_time/10000/60, read.read_end_time / 10000 / 60
-            X[channel, round(a):round(b)] = 1
+    width = int(np.ceil(total_minutes))
+
+    # Mark the minutes covered by each read: +1 where it starts, -1 where it
+    # ends, and a cumulative sum along time
+    channels = meta.channel_number.values.astype(int)
+    a = np.clip(np.round(meta.read_start_time.values / 10000 / 60), 0, width).astype(int)
+    b = np.clip(np.round(meta.read_end_time.values / 10000 / 60), 0, width).astype(int)
+    covered = b > a
+    D = np.zeros((num_channels, width + 1))
+    np.add.at(D, (channels[covered], a[covered]), 1)
+    np.add.at(D, (channels[covered], b[covered]), -1)
+    X = (np.cumsum(D, axis=1)[:, :width] > 0).astype(float)
     ax.imshow(X, aspect=total_minutes/1800, cmap="Greys")
     ax.xaxis.set_label_text("Time (in minutes)")
     ax.yaxis.set_label_text("Channel number")
@@ -96,6 +115,7 @@ def occupancy(meta, ax=None):
 def yield_curves(meta, ax=None):
     """ Show yield curves for template, complement and 2D sequences
     """
+    meta = _plot_columns(meta)
     if ax is None:
         f, ax = plt.subplots()
         f.set_figwidth(14)
@@ -117,12 +137,26 @@ def yield_curves(meta, ax=None):
     return ax.get_figure(), ax
 
 
-def squiggle_dots(fast5, ax=None):
-    if isinstance(fast5, porekit.Fast5File):
+def squiggle_dots(fast5, ax=None, start=None, end=None, pyramid=None, cache=False):
+    """ Plot the event means of a read over time.
+
+        `start` and `end` (in seconds from the beginning of the read) limit
+        the plot to a time window, and only that part of the events table is
+        read from the file.
+
+        For long reads, the events are drawn from a multi-resolution pyramid
+        (see `porekit.pyramid`) at the level matching the pixel width of the
+        axis, and redrawn when zooming. `pyramid` forces this on or off, by
+        default it is used when there are more events than pixels.
+        `cache=True` stores the pyramid of the whole read next to the file;
+        it is built from all events once and reused for any window.
+    """
+    from .pyramid import events_pyramid, PyramidView
+    if isinstance(fast5, porekit.porekit.Fast5Base):
         close_later = False
         f5 = fast5
     else:
-        f5 = porekit.Fast5File(fast5)
+        f5 = porekit.open_fast5(fast5)
         close_later = True
 
     if ax is None:
@@ -130,26 +164,53 @@ def squiggle_dots(fast5, ax=None):
         f.set_figwidth(14)
         f.set_figheight(4)
 
-    events = f5.get_events()
-    start = events.start.min()
     try:
-        hairpin_index = f5.get_read_node().attrs["hairpin_event_index"]
-    except KeyError:
-        hairpin_index = None
-
-    means = events["mean"]
-    times = events["start"]-start
-    times /= 10000
-    mine = means.min()
-    maxe = means.max()
-    ax.set_xlim(0, times.max())
+        start_index, end_index = f5.find_event_range(start, end)
+        if pyramid is None:
+            pyramid = end_index - start_index > ax.get_window_extent().width
+        if pyramid:
+            if cache:
+                # The cached pyramid covers the whole read
+                levels = events_pyramid(f5, cache=True)
+                first, last = start_index, end_index
+            else:
+                levels = events_pyramid(f5, start=start, end=end)
+                first, last = 0, end_index - start_index
+            level_0 = levels.levels[0]
+            times = level_0['time'][first:last]
+            values = level_0['sum'][first:last]
+            events = None
+        else:
+            events = f5.get_events(start, end)
+        origin = f5.get_events_by_index(0, 1).start.iloc[0]
+        time_scale = f5.get_event_time_scale()
+        try:
+            hairpin_index = f5.get_read_node().attrs["hairpin_event_index"]
+        except KeyError:
+            hairpin_index = None
+    finally:
+        if close_later:
+            f5.close()
+
+    if events is not None:
+        values = events["mean"].values
+        times = (events["start"] - origin).values / time_scale
+        event_numbers = events.index
+    else:
+        event_numbers = np.arange(start_index, end_index)
+    mine = values.min()
+    maxe = values.max()
     ax.set_ylim(mine-10, maxe+10)
     ax.grid(None)
-    ax.set_axis_bgcolor("white")
-    ax.scatter(times, means, alpha=1, s=1, color=(0, 0, 0))
-    if hairpin_index:
-        hairpin_index = fast5.get_read_node().attrs['hairpin_event_index']
-        hairpin_x = times[hairpin_index]
+    ax.set_facecolor("white")
+    ax.set_xlim(times.min(), times.max())
+    if events is not None:
+        ax.scatter(times, values, alpha=1, s=1, color=(0, 0, 0))
+    else:
+        # Keep a reference, the view lives as long as the axis
+        ax.pyramid_view = PyramidView(ax, levels)
+    if hairpin_index and hairpin_index in event_numbers:
+        hairpin_x = times[hairpin_index - event_numbers[0]]
         r = matplotlib.patches.Rectangle((hairpin_x, mine-10),
                                          1, 5, color="black", alpha=1)
         ax.add_patch(r)
@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from .utils import b_to_str, node_to_seq, rename_key
+from .utils import b_to_str, dataset_bytes, split_fastq, mean_qscore, rename_key
 from itertools import chain
 
 
@@ -23,8 +23,12 @@ class Plugin(object):
 
     In the final DataFrame, each key of the output will be prepended with the
     string in `base_name`.
+
+    `version` must be increased whenever the output of a plugin changes, so
+    that `porekit collect --update` knows to re-run it on existing tables.
     """
     base_name = None
+    version = 1
 
     def __init__(self):
         if self.base_name is None:
@@ -35,8 +39,40 @@ class Plugin(object):
         pass
 
 
-class Channel(Plugin):
+class AttributePlugin(Plugin):
+    """Base class for plugins which only read HDF5 attributes.
+
+    Subclasses list the attributes they need in `attributes`, as tuples of
+    `(node, attribute, key, converter)`. `node` is "tracking", "channel" or
+    "read" (see `Fast5Base.get_attributes`), `key` the output key and
+    `converter` a callable applied to the raw value, or None.
+
+    The attributes are read through the low level bulk reader. When several
+    attribute plugins run on the same file, `get_fast5_metadata` prefetches
+    the attributes of all of them in one pass per node.
+    """
+    attributes = []
+
+    def required_attributes(self):
+        requirements = {}
+        for node, attribute, key, converter in self.attributes:
+            requirements.setdefault(node, []).append(attribute)
+        return requirements
+
+    def run_on_fast5(self, fast5):
+        result = {}
+        for node, names in self.required_attributes().items():
+            values = fast5.get_attributes(node, names)
+            for n, attribute, key, converter in self.attributes:
+                if n == node:
+                    value = values[attribute]
+                    result[key] = value if converter is None else converter(value)
+        return result
+
+
+class Channel(AttributePlugin):
     base_name = 'channel'
+    version = 2
     expected_keys = [
         'number',
         'range',
@@ -44,16 +80,15 @@ class Channel(Plugin):
         'digitisation',
         'offset',
     ]
-
-    def run_on_fast5(self, fast5):
-        attrs = fast5['/UniqueGlobalKey/channel_id'].attrs
-        attr_keys = [
-            "channel_number", "sampling_rate", "digitisation", "offset"
-        ]
-        return {k: attrs[k] for k in attr_keys}
+    attributes = [
+        ('channel', 'channel_number', 'number', None),
+        ('channel', 'sampling_rate', 'sampling_rate', None),
+        ('channel', 'digitisation', 'digitisation', None),
+        ('channel', 'offset', 'offset', None),
+    ]
 
 
-class Tracking(Plugin):
+class Tracking(AttributePlugin):
     base_name = 'channel'
     expected_keys = [
         'run_id',
@@ -66,22 +101,21 @@ class Tracking(Plugin):
         'device_id',
     ]
 
-    def run_on_fast5(self, fast5):
-        items = [('run_id', b_to_str),
-                 ('asic_id', b_to_str),
-                 ('version_name', b_to_str),
-                 ('asic_temp', float),
-                 ('heatsink_temp', float),
-                 ('exp_script_purpose', b_to_str),
-                 ('flow_cell_id', b_to_str),
-                 ('device_id', b_to_str),
-                ]
-        attrs = fast5['/UniqueGlobalKey/tracking_id'].attrs
-        return {key: converter(attrs[key]) for key, converter in items}
+    attributes = [
+        ('tracking', 'run_id', 'run_id', b_to_str),
+        ('tracking', 'asic_id', 'asic_id', b_to_str),
+        ('tracking', 'version_name', 'version_name', b_to_str),
+        ('tracking', 'asic_temp', 'asic_temp', float),
+        ('tracking', 'heatsink_temp', 'heatsink_temp', float),
+        ('tracking', 'exp_script_purpose', 'exp_script_purpose', b_to_str),
+        ('tracking', 'flow_cell_id', 'flow_cell_id', b_to_str),
+        ('tracking', 'device_id', 'device_id', b_to_str),
+    ]
 
 
 class Basecall(Plugin):
     base_name = 'basecall'
+    version = 2
     expected_keys = ['has_basecall',
                      'has_template',
                      'has_complement',
@@ -100,43 +134,34 @@ class Basecall(Plugin):
         for basename, number in basecallers:
             result['has_basecall'] = True
             node = fast5["Analyses"][basename+'_'+number]
-            if 'BaseCalled_template' in node:
-                result["has_template"] = True
-                seq = node_to_seq(node['BaseCalled_template/Fastq'])
-                result["template_length"] = len(seq)
-                result["template_mean_qscore"] = seq.positional_metadata.quality.mean()
-
-            if 'BaseCalled_complement' in node:
-                result["has_complement"] = True
-                seq = node_to_seq(node['BaseCalled_complement/Fastq'])
-                result["complement_length"] = len(seq)
-                result["complement_mean_qscore"] = seq.positional_metadata.quality.mean()
-
-            if 'BaseCalled_2D' in node:
-                result["has_2D"] = True
-                seq = node_to_seq(node['BaseCalled_2D/Fastq'])
-                result["2D_length"] = len(seq)
-                result["2D_mean_qscore"] = seq.positional_metadata.quality.mean()
+            for strand in ['template', 'complement', '2D']:
+                path = 'BaseCalled_%s/Fastq' % strand
+                if path in node and ("has_" + strand) not in result:
+                    result["has_" + strand] = True
+                    name, seq, quality = split_fastq(dataset_bytes(node[path]))
+                    result[strand + "_length"] = len(seq)
+                    result[strand + "_mean_qscore"] = mean_qscore(quality)
         return result
 
 
-class Read(Plugin):
+class Read(AttributePlugin):
     base_name = 'read'
+    version = 2
     expected_keys = ['start_time',
                      'duration',
+                     'end_time',
                      'id',
                      'number',
                      ]
+    attributes = [
+        ('read', 'start_time', 'start_time', int),
+        ('read', 'duration', 'duration', float),
+        ('read', 'read_id', 'read_id', b_to_str),
+        ('read', 'read_number', 'read_number', int),
+    ]
 
     def run_on_fast5(self, fast5):
-        items = [('start_time', int),
-                 ('duration', float),
-                 ('read_id', b_to_str),
-                 ('read_number', int),
-                ]
-
-        attrs = fast5.get_read_node().attrs
-        info = {key: converter(attrs[key]) for key, converter in items}
+        info = super().run_on_fast5(fast5)
         info["end_time"] = info["start_time"] + info["duration"]
 
         rename_key(info, "read_number", "number")
@@ -145,3 +170,15 @@ class Read(Plugin):
 
 
 DEFAULT_PLUGINS = [Channel, Tracking, Basecall, Read]
+
+
+def plugin_key(plugin):
+    """ The name under which a plugin's version is stored with metadata tables. """
+    if not isinstance(plugin, type):
+        plugin = type(plugin)
+    return plugin.__name__
+
+
+def plugin_versions(plugins):
+    """ Return a dictionary of plugin keys and versions for `plugins`. """
+    return {plugin_key(plugin): plugin.version for plugin in plugins}
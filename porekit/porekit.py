@@ -2,18 +2,33 @@
 import os
 import re
 import io
+import ast
+import json
+import operator
 import h5py
-import pandas as pd
 import numpy as np
-import Bio
 from itertools import chain
-from .utils import b_to_str, node_to_seq
+from .utils import b_to_str, node_to_seq, dataset_bytes, read_attributes
 from .plugins import DEFAULT_PLUGINS
+from .profiles import get_profile
 
 
-class Fast5File(h5py.File):
-    def __init__(self, filename, mode="r", **kwargs):
-        super().__init__(filename, mode, **kwargs)
+# Nodes whose attributes can be read in bulk with `Fast5Base.get_attributes`.
+# The "read" node is resolved per file, see `Fast5Base.get_read_node_path`.
+ATTRIBUTE_NODES = {
+    'tracking': 'UniqueGlobalKey/tracking_id',
+    'channel': 'UniqueGlobalKey/channel_id',
+}
+
+
+class Fast5Base(object):
+    """
+    Accessors shared by stand-alone Fast5 files and reads packed into
+    containers.
+
+    All paths are relative to the object itself, so the same methods work on
+    an `h5py.File` and on the `h5py.Group` of a read inside a container.
+    """
 
     def get_tracking_info(self):
         """
@@ -41,7 +56,7 @@ class Fast5File(h5py.File):
                  ('flow_cell_id', b_to_str),
                  ('device_id', b_to_str),
                 ]
-        attrs = self['/UniqueGlobalKey/tracking_id'].attrs
+        attrs = self.get_attributes('tracking', [key for key, converter in items])
         return {key: converter(attrs[key]) for key, converter in items}
 
     def get_channel_info(self):
@@ -62,7 +77,7 @@ class Fast5File(h5py.File):
                  ('offset', float),
                 ]
 
-        attrs = self['/UniqueGlobalKey/channel_id'].attrs
+        attrs = self.get_attributes('channel', [key for key, converter in items])
         info = {key: converter(attrs[key]) for key, converter in items}
         new_names = [('range','channel_range'),
                      ('sampling_rate', 'channel_sampling_rate'),
@@ -114,7 +129,7 @@ class Fast5File(h5py.File):
             ('read_id', b_to_str),
             ('read_number', int),
         ]
-        attrs = self.get_read_node().attrs
+        attrs = self.get_attributes('read', [key for key, converter in items])
         info = {key: converter(attrs[key]) for key, converter in items}
         new_names = [
             ('start_time', 'read_start_time'),
@@ -127,30 +142,81 @@ class Fast5File(h5py.File):
         return info
 
     def get_read_id(self):
-        rn = self.get_read_node()
-        return rn.attrs['read_id']
+        return self.get_attributes('read', ['read_id'])['read_id']
+
+    def get_read_node_path(self):
+        """
+        Path of the first read below `Analyses/EventDetection_000/Reads`.
+        Raises KeyError if there is no read.
+        """
+        reads_path = 'Analyses/EventDetection_000/Reads'
+        reads = h5py.h5g.open(self.id, reads_path.encode("ascii"))
+        if reads.get_num_objs() == 0:
+            raise KeyError("No read in %s" % reads_path)
+        return reads_path + '/' + reads.get_objname_by_idx(0).decode("utf-8")
+
+    def get_attributes(self, node, names):
+        """
+        Return a dictionary with the attributes `names` of `node`.
+
+        `node` is one of the keys of `ATTRIBUTE_NODES` or "read" for the read
+        node. Attributes are read with the low level reader
+        `porekit.utils.read_attributes` and cached on this object, so several
+        plugins asking for attributes of the same node cost a single pass.
+        Raises KeyError if the node or an attribute doesn't exist.
+        """
+        try:
+            cache = self._attribute_cache
+        except AttributeError:
+            cache = self._attribute_cache = {}
+        values = cache.setdefault(node, {})
+        missing = [name for name in names if name not in values]
+        if missing:
+            if node == 'read':
+                path = self.get_read_node_path()
+            else:
+                path = ATTRIBUTE_NODES[node]
+            values.update(read_attributes(self.id, path, missing))
+        return {name: values[name] for name in names}
+
+    def prefetch_attributes(self, requirements):
+        """
+        Read the attributes of several nodes at once. `requirements` maps
+        node names to lists of attribute names. Missing attributes are skipped
+        here and raise KeyError later when they are asked for.
+        """
+        for node, names in requirements.items():
+            try:
+                self.get_attributes(node, names)
+            except KeyError:
+                for name in names:
+                    try:
+                        self.get_attributes(node, [name])
+                    except KeyError:
+                        pass
 
     def path_to_seq(self, path):
+        from Bio import SeqIO
         node = self[path]
-        f = io.BytesIO(node.value.tobytes())
-        seqs = Bio.SeqIO.parse(f, "fastq-sanger")
+        f = io.BytesIO(dataset_bytes(node))
+        seqs = SeqIO.parse(f, "fastq-sanger")
         f.close()
         return list(seqs)[0]
 
     def get_fastq_from(self, path):
-        return self[path].value.tobytes().decode('ascii')
+        return dataset_bytes(self[path]).decode('ascii')
 
     def get_template_fastq(self):
         try:
-            return self.get_fastq_from('/Analyses/Basecall_2D_000/BaseCalled_template/Fastq')
+            return self.get_fastq_from('Analyses/Basecall_2D_000/BaseCalled_template/Fastq')
         except KeyError:
-            return self.get_fastq_from('/Analyses/Basecall_1D_000/BaseCalled_template/Fastq')
+            return self.get_fastq_from('Analyses/Basecall_1D_000/BaseCalled_template/Fastq')
 
     def get_2D_fastq(self):
-        return self.get_fastq_from('/Analyses/Basecall_2D_000/BaseCalled_2D/Fastq')
+        return self.get_fastq_from('Analyses/Basecall_2D_000/BaseCalled_2D/Fastq')
 
     def get_complement_fastq(self):
-        return self.get_fastq_from('/Analyses/Basecall_2D_000/BaseCalled_complement/Fastq')
+        return self.get_fastq_from('Analyses/Basecall_2D_000/BaseCalled_complement/Fastq')
 
     def get_fastq(self, which=["template", "complement", "2D"]):
         output = ""
@@ -173,33 +239,333 @@ class Fast5File(h5py.File):
         return output
 
     def get_read_node(self):
-        reads = self['Analyses/EventDetection_000/Reads']
-        for key in reads.keys():
-            read = reads[key]
-            break
-        return read
+        return self[self.get_read_node_path()]
+
+    def get_events(self, start=None, end=None):
+        """
+        Return the events of the read as a DataFrame.
 
-    def get_events(self):
+        With `start` and/or `end` (in seconds, relative to the first event)
+        only the events starting in `[start, end)` are read from the file.
+        The range is found by binary search on the sorted `start` column, so
+        only a few rows plus the selected hyperslab are read. The index of the
+        returned frame holds the event numbers within the whole read.
+        """
+        import pandas as pd
         read = self.get_read_node()
         if read is None:
             return None
-        return pd.DataFrame.from_records(read['Events'][:])
+        if start is None and end is None:
+            return pd.DataFrame.from_records(read['Events'][:])
+        start_index, end_index = self.find_event_range(start, end)
+        return self.get_events_by_index(start_index, end_index)
+
+    def get_events_by_index(self, start_index=None, end_index=None):
+        """
+        Return the events `start_index` up to (excluding) `end_index` as a
+        DataFrame indexed by event number. Negative indices count from the
+        end, like slices.
+        """
+        import pandas as pd
+        events = self.get_read_node()['Events']
+        start_index, end_index, step = slice(start_index, end_index).indices(len(events))
+        end_index = max(start_index, end_index)
+        frame = pd.DataFrame.from_records(events[start_index:end_index],
+                                          columns=events.dtype.names)
+        frame.index = pd.RangeIndex(start_index, end_index)
+        return frame
+
+    def get_event_time_scale(self):
+        """
+        Units of the event `start` and `length` columns per second: the
+        sampling rate if they count samples, 1.0 if they are in seconds.
+        """
+        events = self.get_read_node()['Events']
+        if events.dtype['start'].kind in 'iu':
+            return float(self.get_attributes('channel', ['sampling_rate'])['sampling_rate'])
+        return 1.0
+
+    def find_event_range(self, start=None, end=None):
+        """
+        Return `(start_index, end_index)` of the events starting in
+        `[start, end)` seconds after the first event of the read.
+        """
+        events = self.get_read_node()['Events']
+        n = len(events)
+        if n == 0:
+            return 0, 0
+        origin = events[0]['start']
+        scale = self.get_event_time_scale()
+        start_index = 0
+        end_index = n
+        if start is not None:
+            start_index = _bisect_events(events, origin + start * scale)
+        if end is not None:
+            end_index = _bisect_events(events, origin + end * scale, lo=start_index)
+        return start_index, end_index
+
+    def get_raw_node(self):
+        """ The first read below `Raw/Reads`, holding the `Signal` dataset. """
+        reads = self['Raw/Reads']
+        for key in reads.keys():
+            return reads[key]
+        raise KeyError("No raw reads in %s" % self.filename)
+
+    def get_raw_scaling(self):
+        """
+        Return `(scale, offset)` to convert raw signal to picoampere with
+        `(raw + offset) * scale`.
+        """
+        info = self.get_attributes('channel', ['range', 'digitisation', 'offset'])
+        return float(info['range']) / float(info['digitisation']), float(info['offset'])
+
+    def get_raw_signal(self, start=None, end=None, scaled=True):
+        """
+        Return the raw signal samples `start` to `end` (excluding), in
+        picoampere unless `scaled` is False.
+        """
+        signal = self.get_raw_node()['Signal'][start:end]
+        if not scaled:
+            return signal
+        scale, offset = self.get_raw_scaling()
+        return (signal + offset) * scale
+
+    def get_model_node(self, strand="template"):
+        try:
+            return self['Analyses/Basecall_2D_000/BaseCalled_%s/Model' % strand]
+        except KeyError:
+            return self['Analyses/Basecall_1D_000/BaseCalled_%s/Model' % strand]
+
+    def get_kmer_model(self, strand="template", registry=None):
+        """
+        Return the shared `porekit.models.KmerModel` for this read.
+
+        Models are deduplicated across all files in the process, see
+        `porekit.models.ModelRegistry`.
+        """
+        if registry is None:
+            from .models import registry
+        return registry.from_dataset(self.get_model_node(strand))
+
+    def get_model(self, strand="template"):
+        """
+        Return the k-mer model as a `pandas.DataFrame` indexed by k-mer.
+
+        The frame is a copy of the one cached in the model registry, so it can
+        be modified freely.
+        """
+        return self.get_kmer_model(strand).frame.copy()
+
+
+def _bisect_events(events, value, lo=0, hi=None):
+    """ Index of the first event with a start >= `value`, reading single rows. """
+    if hi is None:
+        hi = len(events)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if events[mid]['start'] < value:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _open_kwargs(mode, profile, kwargs):
+    """ Keyword arguments of `profile` for `h5py.File`, explicit `kwargs` win. """
+    options = get_profile(profile).kwargs(mode)
+    options.update(kwargs)
+    return options
+
+
+class Fast5File(Fast5Base, h5py.File):
+    """
+    A single read Fast5 file. `profile` selects the HDF5 open settings, see
+    `porekit.profiles`.
+    """
+    def __init__(self, filename, mode="r", profile=None, **kwargs):
+        super().__init__(filename, mode, **_open_kwargs(mode, profile, kwargs))
+
+
+CONTAINER_EXTENSION = ".fast5pack"
+CONTAINER_SEPARATOR = "::"
+
+
+class PackedFast5Read(Fast5Base, h5py.Group):
+    """
+    A single read inside a Fast5 container written by `porekit repack`.
+
+    Offers the same accessors as `Fast5File`. If the read was opened through
+    `open_fast5`, closing it also closes the container, otherwise the
+    container stays open and `close` does nothing.
+    """
+    def __init__(self, group, original_filename=None, container=None):
+        super().__init__(group.id)
+        self.original_filename = original_filename
+        self.container = container
+
+    @property
+    def filename(self):
+        return self.file.filename + CONTAINER_SEPARATOR + self.name.lstrip("/")
+
+    def close(self):
+        if self.container is not None:
+            self.container.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class StalePackedReadError(OSError):
+    """ The source file of a packed read changed after it was packed. """
+
+
+class Fast5Container(h5py.File):
+    """
+    A container holding many reads, as written by `porekit repack`.
+
+    Each read is stored as a group below `Reads` which mirrors the layout of
+    the original Fast5 file. The `Index` dataset lists the group name,
+    original file name and read id of every read in the container, and the
+    path, size and modification time of the file it was packed from.
+
+    With `check_stale`, reads whose source file changed since packing are
+    refused by `get_read` and left out by iteration. The sources are checked
+    once per container, on first use. Without it, which is the default, the
+    source files are never touched.
+    """
+    def __init__(self, filename, mode="r", profile=None, check_stale=False, **kwargs):
+        super().__init__(filename, mode, **_open_kwargs(mode, profile, kwargs))
+        self.check_stale = check_stale
+        self._entries = None
+        self._stale = None
+
+    @property
+    def index(self):
+        return self["Index"][:]
+
+    def __len__(self):
+        return len(self["Index"])
+
+    def references(self):
+        """ Yield a reference string for every read in the container. """
+        for entry in self.index:
+            yield self.filename + CONTAINER_SEPARATOR + "Reads/" + b_to_str(entry["group"])
+
+    def _index_entries(self):
+        if self._entries is None:
+            self._entries = {b_to_str(entry["group"]): entry for entry in self.index}
+        return self._entries
 
-    def get_model(self):
-        model_frame = pd.DataFrame(self["Analyses/Basecall_2D_000/BaseCalled_template/Model"][:])
-        model_frame.index = model_frame.kmer
-        return model_frame
+    def get_entry(self, group_name):
+        """ The `Index` entry of a read, None for reads not in the index. """
+        return self._index_entries().get(group_name.split("/")[-1])
+
+    def is_stale(self, group_name):
+        """
+        True if the file a read was packed from still exists but its size or
+        modification time changed since. Reads whose source is gone, and
+        reads of containers without source information, are never stale.
+        Costs one `os.stat` of the source file.
+        """
+        entry = self.get_entry(group_name)
+        if entry is None or "source" not in entry.dtype.names:
+            return False
+        try:
+            stat = os.stat(entry["source"].decode("utf-8"))
+        except OSError:
+            return False
+        return (stat.st_size != entry["source_size"]
+                or stat.st_mtime_ns != entry["source_mtime_ns"])
+
+    def _stale_error(self, group_name):
+        return StalePackedReadError("%s was modified after it was packed into %s"
+                                    % (b_to_str(self.get_entry(group_name)["source"]),
+                                       self.filename))
+
+    def stale_reads(self):
+        """ The set of group names of stale reads, checked once and cached. """
+        if self._stale is None:
+            self._stale = {group_name for group_name in self._index_entries()
+                           if self.is_stale(group_name)}
+        return self._stale
+
+    def get_read(self, group_name, original_filename=None):
+        """
+        Return a packed read. With `check_stale`, raises
+        `StalePackedReadError` if its source file changed since it was packed.
+        """
+        group_name = group_name.split("/")[-1]
+        if self.check_stale and group_name in self.stale_reads():
+            raise self._stale_error(group_name)
+        if original_filename is None:
+            entry = self.get_entry(group_name)
+            if entry is not None:
+                original_filename = b_to_str(entry["filename"])
+        return PackedFast5Read(self["Reads"][group_name], original_filename)
+
+    def __iter__(self):
+        """ Yield the packed reads, with `check_stale` leaving out stale ones. """
+        for entry in self.index:
+            try:
+                yield self.get_read(b_to_str(entry["group"]), b_to_str(entry["filename"]))
+            except StalePackedReadError:
+                continue
+
+
+def split_reference(reference):
+    """
+    Split a reference to a packed read into container file name and group
+    path. Returns `(reference, None)` for ordinary file names.
+    """
+    if CONTAINER_SEPARATOR in reference:
+        container, group = reference.split(CONTAINER_SEPARATOR, 1)
+        return container, group
+    return reference, None
 
 
-def open_fast5_files(path, mode="r"):
+def open_fast5(reference, mode="r", profile=None, check_stale=False, **kwargs):
+    """
+    Open a Fast5 file or a read inside a container.
+
+    `reference` is either an ordinary file name or a reference to a packed
+    read like `"run_0000.fast5pack::Reads/Read_00000012"`, as found in the
+    `absolute_filename` column of collected metadata. `profile` selects the
+    HDF5 open settings, see `porekit.profiles`. With `check_stale`, packed
+    reads whose source file changed since packing raise
+    `StalePackedReadError`; only the source of the opened read is checked.
+    """
+    file_name, group = split_reference(reference)
+    if group is None:
+        return Fast5File(file_name, mode=mode, profile=profile, **kwargs)
+    container = Fast5Container(file_name, mode=mode, profile=profile, **kwargs)
+    try:
+        if check_stale and container.is_stale(group):
+            raise container._stale_error(group)
+        read = container.get_read(group)
+    except:
+        container.close()
+        raise
+    read.container = container
+    return read
+
+
+def open_fast5_files(path, mode="r", profile=None, check_stale=False):
     """
     Recursively searches for files with ending '.fast5' and yields
     opened Fast5File objects. It omits those files which don't open correctly
     or don't pass a couple of simple and fast sanity checks.
+
+    Reads inside containers written by `porekit repack` are yielded as
+    `PackedFast5Read` objects, which offer the same interface. With
+    `check_stale`, packed reads whose source file changed since packing are
+    omitted.
     """
     for filename in find_fast5_files(path):
         try:
-            hdf = Fast5File(filename, mode=mode)
+            hdf = Fast5File(filename, mode=mode, profile=profile)
             if sanity_check(hdf):
                 yield hdf
         except OSError:
@@ -207,6 +573,18 @@ def open_fast5_files(path, mode="r"):
                 hdf.close()
             except:
                 pass
+    for filename in find_fast5_containers(path):
+        try:
+            container = Fast5Container(filename, mode=mode, profile=profile,
+                                       check_stale=check_stale)
+        except OSError:
+            continue
+        try:
+            for read in container:
+                if sanity_check(read):
+                    yield read
+        finally:
+            container.close()
 
 
 def find_fast5_files(path):
@@ -221,6 +599,36 @@ def find_fast5_files(path):
                 yield os.path.join(dirpath, fname)
 
 
+def find_fast5_containers(path):
+    """
+        Recursively searches containers written by `porekit repack`.
+    """
+    for dirpath, dirnames, filenames in os.walk(path):
+        for fname in filenames:
+            if fname.endswith(CONTAINER_EXTENSION):
+                yield os.path.join(dirpath, fname)
+
+
+def find_fast5_references(path, profile=None):
+    """
+        Yields the names of all Fast5 files under `path`, followed by
+        references to all reads inside containers.
+        Only the containers are opened to read their index.
+    """
+    for file_name in find_fast5_files(path):
+        yield file_name
+    for container_name in find_fast5_containers(path):
+        try:
+            container = Fast5Container(container_name, profile=profile)
+        except OSError:
+            continue
+        try:
+            for reference in container.references():
+                yield reference
+        finally:
+            container.close()
+
+
 def sanity_check(hdf):
     """ Minimalistic sanity check for Fast5 files."""
     required_paths = ['Analyses', 'UniqueGlobalKey', 'Analyses/EventDetection_000']
@@ -233,77 +641,452 @@ def sanity_check(hdf):
         return False
 
 
-def get_fast5_file_metadata(file_name, plugins=None, raise_errors=False):
+_COMPARISONS = {
+    ast.Eq: operator.eq, ast.NotEq: operator.ne,
+    ast.Lt: operator.lt, ast.LtE: operator.le,
+    ast.Gt: operator.gt, ast.GtE: operator.ge,
+    ast.Is: operator.is_, ast.IsNot: operator.is_not,
+    ast.In: lambda a, b: a in b, ast.NotIn: lambda a, b: a not in b,
+}
+
+_UNARY_OPERATORS = {ast.Not: operator.not_, ast.USub: operator.neg, ast.UAdd: operator.pos}
+
+
+def _check_where_node(node, expression):
+    """ Reject every syntax but comparisons, boolean operators, names and constants. """
+    if isinstance(node, ast.Expression):
+        _check_where_node(node.body, expression)
+    elif isinstance(node, ast.BoolOp):
+        for value in node.values:
+            _check_where_node(value, expression)
+    elif isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+        _check_where_node(node.operand, expression)
+    elif isinstance(node, ast.Compare) and all(type(op) in _COMPARISONS for op in node.ops):
+        for operand in [node.left] + node.comparators:
+            _check_where_node(operand, expression)
+    elif isinstance(node, (ast.Tuple, ast.List, ast.Set)):
+        for element in node.elts:
+            _check_where_node(element, expression)
+    elif not isinstance(node, (ast.Name, ast.Constant)):
+        raise ValueError("%s is not allowed in `where` expressions: %r"
+                         % (type(node).__name__, expression))
+
+
+def _evaluate_where_node(node, record):
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.Name):
+        return record[node.id]
+    if isinstance(node, ast.BoolOp):
+        stop = isinstance(node.op, ast.Or)
+        for value in node.values:
+            result = _evaluate_where_node(value, record)
+            if bool(result) == stop:
+                return result
+        return result
+    if isinstance(node, ast.UnaryOp):
+        return _UNARY_OPERATORS[type(node.op)](_evaluate_where_node(node.operand, record))
+    if isinstance(node, ast.Compare):
+        left = _evaluate_where_node(node.left, record)
+        for op, comparator in zip(node.ops, node.comparators):
+            right = _evaluate_where_node(comparator, record)
+            if not _COMPARISONS[type(op)](left, right):
+                return False
+            left = right
+        return True
+    if isinstance(node, ast.Set):
+        return {_evaluate_where_node(element, record) for element in node.elts}
+    return [_evaluate_where_node(element, record) for element in node.elts]
+
+
+class WherePredicate(object):
+    """
+    A `where` expression like `"channel_number < 100 and read_number > 5"`,
+    evaluated with the columns of a metadata record as variables.
+
+    The expression is parsed once per process and evaluated by walking its
+    syntax tree, never by `eval`. Only comparisons, `and`, `or`, `not`,
+    signs, column names, constants and tuples or lists of them for `in` are
+    allowed; anything else raises a ValueError.
+    """
+    def __init__(self, expression):
+        self.expression = expression
+        try:
+            self._tree = ast.parse(expression, "<where>", "eval")
+        except SyntaxError as e:
+            raise ValueError("Invalid `where` expression %r: %s" % (expression, e.msg))
+        _check_where_node(self._tree, expression)
+
+    def __call__(self, record):
+        return bool(_evaluate_where_node(self._tree.body, record))
+
+    def __getstate__(self):
+        return {"expression": self.expression}
+
+    def __setstate__(self, state):
+        self.__init__(state["expression"])
+
+    def __repr__(self):
+        return "WherePredicate(%r)" % self.expression
+
+
+def where_predicate(where):
+    """
+    Turn `where` into a predicate on metadata records: callables are used as
+    they are, strings become a `WherePredicate`, None accepts everything.
+    """
+    if where is None or callable(where):
+        return where
+    if isinstance(where, str):
+        return WherePredicate(where)
+    raise TypeError("`where` must be a callable or an expression string")
+
+
+def _missing_name(error):
+    if isinstance(error, KeyError):
+        return error.args[0] if error.args else None
+    name = getattr(error, "name", None)
+    if name is None:
+        match = re.search(r"name '(\w+)' is not defined", str(error))
+        name = match.group(1) if match else None
+    return name
+
+
+class WhereError(ValueError):
+    """ A `where` condition refers to a column the attribute plugins don't produce. """
+
+
+def _check_where(where, record, columns):
+    """
+    Evaluate `where` on a record of the cheap phase. Returns None if it
+    can't be decided because a column the attribute plugins should have
+    produced is missing, e.g. as a plugin failed. A column they can't
+    produce is an error.
+    """
+    try:
+        return bool(where(record))
+    except (NameError, KeyError) as e:
+        name = _missing_name(e)
+        if name in columns:
+            return None
+        raise WhereError("`where` refers to %r, but only the columns of attribute plugins "
+                         "are available: %s" % (name, ", ".join(columns)))
+
+
+# Column of metadata records holding the errors of a file as a JSON list
+ERRORS_COLUMN = 'errors'
+
+
+def error_record(stage, error):
+    """
+    A structured description of an error: `stage` is the plugin's base name
+    or one of "open", "file", "where", "timeout" and "crash".
+    """
+    return {"stage": stage, "type": type(error).__name__, "message": str(error)}
+
+
+def _add_error(record, stage, error):
+    errors = json.loads(record.get(ERRORS_COLUMN) or "[]")
+    errors.append(error_record(stage, error))
+    record[ERRORS_COLUMN] = json.dumps(errors)
+
+
+def failed_file_record(file_name, stage, error):
+    """ The metadata record of a file which couldn't be read at all. """
     record = {
         "absolute_filename": file_name,
         "filename": os.path.split(file_name)[-1]
     }
-    try:
-        fast5 = Fast5File(file_name)
-    except OSError:
-        return record
+    _add_error(record, stage, error)
+    return record
 
-    if plugins is None:
-        plugins = [plugin_class() for plugin_class in DEFAULT_PLUGINS]
 
+def record_errors(record):
+    """ The list of error records of a metadata record or row. """
+    errors = record.get(ERRORS_COLUMN)
+    if not isinstance(errors, str):
+        return []
+    return json.loads(errors)
+
+
+def metadata_errors(df):
+    """
+    Return a DataFrame with one row per error in the `errors` column of
+    collected metadata: the file, the stage the error happened in, the
+    exception type and its message.
+    """
+    import pandas as pd
+    rows = []
+    if ERRORS_COLUMN in df.columns:
+        for file_name, errors in zip(df['absolute_filename'], df[ERRORS_COLUMN]):
+            if isinstance(errors, str):
+                for error in json.loads(errors):
+                    rows.append(dict(error, absolute_filename=file_name))
+    return pd.DataFrame(rows, columns=['absolute_filename', 'stage', 'type', 'message'])
+
+
+def get_fast5_file_metadata(file_name, plugins=None, raise_errors=False, profile=None, where=None):
+    """
+    Open a file or packed read and return its metadata record. Files which
+    can't be opened get a record with only the file name and the error, as
+    do files failing in any other way while being read unless `raise_errors`
+    is set.
+    """
     try:
-        for plugin in plugins:
-            result = []
-            try:
-                result = plugin.run_on_fast5(fast5)
-            except:
-                if raise_errors:
-                    raise
-            else:
-                for k in result.keys():
-                    record[plugin.base_name + '_' + k] = result[k]
+        fast5 = open_fast5(file_name, profile=profile)
+    except Exception as e:
+        return failed_file_record(file_name, "open", e)
+    try:
+        return get_fast5_metadata(fast5, file_name, plugins, raise_errors=raise_errors, where=where)
+    except WhereError:
+        raise
+    except Exception as e:
+        # Errors outside of plugins, e.g. truncated files failing in h5py
+        if raise_errors:
+            raise
+        return failed_file_record(file_name, "file", e)
     finally:
         fast5.close()
+
+
+def _run_plugins(fast5, plugins, record, raise_errors):
+    for plugin in plugins:
+        result = []
+        try:
+            result = plugin.run_on_fast5(fast5)
+        except Exception as e:
+            if raise_errors:
+                raise
+            _add_error(record, plugin.base_name, e)
+        else:
+            for k in result.keys():
+                record[plugin.base_name + '_' + k] = result[k]
     for k, v in record.items():
         if isinstance(v, (bytes, bytearray)):
             record[k] = v.decode("utf-8")
     try:
         if "channel_number" in record:
             record["channel_number"] = int(record["channel_number"])
-    except:
+    except (TypeError, ValueError):
         record["channel_number"] = 0
+
+
+def get_fast5_metadata(fast5, file_name, plugins=None, raise_errors=False, where=None):
+    """
+    Run the plugins on an already opened Fast5 file or packed read and
+    return the metadata record.
+
+    Attribute-only plugins run first. If `where` is given (see
+    `where_predicate`), it is evaluated on the columns they produced, and
+    the remaining, more expensive plugins only run if it passes. Returns
+    None for rejected files. If `where` can't be decided as a column is
+    missing, the record is returned with a "where" error and without the
+    expensive plugins, so failing files don't silently disappear.
+    """
+    original_filename = getattr(fast5, "original_filename", None)
+    record = {
+        "absolute_filename": file_name,
+        "filename": original_filename or os.path.split(file_name)[-1]
+    }
+    if plugins is None:
+        plugins = [plugin_class() for plugin_class in DEFAULT_PLUGINS]
+    cheap = [plugin for plugin in plugins if hasattr(plugin, "required_attributes")]
+    expensive = [plugin for plugin in plugins if not hasattr(plugin, "required_attributes")]
+
+    # Read the attributes of all attribute-only plugins in one pass per node
+    requirements = {}
+    for plugin in cheap:
+        for node, names in plugin.required_attributes().items():
+            requirements.setdefault(node, []).extend(names)
+    if requirements:
+        # Only an optimisation: if it fails, the plugins run into the same
+        # error and record it for themselves
+        try:
+            fast5.prefetch_attributes(requirements)
+        except Exception:
+            if raise_errors:
+                raise
+
+    _run_plugins(fast5, cheap, record, raise_errors)
+    if where is not None:
+        where = where_predicate(where)
+        columns = ['filename', 'absolute_filename'] + metadata_columns(cheap)
+        selected = _check_where(where, record, columns)
+        if selected is None:
+            missing = [column for column in columns if column not in record]
+            _add_error(record, "where", KeyError("`where` can't be evaluated without %s"
+                                                 % ", ".join(missing)))
+            return record
+        if not selected:
+            return None
+    _run_plugins(fast5, expensive, record, raise_errors)
     return record
 
 
-def gather_metadata_records(path, plugins=None, workers=1, raise_errors=False, progress_callback=None):
-    # `workers` feature is more or less broken right now,
-    # because it has to recreate all Plugins whenever it is called
-    file_names = list(find_fast5_files(path))
-    files_read = 0
-    files_total = len(file_names)
-    if workers == 1:
-        for file_name in file_names:
-            if progress_callback:
-                progress_callback(files_read, files_total)
-            record = get_fast5_file_metadata(file_name, plugins, raise_errors=raise_errors)
-            files_read += 1
+def iter_fast5_metadata(references, plugins=None, raise_errors=False, profile=None, where=None):
+    """
+    Yield metadata records for a sequence of file names and packed read
+    references. Consecutive reads from the same container share one open
+    container instead of opening it once per read. Files rejected by
+    `where` are left out.
+    """
+    for record in _iter_fast5_metadata(references, plugins, raise_errors, profile, where):
+        if record is not None:
             yield record
-    elif workers > 1:
+
+
+def _iter_fast5_metadata(references, plugins=None, raise_errors=False, profile=None, where=None):
+    # Yields None for files rejected by `where`, so callers can count files
+    where = where_predicate(where)
+    container = None
+    try:
+        for reference in references:
+            container_name, group = split_reference(reference)
+            if group is None:
+                yield get_fast5_file_metadata(reference, plugins, raise_errors=raise_errors,
+                                              profile=profile, where=where)
+                continue
+            if container is None or container.filename != container_name:
+                if container is not None:
+                    container.close()
+                    container = None
+                try:
+                    container = Fast5Container(container_name, profile=profile)
+                except OSError:
+                    yield get_fast5_file_metadata(reference, plugins, raise_errors=raise_errors,
+                                                  profile=profile, where=where)
+                    continue
+            try:
+                read = container.get_read(group)
+                record = get_fast5_metadata(read, reference, plugins, raise_errors=raise_errors,
+                                            where=where)
+            except WhereError:
+                raise
+            except Exception as e:
+                if raise_errors:
+                    raise
+                record = failed_file_record(reference, "file", e)
+            yield record
+    finally:
+        if container is not None:
+            container.close()
+
+
+def _metadata_chunk(task):
+    references, plugin_classes, raise_errors, profile, where = task
+    plugins = None
+    if plugin_classes is not None:
+        plugins = [plugin_class() for plugin_class in plugin_classes]
+    return list(_iter_fast5_metadata(references, plugins, raise_errors=raise_errors,
+                                     profile=profile, where=where))
+
+
+def collect_metadata_records(file_names, plugins=None, workers=1, raise_errors=False, progress_callback=None,
+                             profile=None, where=None, timeout=None, quarantine=None):
+    """
+    Yield metadata records for a list of file names and packed read
+    references, using `workers` processes.
+
+    Worker processes create their own plugin instances from the classes of
+    `plugins`, and open files with the same `profile` as this process.
+    With `where`, only records of files passing it are yielded, see
+    `get_fast5_metadata`. A callable `where` must be picklable to be used
+    with several workers.
+
+    With a `timeout` in seconds, files are read by supervised worker
+    processes (see `porekit.isolation`): a file taking longer gets a record
+    with a "timeout" error and its worker is replaced. Records then come in
+    the order they are finished. `quarantine` is a `Quarantine` or the file
+    name of one: quarantined files are skipped, and files which fail to
+    open, time out or crash a worker are added to it.
+    """
+    from .isolation import as_quarantine, supervised_metadata_records
+    files_read = 0
+    profile = get_profile(profile)
+    where = where_predicate(where)
+    quarantine = as_quarantine(quarantine)
+    if quarantine is not None:
+        file_names, skipped = quarantine.split(file_names)
+        files_read = len(skipped)
+    files_total = files_read + len(file_names)
+    if workers < 1:
+        raise ValueError("`workers` parameter needs a positive integer")
+    if timeout is not None:
+        records = (record for reference, record in supervised_metadata_records(
+            file_names, plugins, workers=workers, timeout=timeout, raise_errors=raise_errors,
+            profile=profile, where=where))
+        pool = None
+    elif workers == 1:
+        records = _iter_fast5_metadata(file_names, plugins, raise_errors=raise_errors,
+                                       profile=profile, where=where)
+        pool = None
+    else:
         import multiprocessing
+        plugin_classes = None
+        if plugins is not None:
+            plugin_classes = [type(plugin) for plugin in plugins]
+        chunk_size = max(1, min(1000, files_total // (workers * 4)))
+        chunks = [(file_names[i:i + chunk_size], plugin_classes, raise_errors, profile, where)
+                  for i in range(0, len(file_names), chunk_size)]
         pool = multiprocessing.Pool(workers)
-        for record in pool.map(get_fast5_file_metadata, file_names):
+        records = chain.from_iterable(pool.imap(_metadata_chunk, chunks))
+    try:
+        for record in records:
             if progress_callback:
                 progress_callback(files_read, files_total)
-            yield record
             files_read += 1
-    else:
-        raise ValueError("`workers` parameter needs a positive integer")
+            if record is None:
+                continue
+            if quarantine is not None:
+                quarantine.update(record)
+            yield record
+    finally:
+        if pool is not None:
+            pool.close()
+        if quarantine is not None:
+            quarantine.save()
+
+
+def gather_metadata_records(path, plugins=None, workers=1, raise_errors=False, progress_callback=None,
+                            profile=None, where=None, timeout=None, quarantine=None):
+    file_names = list(find_fast5_references(path, profile=profile))
+    return collect_metadata_records(file_names, plugins=plugins, workers=workers,
+                                    raise_errors=raise_errors,
+                                    progress_callback=progress_callback,
+                                    profile=profile, where=where, timeout=timeout,
+                                    quarantine=quarantine)
+
+
+def metadata_columns(plugins):
+    """ Return the DataFrame columns produced by `plugins`. """
+    columns = []
+    for plugin in plugins:
+        columns += [(plugin.base_name + '_' + k) for k in plugin.expected_keys]
+    return columns
 
 
-def gather_metadata(path, workers=1, plugins=None, raise_errors=False, progress_callback=None):
+def gather_metadata(path, workers=1, plugins=None, raise_errors=False, progress_callback=None,
+                    profile=None, where=None, timeout=None, quarantine=None):
     """
     Collects metadata from Fast5 files under the given paths.
 
     Returns a DataFrame with Metadata on each read.
 
     The columns represent a somewhat arbitrary selection of data.
+
+    `where` restricts the table to reads matching a condition on the
+    columns of the attribute plugins, e.g. `"channel_number <= 128"` or a
+    function taking the record dictionary. Expensive plugins like `Basecall`
+    only run on the files that match.
+
+    Errors of files and plugins are listed in the `errors` column, see
+    `metadata_errors`. `timeout` and `quarantine` isolate files which fail
+    or hang, see `collect_metadata_records`.
     """
-    records = gather_metadata_records(path, plugins=plugins, workers=workers, raise_errors=raise_errors, progress_callback=progress_callback)
+    import pandas as pd
+    records = gather_metadata_records(path, plugins=plugins, workers=workers, raise_errors=raise_errors,
+                                      progress_callback=progress_callback, profile=profile,
+                                      where=where, timeout=timeout, quarantine=quarantine)
     records = list(records)
     print(len(records))
     columns = [
@@ -312,35 +1095,114 @@ def gather_metadata(path, workers=1, plugins=None, raise_errors=False, progress_
     ]
     if plugins is None:
         plugins = [plugin_class() for plugin_class in DEFAULT_PLUGINS]
-    for plugin in plugins:
-        columns += [(plugin.base_name + '_' + k) for k in plugin.expected_keys]
+    columns += metadata_columns(plugins) + [ERRORS_COLUMN]
 
     df = pd.DataFrame.from_records(records, columns=columns)
     return df
 
 
-def make_squiggle(sequence, model, std_multiplier=1.0):
+def _refresh_errors(old, new, stages):
+    """
+    The `errors` value of a re-collected file: old errors of `stages` are
+    replaced by the `new` ones, errors of other stages are kept.
+    """
+    errors = [error for error in record_errors({ERRORS_COLUMN: old}) if error["stage"] not in stages]
+    errors += record_errors({ERRORS_COLUMN: new})
+    return json.dumps(errors) if errors else None
+
+
+def update_metadata(df, versions, path=None, workers=1, plugins=None, raise_errors=False, progress_callback=None,
+                    profile=None, timeout=None, quarantine=None):
+    """
+    Bring a metadata DataFrame up to date with the current plugins.
+
+    `versions` maps plugin keys (see `porekit.plugins.plugin_key`) to the
+    plugin versions `df` was collected with. Only plugins which are missing
+    from `versions` or whose version changed are run, on the files listed in
+    `df.absolute_filename`, and their columns are replaced. If `path` is
+    given, files under `path` which are not yet in `df` are collected with
+    all plugins and appended. `timeout` and `quarantine` are passed to
+    `collect_metadata_records`.
+
+    In the `errors` column of re-collected files, errors of the stale
+    plugins and file level errors are replaced by the ones of the new run.
+
+    Returns the updated DataFrame and the new versions dictionary.
+    """
+    import pandas as pd
+    from .plugins import plugin_key, plugin_versions
+    from .isolation import QUARANTINE_STAGES
+    if plugins is None:
+        plugins = [plugin_class() for plugin_class in DEFAULT_PLUGINS]
+    stale = [plugin for plugin in plugins
+             if versions.get(plugin_key(plugin)) != plugin.version]
+
+    df = df.copy()
+    if stale:
+        stale_columns = metadata_columns(stale)
+        df = df.drop(columns=[c for c in stale_columns if c in df.columns])
+        file_names = list(df.absolute_filename)
+        records = list(collect_metadata_records(file_names, plugins=stale, workers=workers,
+                                                raise_errors=raise_errors,
+                                                progress_callback=progress_callback,
+                                                profile=profile, timeout=timeout,
+                                                quarantine=quarantine))
+        update = pd.DataFrame.from_records(records, columns=['absolute_filename'] + stale_columns
+                                           + [ERRORS_COLUMN])
+        update = update.drop_duplicates('absolute_filename')
+        new_errors = dict(zip(update.absolute_filename, update[ERRORS_COLUMN]))
+        old_errors = df[ERRORS_COLUMN] if ERRORS_COLUMN in df.columns else [None] * len(df)
+        stages = {plugin.base_name for plugin in stale} | set(QUARANTINE_STAGES)
+        df[ERRORS_COLUMN] = [_refresh_errors(old, new_errors[file_name], stages)
+                             if file_name in new_errors else old
+                             for file_name, old in zip(df.absolute_filename, old_errors)]
+        update = update.drop(columns=[ERRORS_COLUMN])
+        df = df.merge(update, on='absolute_filename', how='left')
+
+    if path is not None:
+        known = set(df.absolute_filename)
+        new_files = [f for f in find_fast5_references(path, profile=profile) if f not in known]
+        if new_files:
+            records = list(collect_metadata_records(new_files, plugins=plugins, workers=workers,
+                                                    raise_errors=raise_errors, profile=profile,
+                                                    timeout=timeout, quarantine=quarantine))
+            columns = ['filename', 'absolute_filename'] + metadata_columns(plugins) + [ERRORS_COLUMN]
+            new = pd.DataFrame.from_records(records, columns=columns)
+            df = pd.concat([df, new], ignore_index=True, sort=False)
+
+    canonical = ['filename', 'absolute_filename'] + metadata_columns(plugins)
+    ordered = [c for c in canonical if c in df.columns]
+    df = df[ordered + [c for c in df.columns if c not in ordered]]
+
+    new_versions = dict(versions)
+    new_versions.update(plugin_versions(plugins))
+    return df, new_versions
+
+
+def make_squiggle(sequence, model, std_multiplier=1.0, rng=None):
     """
     Turn a SciKit Bio Sequence object into a squiggle.
 
-    `sequence` must be a SciKit Bio Sequence, `model` is a `pandas.DataFrame`
-    like returned from `Fast5File.get_model()` and `std_multiplier` is a float
+    `sequence` must be a SciKit Bio Sequence (or a str/bytes), `model` is a
+    `pandas.DataFrame` like returned from `Fast5File.get_model()` or a
+    `porekit.models.KmerModel`, and `std_multiplier` is a float
     to multiply the level_stdv by. Setting `std_multiplier` above 1 means the
-    squiggles are noisier than expected by the model.
+    squiggles are noisier than expected by the model. `rng` is a
+    `numpy.random.Generator` for reproducible squiggles, by default the
+    global NumPy random state is used.
     """
-    # Find k for kmers from model
-    k = len(model.index.values[0])
+    from .models import as_kmer_model
+    model = as_kmer_model(model)
 
     # number of events
-    n = len(sequence) - k
-
-    # prepare means
-    means = np.zeros(n, dtype="float64")
-    stdvs = np.zeros(n, dtype="float64")
+    n = len(sequence) - model.k
 
-    for i in range(n):
-        kmer = sequence[i:i + k].values.tostring()
-        means[i] = model.ix[kmer]["level_mean"]
-        stdvs[i] = model.ix[kmer]["level_stdv"]
-    x = np.random.normal(means, stdvs * std_multiplier)
+    rows = model.kmer_rows(sequence)[:max(n, 0)]
+    if np.any(rows < 0):
+        raise KeyError("Sequence contains k-mers which are not in the model")
+    means = model.level_mean[rows]
+    stdvs = model.level_stdv[rows]
+    if rng is None:
+        rng = np.random
+    x = rng.normal(means, stdvs * std_multiplier)
     return x
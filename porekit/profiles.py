@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Open profiles: the HDF5 settings used to open Fast5 files and containers.
+
+Which driver, raw data chunk cache and file locking work best depends on the
+file system and on the access pattern. Fast5 files are small and read
+almost completely, so reading the whole file with the `core` driver often
+beats many small reads, especially on network file systems. Containers hold
+large compressed datasets and profit from a larger chunk cache. File
+locking costs a round trip on some network file systems and isn't needed
+for reading.
+
+An `OpenProfile` bundles these settings. Everything in porekit which opens
+files accepts a `profile` argument, which can be an `OpenProfile`, the name
+of one of the `PROFILES` or None for the process wide default set with
+`set_default_profile`. `porekit bench-open` measures which profile is
+fastest for a given set of files.
+"""
+import time
+
+
+class OpenProfile(object):
+    """
+    Settings for opening HDF5 files.
+
+    `driver` is an HDF5 driver name like "sec2" or "core", None for the
+    default. `rdcc_nbytes`, `rdcc_nslots` and `rdcc_w0` configure the raw
+    data chunk cache, None keeps the HDF5 default. `locking` turns file
+    locking on or off, None keeps the default.
+    """
+    def __init__(self, name="custom", driver=None, rdcc_nbytes=None, rdcc_nslots=None,
+                 rdcc_w0=None, locking=None):
+        self.name = name
+        self.driver = driver
+        self.rdcc_nbytes = rdcc_nbytes
+        self.rdcc_nslots = rdcc_nslots
+        self.rdcc_w0 = rdcc_w0
+        self.locking = locking
+
+    def kwargs(self, mode="r"):
+        """ Keyword arguments for `h5py.File` to open a file with `mode`. """
+        kwargs = {}
+        if self.driver is not None:
+            kwargs["driver"] = self.driver
+            if self.driver == "core" and mode == "r":
+                kwargs["backing_store"] = False
+        for key in ["rdcc_nbytes", "rdcc_nslots", "rdcc_w0", "locking"]:
+            value = getattr(self, key)
+            if value is not None:
+                kwargs[key] = value
+        return kwargs
+
+    def __repr__(self):
+        settings = ", ".join("%s=%r" % (key, value) for key, value in self.kwargs().items())
+        return "<OpenProfile %s (%s)>" % (self.name, settings)
+
+
+PROFILES = {
+    "default": OpenProfile("default"),
+    "sec2": OpenProfile("sec2", driver="sec2", locking=False),
+    "core": OpenProfile("core", driver="core", locking=False),
+    "large-cache": OpenProfile("large-cache", driver="sec2", rdcc_nbytes=64 << 20,
+                               rdcc_nslots=100003, locking=False),
+}
+
+_default_profile = PROFILES["default"]
+
+
+def get_profile(profile=None):
+    """ Resolve `profile` (an `OpenProfile`, a name or None) to an `OpenProfile`. """
+    if profile is None:
+        return _default_profile
+    if isinstance(profile, OpenProfile):
+        return profile
+    try:
+        return PROFILES[profile]
+    except KeyError:
+        raise ValueError("Unknown open profile %r, known profiles are: %s"
+                         % (profile, ", ".join(sorted(PROFILES))))
+
+
+def set_default_profile(profile):
+    """ Set the profile used when no `profile` is given. Returns the old one. """
+    global _default_profile
+    old = _default_profile
+    _default_profile = get_profile(profile)
+    return old
+
+
+def _exercise(reference, profile):
+    from .porekit import open_fast5, get_fast5_metadata
+    from .plugins import Channel, Tracking, Read
+    with open_fast5(reference, profile=profile) as fast5:
+        get_fast5_metadata(fast5, reference, [Channel(), Tracking(), Read()])
+        fast5.get_events()
+
+
+def benchmark_profiles(references, profiles=None, repeat=3):
+    """
+    Time opening each file, reading its metadata attributes and its events
+    with every profile in `profiles` (default: all `PROFILES`).
+
+    Profiles run in rotating order, so none always gets a cold or warm page
+    cache. Returns a list of `(name, seconds_per_file)` sorted from fastest
+    to slowest, using the best of `repeat` runs.
+    """
+    if profiles is None:
+        profiles = sorted(PROFILES)
+    profiles = [get_profile(profile) for profile in profiles]
+    timings = {profile.name: [] for profile in profiles}
+    if not references:
+        raise ValueError("No files to benchmark")
+    for run in range(repeat):
+        shift = run % len(profiles)
+        for profile in profiles[shift:] + profiles[:shift]:
+            t = time.perf_counter()
+            for reference in references:
+                _exercise(reference, profile)
+            timings[profile.name].append((time.perf_counter() - t) / len(references))
+    return sorted(((name, min(times)) for name, times in timings.items()),
+                  key=lambda item: item[1])
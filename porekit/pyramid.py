@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-resolution min/max/mean pyramids over event means or raw signal.
+
+Level 0 holds the original values. Each further level combines `factor`
+neighbouring bins of the level below into one bin, keeping the minimum,
+maximum, sum and count, so the means stay exact. To draw a time window at a
+given pixel width, `SignalPyramid.window` picks the coarsest level that
+still has at least one bin per pixel and slices it with a binary search.
+The amount of data drawn therefore depends on the pixel width only, not on
+the length of the read.
+"""
+import os
+import numpy as np
+
+
+PYRAMID_EXTENSION = ".pyramid.npz"
+
+
+class SignalPyramid(object):
+    """
+    `times` and `values` are 1-d arrays of equal length, with `times` sorted.
+    Each level is a dictionary of arrays `time` (start of the bin), `min`,
+    `max`, `sum` and `count`.
+    """
+    def __init__(self, times, values, factor=4, levels=None):
+        if factor < 2:
+            raise ValueError("`factor` needs to be at least 2")
+        self.factor = factor
+        if levels is not None:
+            self.levels = levels
+            return
+        values = np.asarray(values, dtype="float64")
+        level = {
+            'time': np.asarray(times, dtype="float64"),
+            'min': values,
+            'max': values,
+            'sum': values,
+            'count': np.ones(len(values), dtype="int64"),
+        }
+        self.levels = [level]
+        while len(level['time']) > 1:
+            level = self._reduce(level)
+            self.levels.append(level)
+
+    def _reduce(self, level):
+        starts = np.arange(0, len(level['time']), self.factor)
+        return {
+            'time': level['time'][starts],
+            'min': np.minimum.reduceat(level['min'], starts),
+            'max': np.maximum.reduceat(level['max'], starts),
+            'sum': np.add.reduceat(level['sum'], starts),
+            'count': np.add.reduceat(level['count'], starts),
+        }
+
+    @classmethod
+    def from_events(cls, events, time_scale=1.0, factor=4, origin=None):
+        """
+        Build a pyramid over the event means of an events DataFrame, with
+        times in seconds relative to `origin`, by default the first event.
+        """
+        times = events['start'].values
+        if len(times):
+            if origin is None:
+                origin = times[0]
+            times = (times - origin) / time_scale
+        return cls(times, events['mean'].values, factor=factor)
+
+    def __len__(self):
+        return len(self.levels[0]['time'])
+
+    def level_for(self, n_values, width):
+        """
+        Index of the coarsest level at which `n_values` original values are
+        still represented by at least `width` bins.
+        """
+        level = 0
+        while (level + 1 < len(self.levels)
+               and n_values // self.factor ** (level + 1) >= width):
+            level += 1
+        return level
+
+    def window(self, start=None, end=None, width=1000):
+        """
+        Return `(level, time, min, max, mean)` for the time window
+        `[start, end]` with roughly between `width` and `factor * width` bins.
+        """
+        base = self.levels[0]['time']
+        first = 0 if start is None else np.searchsorted(base, start, side='left')
+        last = len(base) if end is None else np.searchsorted(base, end, side='right')
+        level_index = self.level_for(last - first, width)
+        level = self.levels[level_index]
+        # Include the bins overlapping the window edges
+        i = max(first // self.factor ** level_index, 0)
+        j = min(-(-last // self.factor ** level_index), len(level['time']))
+        sl = slice(i, j)
+        mean = level['sum'][sl] / level['count'][sl]
+        return level_index, level['time'][sl], level['min'][sl], level['max'][sl], mean
+
+    def save(self, path, **metadata):
+        """ Save the pyramid to an `.npz` file, with optional scalar metadata. """
+        arrays = {'factor': np.array(self.factor), 'n_levels': np.array(len(self.levels))}
+        for i, level in enumerate(self.levels):
+            for key, value in level.items():
+                arrays['level_%i_%s' % (i, key)] = value
+        for key, value in metadata.items():
+            arrays['meta_' + key] = np.array(value)
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """ Load a pyramid written by `save`. Returns `(pyramid, metadata)`. """
+        with np.load(path) as data:
+            levels = []
+            for i in range(int(data['n_levels'])):
+                levels.append({key: data['level_%i_%s' % (i, key)]
+                               for key in ['time', 'min', 'max', 'sum', 'count']})
+            metadata = {key[5:]: data[key][()] for key in data.files if key.startswith('meta_')}
+            return cls(None, None, factor=int(data['factor']), levels=levels), metadata
+
+
+def pyramid_cache_name(fast5):
+    """ File name of the cached pyramid for a Fast5 file or packed read. """
+    from .porekit import split_reference
+    file_name, group = split_reference(fast5.filename)
+    if group is not None:
+        file_name += "." + group.strip("/").replace("/", "_")
+    return file_name + PYRAMID_EXTENSION
+
+
+def events_pyramid(fast5, cache=False, factor=4, start=None, end=None):
+    """
+    Return the `SignalPyramid` of the event means of a read.
+
+    With `cache=True` the pyramid is stored next to the file (see
+    `pyramid_cache_name`) and reused as long as the file hasn't changed.
+
+    `start` and `end` (in seconds from the beginning of the read) limit the
+    pyramid to the events of a time window, and only those are read. A
+    current cached pyramid of the whole read is still returned if there is
+    one, but windowed pyramids are never cached.
+    """
+    file_name = fast5.file.filename
+    cache_name = pyramid_cache_name(fast5) if cache else None
+    mtime = os.path.getmtime(file_name)
+    if cache_name is not None and os.path.exists(cache_name):
+        try:
+            pyramid, metadata = SignalPyramid.load(cache_name)
+            if metadata.get('source_mtime') == mtime and pyramid.factor == factor:
+                return pyramid
+        except (OSError, KeyError, ValueError):
+            pass
+    time_scale = fast5.get_event_time_scale()
+    if start is not None or end is not None:
+        origin = fast5.get_events_by_index(0, 1)['start'].iloc[0]
+        return SignalPyramid.from_events(fast5.get_events(start, end), time_scale,
+                                         factor=factor, origin=origin)
+    pyramid = SignalPyramid.from_events(fast5.get_events(), time_scale, factor=factor)
+    if cache_name is not None:
+        pyramid.save(cache_name, source_mtime=mtime)
+    return pyramid
+
+
+class PyramidView(object):
+    """
+    Draws a `SignalPyramid` into a matplotlib axis and redraws the matching
+    level whenever the x limits change, e.g. when zooming in a notebook.
+
+    Bins which represent single values are drawn as dots, like
+    `plots.squiggle_dots` does, coarser bins as a min/max band with the
+    mean on top.
+    """
+    def __init__(self, ax, pyramid, color=(0, 0, 0)):
+        self.ax = ax
+        self.pyramid = pyramid
+        self.color = color
+        self.artists = []
+        self.level = None
+        self.update()
+        self.callback_id = ax.callbacks.connect('xlim_changed', self.update)
+
+    def width(self):
+        return max(int(self.ax.get_window_extent().width), 1)
+
+    def update(self, ax=None):
+        start, end = self.ax.get_xlim()
+        level, time, low, high, mean = self.pyramid.window(start, end, self.width())
+        for artist in self.artists:
+            artist.remove()
+        if level == 0:
+            self.artists = [self.ax.scatter(time, mean, alpha=1, s=1, color=self.color)]
+        else:
+            band = self.ax.fill_between(time, low, high, step='post', linewidth=0,
+                                        color=self.color, alpha=0.3)
+            line, = self.ax.plot(time, mean, drawstyle='steps-post', linewidth=0.5,
+                                 color=self.color)
+            self.artists = [band, line]
+        self.level = level
+
+    def disconnect(self):
+        self.ax.callbacks.disconnect(self.callback_id)
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Batch rendering of the run overview plots of `porekit.plots`.
+
+A metadata table is read once and split into runs. For each run the columns
+the plots need are extracted, renamed and sorted by time once, and this
+slim frame is shared by all plots of the run. Runs are rendered in parallel
+worker processes. Figures are drawn on `matplotlib.figure.Figure` objects
+with the Agg canvas, so no display or pyplot backend is involved.
+
+Each run directory holds a `.report-digest` file with a hash of the run's
+plot data and the report settings. Runs whose digest didn't change are
+skipped.
+"""
+import os
+import re
+import hashlib
+
+
+REPORT_VERSION = 1
+
+RUN_COLUMN = 'channel_run_id'
+
+DIGEST_FILE = '.report-digest'
+
+# Plot name -> (figure width, figure height, title)
+PLOTS = {
+    'read_length_distribution': (14, 4, "Read length distribution"),
+    'template_vs_complement': (5, 5, "Template vs complement length"),
+    'reads_vs_time': (14, 4, "Number of reads vs time"),
+    'occupancy': (14, 4, "Occupancy over time"),
+    'yield_curves': (14, 4, "Yield"),
+}
+
+# Column names of the plots -> column names in collected metadata
+PLOT_COLUMNS = {
+    'template_length': 'basecall_template_length',
+    'complement_length': 'basecall_complement_length',
+    '2D_length': 'basecall_2D_length',
+    'read_start_time': 'read_start_time',
+    'read_end_time': 'read_end_time',
+    'channel_number': 'channel_number',
+}
+
+
+def plot_frame(df):
+    """
+    Return the columns of `df` the plots use, under the names they expect,
+    with lengths as floats (NaN for missing basecalls) and sorted by
+    `read_end_time`.
+    """
+    import pandas as pd
+    columns = {}
+    for name, source in PLOT_COLUMNS.items():
+        if name in df.columns:
+            columns[name] = df[name]
+        elif source in df.columns:
+            columns[name] = df[source]
+        else:
+            raise KeyError("Metadata has no column %r or %r" % (name, source))
+    frame = pd.DataFrame(columns)
+    for name in ['template_length', 'complement_length', '2D_length', 'read_end_time']:
+        frame[name] = pd.to_numeric(frame[name], errors='coerce').astype(float)
+    frame['channel_number'] = frame['channel_number'].astype(int)
+    return frame.sort_values('read_end_time', kind='mergesort').reset_index(drop=True)
+
+
+def split_runs(df):
+    """ Yield `(run_id, plot frame)` for every run in a metadata table. """
+    if RUN_COLUMN not in df.columns:
+        yield "all", plot_frame(df)
+        return
+    for run_id, group in df.groupby(df[RUN_COLUMN].fillna("unknown"), sort=True):
+        yield str(run_id), plot_frame(group)
+
+
+def run_digest(frame, plots, formats, dpi):
+    """ Hash of the plot data of a run and the report settings. """
+    import pandas as pd
+    digest = hashlib.sha1()
+    digest.update(repr((REPORT_VERSION, sorted(plots), sorted(formats), dpi)).encode("utf-8"))
+    digest.update(repr(list(frame.columns)).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(frame, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def run_directory(output, run_id):
+    return os.path.join(output, re.sub(r"[^\w.-]", "_", run_id))
+
+
+def render_run(task):
+    """
+    Render the plots of one run. Returns `(run_id, file names, errors)`
+    where `errors` maps plot names to error messages.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from . import plots as plot_functions
+    run_id, frame, directory, plots, formats, dpi, digest = task
+    os.makedirs(directory, exist_ok=True)
+    file_names = []
+    errors = {}
+    for name in plots:
+        width, height, title = PLOTS[name]
+        figure = Figure(figsize=(width, height))
+        FigureCanvasAgg(figure)
+        ax = figure.add_subplot(1, 1, 1)
+        figure.suptitle(title)
+        try:
+            getattr(plot_functions, name)(frame, ax=ax)
+            for fmt in formats:
+                file_name = os.path.join(directory, "%s.%s" % (name, fmt))
+                figure.savefig(file_name, format=fmt, dpi=dpi)
+                file_names.append(file_name)
+        except Exception as e:
+            errors[name] = "%s: %s" % (type(e).__name__, e)
+    # Only complete runs are skipped next time
+    if not errors:
+        with open(os.path.join(directory, DIGEST_FILE), "w") as f:
+            f.write(digest)
+    return run_id, file_names, errors
+
+
+def _is_current(directory, digest):
+    try:
+        with open(os.path.join(directory, DIGEST_FILE)) as f:
+            return f.read().strip() == digest
+    except OSError:
+        return False
+
+
+def report(metadata, output, plots=None, formats=("png",), workers=1, dpi=100, force=False,
+           progress_callback=None):
+    """
+    Render the plots for every run of the metadata tables `metadata` into
+    `output/<run_id>/<plot>.<format>`.
+
+    `metadata` is a DataFrame, a file name written by `porekit collect` or a
+    list of either. Runs whose data and settings are unchanged since the last
+    report are skipped unless `force` is True. Returns a dictionary mapping
+    run ids to `(file names, errors)`, with empty lists for skipped runs.
+    """
+    import pandas as pd
+    from .storage import read_metadata
+    if plots is None:
+        plots = list(PLOTS)
+    unknown = [name for name in plots if name not in PLOTS]
+    if unknown:
+        raise ValueError("Unknown plots: %s" % ", ".join(unknown))
+    if workers < 1:
+        raise ValueError("`workers` parameter needs a positive integer")
+    if isinstance(metadata, (str, pd.DataFrame)):
+        metadata = [metadata]
+    frames = [read_metadata(m)[0] if isinstance(m, str) else m for m in metadata]
+    df = pd.concat(frames, ignore_index=True, sort=False)
+
+    results = {}
+    tasks = []
+    for run_id, frame in split_runs(df):
+        directory = run_directory(output, run_id)
+        digest = run_digest(frame, plots, formats, dpi)
+        if not force and _is_current(directory, digest):
+            results[run_id] = ([], {})
+            continue
+        tasks.append((run_id, frame, directory, list(plots), list(formats), dpi, digest))
+
+    if workers == 1 or len(tasks) <= 1:
+        rendered = map(render_run, tasks)
+        pool = None
+    else:
+        import multiprocessing
+        pool = multiprocessing.Pool(min(workers, len(tasks)))
+        rendered = pool.imap_unordered(render_run, tasks)
+    try:
+        for i, (run_id, file_names, errors) in enumerate(rendered):
+            results[run_id] = (file_names, errors)
+            if progress_callback:
+                progress_callback(i + 1, len(tasks))
+    finally:
+        if pool is not None:
+            pool.close()
+    return results
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized scoring of event means against k-mer models.
+
+The functions in this module compare the event means of reads to the levels
+a k-mer model expects for candidate sequences. Events are compared to the
+expected levels position by position, i.e. the i-th event is assumed to
+correspond to the i-th k-mer of the candidate. This is the same simplification
+`make_squiggle` makes when simulating reads.
+
+All batch functions work on many reads and many candidates at once and
+reduce to a handful of matrix products, so there are no Python loops over
+events.
+"""
+import numpy as np
+from .models import as_kmer_model
+
+
+LOG_2PI = np.log(2 * np.pi)
+
+
+def model_arrays(model):
+    """
+    Return the NumPy form of a k-mer model.
+
+    `model` is a `pandas.DataFrame` like returned from `Fast5File.get_model()`
+    or a `porekit.models.KmerModel`.
+    Returns a tuple `(k, table, level_mean, level_stdv)` where `table` maps
+    the 2-bit k-mer code (see `porekit.utils.kmer_codes`) to the row in the
+    level arrays, or -1 for k-mers the model doesn't know.
+    """
+    return as_kmer_model(model).arrays()
+
+
+def expected_levels(sequence, model):
+    """
+    Return the expected level means and standard deviations for `sequence`.
+
+    The arrays have one entry per k-mer in the sequence. K-mers which are not
+    in the model (e.g. containing an N) have NaN entries.
+    """
+    model = as_kmer_model(model)
+    rows = model.kmer_rows(sequence)
+    means = np.where(rows >= 0, model.level_mean[rows], np.nan)
+    stdvs = np.where(rows >= 0, model.level_stdv[rows], np.nan)
+    return means, stdvs
+
+
+def _event_means(read):
+    if hasattr(read, "columns"):
+        read = read["mean"].values
+    return np.asarray(read, dtype="float64")
+
+
+def pad_rows(rows, length=None):
+    """
+    Stack 1-d arrays of different lengths into a NaN padded matrix.
+
+    Rows longer than `length` are truncated. Without `length` the longest row
+    determines the width.
+    """
+    if length is None:
+        length = max((len(row) for row in rows), default=0)
+    matrix = np.full((len(rows), length), np.nan)
+    for i, row in enumerate(rows):
+        row = row[:length]
+        matrix[i, :len(row)] = row
+    return matrix
+
+
+def event_log_likelihoods(means, levels, stdvs, shift=0.0, scale=1.0):
+    """
+    Per event Gaussian log-likelihood of `means` given expected `levels`.
+
+    All arguments broadcast against each other, `shift` and `scale` are
+    applied to the model levels.
+    """
+    z = (means - (levels * scale + shift)) / stdvs
+    return -0.5 * z * z - np.log(stdvs) - 0.5 * LOG_2PI
+
+
+def score_matrix(events, levels, stdvs, fit=True):
+    """
+    Score every read against every candidate.
+
+    `events` is a (reads x positions) matrix of event means, `levels` and
+    `stdvs` are (candidates x positions) matrices of expected levels. NaN
+    entries in either are ignored. If `fit` is True, the model levels are
+    fitted to each read with a weighted least squares shift and scale before
+    scoring, otherwise they are used as they are.
+
+    Returns a tuple of (reads x candidates) matrices
+    `(log_likelihood, shift, scale, n)` where `n` is the number of events
+    which contributed to each score.
+    """
+    events = np.asarray(events, dtype="float64")
+    levels = np.asarray(levels, dtype="float64")
+    stdvs = np.asarray(stdvs, dtype="float64")
+    width = min(events.shape[1], levels.shape[1])
+    events, levels, stdvs = events[:, :width], levels[:, :width], stdvs[:, :width]
+
+    read_mask = ~np.isnan(events)
+    model_mask = ~(np.isnan(levels) | np.isnan(stdvs))
+    e = np.where(read_mask, events, 0.0)
+    m = read_mask.astype("float64")
+    l = np.where(model_mask, levels, 0.0)
+    s = np.where(model_mask, stdvs, 1.0)
+    w = np.where(model_mask, 1.0 / (s * s), 0.0)
+
+    # Weighted sums over all valid (read, candidate) position pairs
+    s0 = m @ w.T
+    sl = m @ (w * l).T
+    sll = m @ (w * l * l).T
+    se = e @ w.T
+    sel = e @ (w * l).T
+    see = (e * e) @ w.T
+    n = m @ model_mask.T.astype("float64")
+    log_stdvs = m @ np.where(model_mask, np.log(s), 0.0).T
+
+    if fit:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            denominator = s0 * sll - sl * sl
+            scale = np.where(denominator > 0, (s0 * sel - se * sl) / denominator, 1.0)
+            shift = np.where(s0 > 0, (se - scale * sl) / s0, 0.0)
+    else:
+        scale = np.ones_like(s0)
+        shift = np.zeros_like(s0)
+
+    rss = (see - 2 * scale * sel - 2 * shift * se + scale * scale * sll
+           + 2 * scale * shift * sl + shift * shift * s0)
+    log_likelihood = -0.5 * rss - log_stdvs - 0.5 * n * LOG_2PI
+    return log_likelihood, shift, scale, n
+
+
+# Candidates scoring fewer events than this fraction of the best covered
+# candidate of a read are ruled out when scores are normalized
+MIN_OVERLAP = 0.5
+
+
+def score_batch(reads, candidates, model, fit=True, max_events=None, normalize=True,
+                min_overlap=MIN_OVERLAP):
+    """
+    Score a batch of reads against a batch of candidate sequences.
+
+    `reads` is a list of event means arrays or event DataFrames like returned
+    from `Fast5File.get_events()`. `candidates` is a list of sequences, `model`
+    a model DataFrame from `Fast5File.get_model()` or a `KmerModel` from
+    `Fast5File.get_kmer_model()`. Only the first `max_events` events of each
+    read are used.
+
+    Returns a (reads x candidates) `pandas.DataFrame` of log-likelihoods.
+    Candidates of different lengths score different numbers of events, so by
+    default the log-likelihoods are divided by that number, making scores
+    comparable across candidates. As the fitted shift and scale match a few
+    events almost perfectly, a candidate scoring fewer events than
+    `min_overlap` times the events of the best covered candidate of the same
+    read gets -inf, as do pairs without any scored event. With
+    `normalize=False` the summed log-likelihoods are returned.
+    """
+    import pandas as pd
+    model = as_kmer_model(model)
+    events = pad_rows([_event_means(read) for read in reads], max_events)
+    expected = [expected_levels(candidate, model) for candidate in candidates]
+    width = events.shape[1]
+    levels = pad_rows([means for means, stdvs in expected], width)
+    stdvs = pad_rows([stdvs for means, stdvs in expected], width)
+    log_likelihood, shift, scale, n = score_matrix(events, levels, stdvs, fit=fit)
+    if normalize:
+        enough = (n > 0) & (n >= min_overlap * n.max(axis=1, initial=0)[:, None])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_likelihood = np.where(enough, log_likelihood / n, -np.inf)
+    return pd.DataFrame(log_likelihood)
+
+
+def classify(reads, candidates, model, fit=True, max_events=None, min_overlap=MIN_OVERLAP):
+    """
+    Return the index of the best scoring candidate for each read, comparing
+    the log-likelihoods per scored event, see `score_batch`.
+    """
+    scores = score_batch(reads, candidates, model, fit=fit, max_events=max_events,
+                         min_overlap=min_overlap)
+    return scores.values.argmax(axis=1)
@@ -12,15 +12,196 @@ def main():
     pass
 
 
+@main.command()
+@click.argument('path', type=click.Path(exists=True))
+@click.argument('output', type=click.Path(), required=False)
+@click.option('--workers', nargs=1, type=int, default=1)
+@click.option('--update', nargs=1, type=click.Path(exists=True), default=None,
+              help="Existing metadata file to update. Only new or changed plugins are run.")
+@click.option('--profile', nargs=1, type=str, default=None,
+              help="HDF5 open profile, see `porekit bench-open`.")
+@click.option('--where', nargs=1, type=str, default=None,
+              help="Only collect reads matching this expression on channel, tracking "
+                   "and read columns, e.g. \"channel_number <= 128\".")
+@click.option('--partition', is_flag=True, default=False,
+              help="Write a Parquet dataset directory partitioned by run and hour "
+                   "instead of a single Feather file.")
+@click.option('--timeout', nargs=1, type=float, default=None,
+              help="Seconds after which a file is given up and its worker replaced.")
+@click.option('--quarantine', nargs=1, type=click.Path(), default=None,
+              help="JSON file listing unreadable files, which are skipped until they change.")
+def collect(path, output, workers, update, profile, where, partition, timeout, quarantine):
+    import os
+    import porekit
+    from porekit.plugins import DEFAULT_PLUGINS, plugin_versions
+    from porekit.storage import (read_metadata, write_metadata, write_metadata_dataset,
+                                 is_metadata_dataset)
+    if output is None:
+        if update is None:
+            raise click.UsageError("OUTPUT is required unless --update is given")
+        output = update
+    if partition:
+        if os.path.exists(output) and not is_metadata_dataset(output) \
+                and not (os.path.isdir(output) and not os.listdir(output)):
+            raise click.UsageError("%s exists and is not a metadata dataset" % output)
+    elif os.path.isdir(output):
+        raise click.UsageError("%s is a directory, use --partition to write a dataset" % output)
+    if update is not None and where is not None:
+        raise click.UsageError("--where can't be combined with --update")
+    if update is not None:
+        click.echo("Updating metadata")
+        df, versions = read_metadata(update)
+        df, versions = porekit.porekit.update_metadata(df, versions, path=path, workers=workers,
+                                                       profile=profile, timeout=timeout,
+                                                       quarantine=quarantine)
+    else:
+        click.echo("Collecting metadata")
+        df = porekit.gather_metadata(path, workers=workers, profile=profile, where=where,
+                                     timeout=timeout, quarantine=quarantine)
+        versions = plugin_versions(DEFAULT_PLUGINS)
+    errors = porekit.porekit.metadata_errors(df)
+    if len(errors):
+        click.echo("%i errors in %i files" % (len(errors), errors.absolute_filename.nunique()))
+    if partition:
+        click.echo("Writing Metadata to partitioned dataset")
+        write_metadata_dataset(df, output, versions)
+    else:
+        click.echo("Writing Metadata to file")
+        write_metadata(df, output, versions)
+    click.echo("\nDone.")
+
+
 @main.command()
 @click.argument('path', type=click.Path(exists=True))
 @click.argument('output', type=click.Path())
+@click.option('--reads-per-container', nargs=1, type=int, default=100000)
+@click.option('--compression-level', nargs=1, type=int, default=4)
 @click.option('--workers', nargs=1, type=int, default=1)
-def collect(path, output, workers):
+def repack(path, output, reads_per_container, compression_level, workers):
+    import porekit
+    click.echo("Repacking Fast5 files")
+    containers = porekit.repack(path, output,
+                                reads_per_container=reads_per_container,
+                                compression_opts=compression_level, workers=workers)
+    click.echo("Wrote %i containers" % len(containers))
+    click.echo("\nDone.")
+
+
+@main.command()
+@click.argument('path', type=click.Path(exists=True))
+@click.argument('output', type=click.Path())
+@click.option('-k', nargs=1, type=int, default=5, help="K-mer length.")
+@click.option('--strand', 'strands', multiple=True, type=click.Choice(['template', 'complement', '2D']),
+              help="Basecalls to count, can be repeated. Default: all.")
+@click.option('--workers', nargs=1, type=int, default=1)
+@click.option('--profile', nargs=1, type=str, default=None,
+              help="HDF5 open profile, see `porekit bench-open`.")
+def kmers(path, output, k, strands, workers, profile):
+    import porekit
+    from porekit.kmers import count_kmers, STRANDS
+    click.echo("Counting %i-mers" % k)
+    file_names = list(porekit.find_fast5_references(path, profile=profile))
+    counts = count_kmers(file_names, k=k, strands=list(strands) or STRANDS, workers=workers,
+                         profile=profile)
+    click.echo("%i sequences, %i bases, GC content %.1f%%"
+               % (counts.reads, counts.bases.sum(), 100 * counts.gc_content))
+    if counts.failed_files:
+        click.echo("%i files could not be read" % counts.failed_files)
+    click.echo("Writing counts to file")
+    counts.save(output)
+    click.echo("\nDone.")
+
+
+@main.command()
+@click.argument('metadata', nargs=-1, required=True, type=click.Path(exists=True))
+@click.argument('output', type=click.Path())
+@click.option('--format', 'formats', multiple=True, type=click.Choice(['png', 'svg', 'pdf']),
+              help="Output format, can be repeated. Default: png.")
+@click.option('--plot', 'plots', multiple=True,
+              help="Plot to render, can be repeated. Default: all.")
+@click.option('--workers', nargs=1, type=int, default=1)
+@click.option('--dpi', nargs=1, type=int, default=100)
+@click.option('--force', is_flag=True, help="Render runs even if they are unchanged.")
+def report(metadata, output, formats, plots, workers, dpi, force):
+    from porekit.report import report as render_report
+    click.echo("Rendering report")
+    results = render_report(list(metadata), output, plots=list(plots) or None,
+                            formats=formats or ("png",), workers=workers, dpi=dpi, force=force)
+    rendered = 0
+    for run_id, (file_names, errors) in sorted(results.items()):
+        if file_names:
+            rendered += 1
+        for name, error in sorted(errors.items()):
+            click.echo("Run %s: %s failed: %s" % (run_id, name, error))
+    click.echo("Rendered %i of %i runs, the others are unchanged" % (rendered, len(results)))
+    click.echo("\nDone.")
+
+
+@main.command()
+@click.argument('fasta', type=click.Path(exists=True))
+@click.argument('model', type=click.Path(exists=True))
+@click.argument('output', type=click.Path())
+@click.option('--reads', nargs=1, type=int, default=1000, help="Number of reads to simulate.")
+@click.option('--seed', nargs=1, type=int, default=0)
+@click.option('--mean-length', nargs=1, type=int, default=5000, help="Mean read length in bases.")
+@click.option('--shard-size', nargs=1, type=int, default=1000, help="Reads per events file.")
+@click.option('--strand', nargs=1, type=click.Choice(['template', 'complement']), default='template',
+              help="Model to use if MODEL is a Fast5 file.")
+@click.option('--fast5', is_flag=True, help="Also write a Fast5 file per read.")
+@click.option('--workers', nargs=1, type=int, default=1)
+def simulate(fasta, model, output, reads, seed, mean_length, shard_size, strand, fast5, workers):
+    from porekit.simulate import read_fasta, load_model, simulate as run_simulation
+    click.echo("Simulating %i reads" % reads)
+    labels = run_simulation(read_fasta(fasta), load_model(model, strand), output, reads, seed=seed,
+                            workers=workers, shard_size=shard_size, fast5=fast5,
+                            mean_length=mean_length)
+    click.echo("Wrote %i reads with %i events" % (len(labels), labels.n_events.sum()))
+    click.echo("\nDone.")
+
+
+@main.group()
+def events():
+    """ Work with the event tables of many reads. """
+
+
+@events.command('export')
+@click.argument('path', type=click.Path(exists=True))
+@click.argument('output', type=click.Path())
+@click.option('--workers', nargs=1, type=int, default=1)
+@click.option('--row-group-size', nargs=1, type=int, default=1 << 20,
+              help="Events per Parquet row group.")
+@click.option('--compression', nargs=1, type=click.Choice(['zstd', 'snappy', 'gzip', 'none']),
+              default='zstd')
+@click.option('--profile', nargs=1, type=str, default=None,
+              help="HDF5 open profile, see `porekit bench-open`.")
+def export_events(path, output, workers, row_group_size, compression, profile):
+    import porekit
+    from porekit.export import export_events as run_export
+    click.echo("Exporting events")
+    file_names = list(porekit.find_fast5_references(path, profile=profile))
+    reads, n_events = run_export(file_names, output, workers=workers,
+                                 row_group_size=row_group_size, compression=compression,
+                                 profile=profile)
+    click.echo("Wrote %i events of %i reads" % (n_events, reads))
+    click.echo("\nDone.")
+
+
+@main.command('bench-open')
+@click.argument('path', type=click.Path(exists=True))
+@click.option('--limit', nargs=1, type=int, default=200,
+              help="Number of files to open per run.")
+@click.option('--repeat', nargs=1, type=int, default=3)
+@click.option('--profile', 'profiles', multiple=True,
+              help="Profile to measure, can be repeated. Default: all profiles.")
+def bench_open(path, limit, repeat, profiles):
     import porekit
-    import feather
-    click.echo("Collecting metadata")
-    df = porekit.gather_metadata(path, workers=workers)
-    click.echo("Writing Metadata to file")
-    feather.write_dataframe(df, output)
+    from porekit.profiles import benchmark_profiles
+    references = list(porekit.find_fast5_references(path))[:limit]
+    if not references:
+        raise click.UsageError("No Fast5 files found in %s" % path)
+    click.echo("Measuring open profiles on %i files" % len(references))
+    results = benchmark_profiles(references, profiles=profiles or None, repeat=repeat)
+    for name, seconds in results:
+        click.echo("%-12s %10.1f us/file" % (name, seconds * 1e6))
+    click.echo("Fastest profile: %s" % results[0][0])
     click.echo("\nDone.")
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Event detection: segmentation of raw signal into events.
+
+A boundary between two events is placed where the means of the `window`
+samples before and after a position differ most, measured by Welch's
+t-statistic. The statistic of every position is computed at once from
+cumulative sums of the signal and of its square. Positions become
+boundaries if their statistic exceeds `threshold` and is the largest within
+`min_length` samples on either side.
+
+`EventDetector` consumes the signal in chunks of any size and only keeps a
+few windows worth of samples between chunks, so reads of any length are
+segmented in bounded memory. Integer signal (like the raw int16 samples in
+Fast5 files) is summed exactly in int64, so chunked and one-shot detection
+give identical events; for float signal they agree up to rounding.
+"""
+import numpy as np
+
+
+EVENT_DTYPE = np.dtype([('start', '<u8'), ('length', '<u8'),
+                        ('mean', '<f8'), ('stdv', '<f8')])
+
+DEFAULT_WINDOW = 6
+DEFAULT_THRESHOLD = 4.0
+DEFAULT_MIN_LENGTH = 3
+DEFAULT_CHUNK_SIZE = 1 << 18
+
+
+def t_statistics(signal, window):
+    """
+    Return the t-statistic comparing `signal[i - window:i]` to
+    `signal[i:i + window]` for `i` from `window` to `len(signal) - window`.
+    """
+    x = _as_samples(signal)
+    n = len(x)
+    if n < 2 * window:
+        return np.empty(0)
+    c = np.zeros(n + 1, dtype=x.dtype)
+    np.cumsum(x, out=c[1:])
+    c2 = np.zeros(n + 1, dtype=x.dtype)
+    np.cumsum(x * x, out=c2[1:])
+    left = c[window:n - window + 1] - c[:n - 2 * window + 1]
+    right = c[2 * window:] - c[window:n - window + 1]
+    left2 = c2[window:n - window + 1] - c2[:n - 2 * window + 1]
+    right2 = c2[2 * window:] - c2[window:n - window + 1]
+    mean_left = left / window
+    mean_right = right / window
+    var_left = np.maximum(left2 / window - mean_left * mean_left, 0.0)
+    var_right = np.maximum(right2 / window - mean_right * mean_right, 0.0)
+    # The small constant keeps flat stretches (e.g. clipped signal) finite
+    return np.abs(mean_right - mean_left) / np.sqrt((var_left + var_right) / window + 1e-6)
+
+
+def _as_samples(signal):
+    signal = np.asarray(signal)
+    if signal.dtype.kind in 'iu':
+        return signal.astype("int64")
+    return signal.astype("float64")
+
+
+def _local_maxima(values, radius):
+    """ Boolean mask of entries which are the maximum of their neighbourhood. """
+    padded = np.concatenate([np.full(radius, -np.inf), values, np.full(radius, -np.inf)])
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * radius + 1)
+    return values >= windows.max(axis=1)
+
+
+class EventDetector(object):
+    """
+    Streaming event detection.
+
+    Call `feed` with consecutive chunks of the signal and `finish` after the
+    last one. Both return a structured array of `EVENT_DTYPE` with the events
+    completed so far. `start` is the sample number of the first sample, it
+    is added to the `start` column of the events.
+    """
+    def __init__(self, window=DEFAULT_WINDOW, threshold=DEFAULT_THRESHOLD,
+                 min_length=DEFAULT_MIN_LENGTH, start=0):
+        if window < 1 or min_length < 1:
+            raise ValueError("`window` and `min_length` need to be positive integers")
+        self.window = window
+        self.threshold = threshold
+        self.min_length = min_length
+        # Samples kept from the previous chunk and the sample number of the first
+        self._carry = None
+        self._carry_start = start
+        # Boundaries before this sample number are decided
+        self._done = start
+        self._last_boundary = None
+        # Running sums of the event which isn't closed yet
+        self._event_start = start
+        self._sums = np.zeros(3)
+        self.finished = False
+
+    def feed(self, samples):
+        """ Process the next chunk of samples. Returns the completed events. """
+        if self.finished:
+            raise ValueError("`feed` called after `finish`")
+        return self._process(_as_samples(samples), final=False)
+
+    def finish(self):
+        """ Process the remaining samples and close the last event. """
+        if self.finished:
+            return np.empty(0, dtype=EVENT_DTYPE)
+        events = self._process(np.empty(0, dtype="int64"), final=True)
+        self.finished = True
+        if self._sums[0] > 0:
+            last = self._make_events(np.array([self._event_start]), self._sums[None, :])
+            events = np.concatenate([events, last])
+        return events
+
+    def _process(self, samples, final):
+        w, r = self.window, self.min_length
+        buf = samples if self._carry is None else np.concatenate([self._carry, samples])
+        base = self._carry_start
+        n = len(buf)
+        lo = self._done - base
+        hi = n if final else max(n - w - r + 1, lo)
+        if hi <= lo:
+            self._carry = buf
+            return np.empty(0, dtype=EVENT_DTYPE)
+
+        # Statistic for every buffer position, -inf where it's undefined
+        t = np.full(n, -np.inf)
+        stats = t_statistics(buf, w)
+        t[w:w + len(stats)] = stats
+        neighbourhood = t[max(lo - r, 0):min(hi + r, n)]
+        offset = lo - max(lo - r, 0)
+        is_peak = _local_maxima(neighbourhood, r)[offset:offset + hi - lo]
+        region = t[lo:hi]
+        boundaries = np.flatnonzero(is_peak & (region > self.threshold)) + lo
+
+        # Drop ties within `min_length` of the previous boundary
+        previous = np.concatenate([[-np.inf if self._last_boundary is None
+                                    else self._last_boundary - base], boundaries[:-1]])
+        boundaries = boundaries[boundaries - previous > r]
+        if len(boundaries):
+            self._last_boundary = base + boundaries[-1]
+
+        # Sums of count, value and square of the segments between boundaries
+        x = buf[lo:hi]
+        cumulative = np.zeros((len(x) + 1, 3), dtype=x.dtype)
+        cumulative[1:, 0] = np.arange(1, len(x) + 1)
+        np.cumsum(x, out=cumulative[1:, 1])
+        np.cumsum(x * x, out=cumulative[1:, 2])
+        edges = np.concatenate([[0], boundaries - lo, [hi - lo]])
+        sums = np.diff(cumulative[edges], axis=0).astype("float64")
+        sums[0] += self._sums
+        starts = np.concatenate([[self._event_start], base + boundaries])
+        events = self._make_events(starts[:-1], sums[:-1])
+        self._event_start = starts[-1]
+        self._sums = sums[-1]
+
+        self._done = base + hi
+        keep = max(hi - w - r, 0)
+        self._carry = buf[keep:]
+        self._carry_start = base + keep
+        return events
+
+    def _make_events(self, starts, sums):
+        events = np.empty(len(starts), dtype=EVENT_DTYPE)
+        count = sums[:, 0]
+        mean = sums[:, 1] / count
+        events['start'] = starts
+        events['length'] = count
+        events['mean'] = mean
+        events['stdv'] = np.sqrt(np.maximum(sums[:, 2] / count - mean * mean, 0.0))
+        return events
+
+
+def detect_events(signal, window=DEFAULT_WINDOW, threshold=DEFAULT_THRESHOLD,
+                  min_length=DEFAULT_MIN_LENGTH, start=0):
+    """ Segment a whole signal array into events. See `EventDetector`. """
+    detector = EventDetector(window, threshold, min_length, start)
+    return np.concatenate([detector.feed(signal), detector.finish()])
+
+
+def segment_fast5(fast5, chunk_size=DEFAULT_CHUNK_SIZE, **kwargs):
+    """
+    Detect events in the raw signal of a Fast5 file or packed read.
+
+    The signal is read from the file in chunks of `chunk_size` samples and
+    segmented as raw integers. The t-statistic doesn't depend on the scaling,
+    so only the means and standard deviations of the events are converted to
+    picoampere. Event starts are sample numbers, like in the
+    `EventDetection_000` events. Keyword arguments go to `EventDetector`.
+    """
+    node = fast5.get_raw_node()
+    scale, offset = fast5.get_raw_scaling()
+    kwargs.setdefault('start', int(node.attrs['start_time']))
+    detector = EventDetector(**kwargs)
+    signal = node['Signal']
+    events = []
+    for i in range(0, len(signal), chunk_size):
+        events.append(detector.feed(signal[i:i + chunk_size]))
+    events.append(detector.finish())
+    events = np.concatenate(events)
+    events['mean'] = (events['mean'] + offset) * scale
+    events['stdv'] *= scale
+    return events
+
+
+def _segment_chunk(task):
+    from .porekit import open_fast5, error_record
+    references, chunk_size, profile, raise_errors, kwargs = task
+    results = []
+    for reference in references:
+        try:
+            fast5 = open_fast5(reference, profile=profile)
+        except Exception as e:
+            if raise_errors:
+                raise
+            results.append((reference, None, error_record("open", e)))
+            continue
+        try:
+            results.append((reference, segment_fast5(fast5, chunk_size, **kwargs), None))
+        except Exception as e:
+            # E.g. files without raw data or truncated files
+            if raise_errors:
+                raise
+            results.append((reference, None, error_record("file", e)))
+        finally:
+            fast5.close()
+    return results
+
+
+def segment_files(file_names, workers=1, chunk_size=DEFAULT_CHUNK_SIZE,
+                  progress_callback=None, profile=None, raise_errors=False, errors=None,
+                  **kwargs):
+    """
+    Yield `(file_name, events)` for a list of file names and packed read
+    references, using `workers` processes. `profile` selects the HDF5 open
+    settings, see `porekit.profiles`.
+
+    Files which can't be opened or segmented, e.g. as they have no raw data,
+    are skipped unless `raise_errors` is set. If `errors` is a list, a
+    record like the rows of `porekit.porekit.metadata_errors` is appended to
+    it for each of them.
+    """
+    from .profiles import get_profile
+    profile = get_profile(profile)
+    files_total = len(file_names)
+    if workers < 1:
+        raise ValueError("`workers` parameter needs a positive integer")
+    task_size = max(1, min(100, files_total // (workers * 4)))
+    tasks = [(file_names[i:i + task_size], chunk_size, profile, raise_errors, kwargs)
+             for i in range(0, files_total, task_size)]
+    if workers == 1:
+        results = map(_segment_chunk, tasks)
+        pool = None
+    else:
+        import multiprocessing
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap(_segment_chunk, tasks)
+    files_read = 0
+    try:
+        for chunk in results:
+            for file_name, events, error in chunk:
+                files_read += 1
+                if progress_callback:
+                    progress_callback(files_read, files_total)
+                if error is not None:
+                    if errors is not None:
+                        errors.append(dict(error, absolute_filename=file_name))
+                    continue
+                yield file_name, events
+    finally:
+        if pool is not None:
+            pool.close()
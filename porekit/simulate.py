@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+Simulated reads from reference sequences and a k-mer model.
+
+Each read is a random fragment of one of the reference sequences (chosen
+proportionally to their length) on a random strand. Its event means come
+from `make_squiggle`, event lengths in samples are drawn from a geometric
+distribution. Everything about read number `i` is drawn from a generator
+seeded with `(seed, i)`, so a dataset is the same no matter how many worker
+processes produced it or in which order.
+
+`simulate` writes the events of every shard of reads as an `EventBatch`
+file, the labels (reference, position, strand) of all reads as a Feather
+table and optionally one Fast5 file per read, with event table and raw
+signal, which the rest of porekit can read like real data.
+"""
+import os
+import uuid
+import numpy as np
+from .batch import EventBatch
+from .utils import encode_bases
+
+
+SAMPLING_RATE = 4000.0
+DIGITISATION = 8192.0
+RANGE = 1500.0
+OFFSET = 10.0
+
+LABEL_COLUMNS = ['read_id', 'read_number', 'reference', 'position', 'length', 'strand', 'n_events']
+
+_COMPLEMENT = bytes.maketrans(b"ACGTacgt", b"TGCAtgca")
+
+
+def read_fasta(path):
+    """ Return a list of `(name, sequence)` tuples from a FASTA file, as bytes. """
+    records = []
+    name, lines = None, []
+    with open(path, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith(b">"):
+                if name is not None:
+                    records.append((name, b"".join(lines)))
+                name = (line[1:].split() or [b""])[0]
+                lines = []
+            elif line:
+                lines.append(line)
+    if name is not None:
+        records.append((name, b"".join(lines)))
+    return records
+
+
+def load_model(path, strand="template"):
+    """
+    Load a k-mer model from a Fast5 file, or the first model of a file
+    written by `ModelRegistry.save`.
+    """
+    from .models import registry
+    if path.endswith(".npz"):
+        models = registry.load(path)
+        if not models:
+            raise ValueError("%s contains no models" % path)
+        return models[0]
+    from .porekit import open_fast5
+    with open_fast5(path) as fast5:
+        return fast5.get_kmer_model(strand)
+
+
+class Simulator(object):
+    """
+    Generates reads from `references` (a list of `(name, sequence)`) with
+    `model`. Read lengths in bases are drawn from an exponential
+    distribution with mean `mean_length`, clipped to the reference length;
+    `mean_event_length` is the mean number of samples per event.
+    """
+    def __init__(self, references, model, seed=0, mean_length=5000, min_length=100,
+                 mean_event_length=10.0, std_multiplier=1.0):
+        from .models import as_kmer_model
+        self.model = as_kmer_model(model)
+        self.references = [(name, sequence) for name, sequence in references
+                           if len(sequence) > self.model.k + 1]
+        if not self.references:
+            raise ValueError("No reference sequence is longer than the model's k-mers")
+        lengths = np.array([len(sequence) for name, sequence in self.references], dtype="float64")
+        self.weights = lengths / lengths.sum()
+        self.seed = seed
+        self.mean_length = mean_length
+        self.min_length = min_length
+        self.mean_event_length = mean_event_length
+        self.std_multiplier = std_multiplier
+        if 'sd_mean' in (self.model.records.dtype.names or ()):
+            self.event_stdv = np.asarray(self.model.records['sd_mean'], dtype="float64")
+        else:
+            self.event_stdv = np.ones(len(self.model))
+
+    def rng(self, number):
+        return np.random.default_rng([self.seed, number])
+
+    def read(self, number):
+        """ Simulate read `number`. Returns `(events, label)`. """
+        from .porekit import make_squiggle
+        rng = self.rng(number)
+        reference = rng.choice(len(self.references), p=self.weights)
+        name, sequence = self.references[reference]
+        length = int(np.clip(rng.exponential(self.mean_length), self.min_length, len(sequence)))
+        length = max(length, self.model.k + 1)
+        position = int(rng.integers(0, len(sequence) - length + 1))
+        fragment = sequence[position:position + length]
+        strand = "-" if rng.random() < 0.5 else "+"
+        if strand == "-":
+            fragment = fragment.translate(_COMPLEMENT)[::-1]
+        # Bases the model doesn't know (N, IUPAC codes) are replaced at random
+        codes = encode_bases(fragment)
+        invalid = codes < 0
+        if invalid.any():
+            codes = codes.copy()
+            codes[invalid] = rng.integers(0, 4, invalid.sum())
+            fragment = np.frombuffer(b"ACGT", dtype="uint8")[codes].tobytes()
+
+        means = make_squiggle(fragment, self.model, self.std_multiplier, rng=rng)
+        rows = self.model.kmer_rows(fragment)[:len(means)]
+        lengths = rng.geometric(1.0 / self.mean_event_length, size=len(means))
+        start_time = int(rng.integers(0, int(SAMPLING_RATE * 3600 * 48)))
+        events = np.empty(len(means), dtype=[('start', 'float64'), ('length', 'float64'),
+                                             ('mean', 'float64'), ('stdv', 'float64')])
+        events['start'] = start_time + np.concatenate([[0], np.cumsum(lengths[:-1])])
+        events['length'] = lengths
+        events['mean'] = means
+        events['stdv'] = self.event_stdv[rows]
+        read_id = str(uuid.UUID(bytes=rng.bytes(16), version=4))
+        label = {
+            'read_id': read_id,
+            'read_number': number,
+            'reference': name.decode("utf-8", "replace"),
+            'position': position,
+            'length': length,
+            'strand': strand,
+            'n_events': len(events),
+        }
+        return events, label
+
+    def raw_signal(self, events, number):
+        """ Raw int16 samples for `events`, with Gaussian noise of the event stdv. """
+        rng = np.random.default_rng([self.seed, number, 1])
+        lengths = events['length'].astype("int64")
+        current = (np.repeat(events['mean'], lengths)
+                   + rng.standard_normal(lengths.sum()) * np.repeat(events['stdv'], lengths))
+        raw = np.round(current * DIGITISATION / RANGE - OFFSET)
+        return np.clip(raw, -32768, 32767).astype("int16")
+
+
+def write_fast5(path, events, label, signal=None, channel=1, run_id="simulated"):
+    """
+    Write a simulated read as a single read Fast5 file which passes
+    `sanity_check` and works with the default plugins.
+    """
+    import h5py
+    read_name = "Read_%i" % label['read_number']
+    with h5py.File(path, "w") as f:
+        channel_id = f.create_group("UniqueGlobalKey/channel_id")
+        channel_id.attrs["channel_number"] = np.bytes_(str(channel))
+        channel_id.attrs["digitisation"] = DIGITISATION
+        channel_id.attrs["offset"] = OFFSET
+        channel_id.attrs["range"] = RANGE
+        channel_id.attrs["sampling_rate"] = SAMPLING_RATE
+        tracking = f.create_group("UniqueGlobalKey/tracking_id")
+        for key, value in [("run_id", run_id), ("asic_id", "0"), ("version_name", "porekit simulate"),
+                           ("asic_temp", "0"), ("heatsink_temp", "0"),
+                           ("exp_script_purpose", "simulation"), ("flow_cell_id", "simulated"),
+                           ("device_id", "simulated")]:
+            tracking.attrs[key] = np.bytes_(value)
+
+        start_time = int(events['start'][0]) if len(events) else 0
+        duration = int(events['length'].sum())
+        table = np.empty(len(events), dtype=[('mean', '<f8'), ('stdv', '<f8'),
+                                             ('start', '<u8'), ('length', '<u8')])
+        for field in ['mean', 'stdv', 'start', 'length']:
+            table[field] = events[field]
+        read = f.create_group("Analyses/EventDetection_000/Reads/" + read_name)
+        read.create_dataset("Events", data=table)
+        read.attrs["read_id"] = np.bytes_(label['read_id'])
+        read.attrs["read_number"] = label['read_number']
+        read.attrs["start_time"] = start_time
+        read.attrs["duration"] = duration
+        read.attrs["start_mux"] = 1
+        for key in ['reference', 'position', 'length', 'strand']:
+            value = label[key]
+            read.attrs["simulated_" + key] = np.bytes_(value) if isinstance(value, str) else value
+        if signal is not None:
+            raw = f.create_group("Raw/Reads/" + read_name)
+            raw.create_dataset("Signal", data=signal, compression="gzip", chunks=True)
+            for key in ["read_id", "read_number", "start_time", "duration", "start_mux"]:
+                raw.attrs[key] = read.attrs[key]
+
+
+# The simulator of a worker process, set once by `_init_worker` so the
+# reference sequences aren't sent along with every shard
+_simulator = None
+
+
+def _init_worker(simulator):
+    global _simulator
+    _simulator = simulator
+
+
+def _simulate_shard(task):
+    first, last, output, fast5_dir = task
+    simulator = _simulator
+    arrays, labels = [], []
+    for number in range(first, last):
+        events, label = simulator.read(number)
+        arrays.append(events)
+        labels.append(label)
+        if fast5_dir is not None:
+            path = os.path.join(fast5_dir, "simulated_read%i.fast5" % number)
+            write_fast5(path, events, label, simulator.raw_signal(events, number),
+                        channel=number % 512 + 1)
+    batch = EventBatch.from_arrays(arrays, [label['read_id'] for label in labels],
+                                   np.full(len(labels), SAMPLING_RATE))
+    if output is None:
+        return batch, labels
+    batch.save(os.path.join(output, "events_%08i.pkev" % first))
+    return None, labels
+
+
+def _run(simulator, n_reads, shard_size, output, fast5_dir, workers, progress_callback):
+    if workers < 1:
+        raise ValueError("`workers` parameter needs a positive integer")
+    tasks = [(i, min(i + shard_size, n_reads), output, fast5_dir)
+             for i in range(0, n_reads, shard_size)]
+    if workers == 1:
+        _init_worker(simulator)
+        results = map(_simulate_shard, tasks)
+        pool = None
+    else:
+        import multiprocessing
+        pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(simulator,))
+        results = pool.imap(_simulate_shard, tasks)
+    try:
+        reads_done = 0
+        for batch, labels in results:
+            reads_done += len(labels)
+            if progress_callback:
+                progress_callback(reads_done, n_reads)
+            yield batch, labels
+    finally:
+        if pool is not None:
+            pool.close()
+        else:
+            _init_worker(None)
+
+
+def simulate_reads(references, model, n_reads, seed=0, workers=1, shard_size=1000,
+                   progress_callback=None, **kwargs):
+    """
+    Simulate `n_reads` reads in memory. Returns an `EventBatch` and a
+    `pandas.DataFrame` of labels. Keyword arguments go to `Simulator`.
+    """
+    import pandas as pd
+    simulator = Simulator(references, model, seed=seed, **kwargs)
+    batches, labels = [], []
+    for batch, shard_labels in _run(simulator, n_reads, shard_size, None, None,
+                                    workers, progress_callback):
+        batches.append(batch)
+        labels += shard_labels
+    return EventBatch.concatenate(batches), pd.DataFrame(labels, columns=LABEL_COLUMNS)
+
+
+def simulate(references, model, output, n_reads, seed=0, workers=1, shard_size=1000,
+             fast5=False, progress_callback=None, **kwargs):
+    """
+    Simulate `n_reads` reads into the directory `output`.
+
+    Events are written as one `EventBatch` file per shard of `shard_size`
+    reads (`events_<first read>.pkev`), labels to `labels.feather`. With
+    `fast5=True`, a Fast5 file per read is written to `output/fast5`.
+    Only one shard per worker is held in memory. Returns the labels.
+    """
+    import pandas as pd
+    import pyarrow.feather as feather
+    simulator = Simulator(references, model, seed=seed, **kwargs)
+    os.makedirs(output, exist_ok=True)
+    fast5_dir = None
+    if fast5:
+        fast5_dir = os.path.join(output, "fast5")
+        os.makedirs(fast5_dir, exist_ok=True)
+    labels = []
+    for batch, shard_labels in _run(simulator, n_reads, shard_size, output, fast5_dir,
+                                    workers, progress_callback):
+        labels += shard_labels
+    labels = pd.DataFrame(labels, columns=LABEL_COLUMNS)
+    feather.write_feather(labels, os.path.join(output, "labels.feather"))
+    return labels
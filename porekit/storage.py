@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Reading and writing collected metadata tables.
+
+Tables are stored as Feather files. The versions of the plugins a table was
+collected with are stored in the file's schema metadata, which lets
+`porekit collect --update` re-run only the plugins that changed.
+
+Large tables can instead be written as a Parquet dataset partitioned by run
+and hour (`write_metadata_dataset`). `load_metadata` reads either form, and
+for datasets only opens the partitions and row groups which can match its
+`filters`.
+"""
+import os
+import json
+
+
+VERSIONS_KEY = b"porekit_plugin_versions"
+
+# Written into the root of partitioned datasets
+DATASET_INFO_FILE = "_porekit_metadata.json"
+
+PARTITION_COLUMNS = ['channel_run_id', 'read_hour']
+
+# Rows per Parquet row group. Smaller groups prune better, larger ones read faster.
+ROW_GROUP_SIZE = 65536
+
+
+def write_metadata(df, path, versions=None):
+    """
+    Write a metadata DataFrame to a Feather file at `path`.
+
+    `versions` is a dictionary of plugin versions like returned by
+    `porekit.plugins.plugin_versions`.
+    """
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[VERSIONS_KEY] = json.dumps(versions or {}).encode("utf-8")
+    table = table.replace_schema_metadata(metadata)
+    feather.write_feather(table, path)
+
+
+def read_metadata(path):
+    """
+    Read a metadata table written by `write_metadata` or `porekit collect`.
+
+    Returns the DataFrame and the dictionary of plugin versions, which is
+    empty for tables written without version information. Partitioned
+    datasets are read completely.
+    """
+    if os.path.isdir(path):
+        return load_metadata(path), _read_dataset_info(path).get("versions", {})
+    import pyarrow.feather as feather
+    table = feather.read_table(path)
+    metadata = table.schema.metadata or {}
+    versions = json.loads(metadata.get(VERSIONS_KEY, b"{}").decode("utf-8"))
+    return table.to_pandas(), versions
+
+
+def read_hours(df):
+    """
+    Hour of the start of every read, counted from the start of the
+    experiment, from `read_start_time` and `channel_sampling_rate`.
+    """
+    import numpy as np
+    seconds = df['read_start_time'].astype(float) / df['channel_sampling_rate'].astype(float)
+    return np.floor(seconds / 3600).fillna(-1).astype("int32")
+
+
+def write_metadata_dataset(df, path, versions=None, row_group_size=ROW_GROUP_SIZE):
+    """
+    Write a metadata DataFrame as a Parquet dataset in the directory `path`,
+    partitioned by `channel_run_id` and the hour the read started in
+    (`read_hour`), like `path/channel_run_id=.../read_hour=3/part-0.parquet`.
+
+    Within a partition, rows are sorted by channel number, so row group
+    statistics let `load_metadata` skip groups when filtering by channel.
+    An existing dataset at `path` is replaced; any other existing file or
+    non-empty directory raises ValueError.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    df = df.copy()
+    df['channel_run_id'] = df['channel_run_id'].fillna("unknown").astype(str)
+    df['read_hour'] = read_hours(df)
+    sort_columns = [c for c in PARTITION_COLUMNS + ['channel_number', 'read_start_time']
+                    if c in df.columns]
+    df = df.sort_values(sort_columns, kind="mergesort").reset_index(drop=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    _remove_dataset(path)
+    partitioning = ds.partitioning(pa.schema([table.schema.field(c) for c in PARTITION_COLUMNS]),
+                                   flavor="hive")
+    ds.write_dataset(table, path, format="parquet", partitioning=partitioning,
+                     max_rows_per_group=row_group_size, min_rows_per_group=min(row_group_size, 1024),
+                     existing_data_behavior="overwrite_or_ignore")
+    info = {
+        "versions": versions or {},
+        "partitioning": [[name, str(table.schema.field(name).type)] for name in PARTITION_COLUMNS],
+        "columns": [name for name in df.columns if name != 'read_hour'],
+    }
+    with open(os.path.join(path, DATASET_INFO_FILE), "w") as f:
+        json.dump(info, f)
+
+
+def is_metadata_dataset(path):
+    """ True if `path` is a directory written by `write_metadata_dataset`. """
+    return os.path.isfile(os.path.join(path, DATASET_INFO_FILE))
+
+
+def _remove_dataset(path):
+    # Only the files a previous `write_metadata_dataset` wrote are removed,
+    # and only if `path` is such a dataset
+    import glob
+    if not os.path.exists(path):
+        return
+    if not os.path.isdir(path):
+        raise ValueError("%s exists and is not a metadata dataset directory" % path)
+    if not is_metadata_dataset(path):
+        if os.listdir(path):
+            raise ValueError("%s is a non-empty directory which is not a metadata dataset"
+                             % path)
+        return
+    for part in _dataset_files(path):
+        os.remove(part)
+        partition = os.path.dirname(part)
+        if not os.listdir(partition):
+            os.rmdir(partition)
+    for run in glob.glob(os.path.join(path, PARTITION_COLUMNS[0] + "=*")):
+        if not os.listdir(run):
+            os.rmdir(run)
+    os.remove(os.path.join(path, DATASET_INFO_FILE))
+
+
+def _dataset_files(path):
+    import glob
+    pattern = os.path.join(path, PARTITION_COLUMNS[0] + "=*", PARTITION_COLUMNS[1] + "=*",
+                           "*.parquet")
+    return sorted(glob.glob(pattern))
+
+
+def _read_dataset_info(path):
+    try:
+        with open(os.path.join(path, DATASET_INFO_FILE)) as f:
+            return json.load(f)
+    except OSError:
+        return {}
+
+
+def _filter_expression(filters):
+    import pyarrow.parquet as pq
+    if filters is None:
+        return None
+    if isinstance(filters, list):
+        return pq.filters_to_expression(filters)
+    return filters
+
+
+def load_metadata(path, columns=None, filters=None):
+    """
+    Load (part of) a metadata table as a DataFrame.
+
+    `path` is a Feather file written by `write_metadata` or a dataset
+    directory written by `write_metadata_dataset`. `columns` selects
+    columns. `filters` selects rows, either as a list of
+    `(column, operator, value)` tuples which all have to match (or a list
+    of such lists, any of which has to match), as for
+    `pyarrow.parquet.read_table`, or as a `pyarrow.dataset` expression.
+
+    For datasets, partitions and row groups which can't match the filters
+    are never read, so filtering by `channel_run_id`, `read_hour` or channel
+    number reads only a small part of a large dataset. The partition column
+    `read_hour` is only returned if it is asked for in `columns`.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    expression = _filter_expression(filters)
+    if os.path.isdir(path):
+        info = _read_dataset_info(path)
+        fields = [pa.field(name, pa.type_for_alias(type_name))
+                  for name, type_name in info.get("partitioning",
+                                                  [[c, "string"] for c in PARTITION_COLUMNS])]
+        # Only the partition files are part of the dataset, not other files
+        # users put into the directory
+        dataset = ds.dataset(_dataset_files(path), format="parquet",
+                             partitioning=ds.partitioning(pa.schema(fields), flavor="hive"),
+                             partition_base_dir=path)
+        if columns is None:
+            columns = info.get("columns") or [name for name in dataset.schema.names
+                                             if name != 'read_hour']
+    else:
+        dataset = ds.dataset(path, format="feather")
+    table = dataset.to_table(columns=columns, filter=expression)
+    return table.to_pandas()
@@ -1,18 +1,165 @@
 import io
-import Bio
+import numpy as np
+from h5py import h5a, h5o, h5t
 
 
 def b_to_str(v):
     return v.decode('ascii')
 
 
+def dataset_bytes(node):
+    """
+    Return the raw bytes stored in a dataset.
+
+    Works for scalar string datasets as written by the ONT software as well as
+    for the 1-d uint8 arrays `porekit repack` stores them as.
+    """
+    data = node[()]
+    if isinstance(data, bytes):
+        return data
+    return np.asarray(data).tobytes()
+
+
 def node_to_seq(node):
-    t = node.value.tobytes()
+    from Bio import SeqIO
+    t = dataset_bytes(node)
     f = io.BytesIO(t)
-    seqs = Bio.SeqIO.parse(f, "fastq-sanger")
+    seqs = SeqIO.parse(f, "fastq-sanger")
     return list(seqs)[0]
 
 
+def split_fastq(data):
+    """
+    Split a single FASTQ record into `(name, sequence, quality)` bytes.
+
+    `data` is the content of a `Fastq` dataset as str or bytes. This is much
+    cheaper than a full parser and enough for the one record per dataset
+    Fast5 files contain.
+    """
+    if isinstance(data, str):
+        data = data.encode("ascii")
+    header, sequence, plus, quality = data.split(b"\n", 4)[:4]
+    return header[1:].strip(), sequence.strip(), quality.strip()
+
+
+def mean_qscore(quality):
+    """ Mean Phred quality of a Sanger encoded quality string. """
+    scores = np.frombuffer(quality, dtype="uint8")
+    if len(scores) == 0:
+        return float("nan")
+    return float(scores.mean()) - 33
+
+
 def rename_key(d, key, new_name):
     d[new_name] = d[key]
     del d[key]
+
+
+# Memory dtype of attributes, keyed by everything that determines it for
+# integer, float and string file datatypes, plus the shape. Creating the
+# dtype of an attribute is the most expensive part of reading it, and the
+# same attributes are read from every file.
+_attribute_layouts = {}
+
+
+def _type_key(file_type):
+    # None for datatypes which aren't cached (compound, enum, array...)
+    type_class = file_type.get_class()
+    if type_class == h5t.INTEGER:
+        detail = (file_type.get_sign(), file_type.get_order())
+    elif type_class == h5t.FLOAT:
+        detail = (file_type.get_order(), file_type.get_fields())
+    elif type_class == h5t.STRING:
+        detail = (file_type.get_cset(), file_type.get_strpad(), file_type.is_variable_str())
+    else:
+        return None
+    return type_class, file_type.get_size(), detail
+
+
+def _attribute_layout(attr):
+    type_key = _type_key(attr.get_type())
+    if type_key is None:
+        return attr.dtype, attr.shape
+    key = (type_key, attr.shape)
+    layout = _attribute_layouts.get(key)
+    if layout is None:
+        layout = _attribute_layouts[key] = (attr.dtype, attr.shape)
+    return layout
+
+
+def read_attributes(loc_id, path, names):
+    """
+    Read the attributes `names` of the object at `path` in one pass.
+
+    Uses h5py's low level API, which avoids creating a high level object for
+    the node and a separate lookup for each `attrs[key]` access. `loc_id` is
+    the low level id of a file or group, `path` is relative to it. Strings
+    are returned as bytes, like h5py did for fixed length strings. Raises
+    KeyError for missing nodes and attributes.
+    """
+    oid = h5o.open(loc_id, path.encode("utf-8"))
+    values = {}
+    for name in names:
+        attr = h5a.open(oid, name.encode("utf-8"))
+        dtype, shape = _attribute_layout(attr)
+        data = np.empty(shape, dtype=dtype)
+        attr.read(data)
+        values[name] = data[()]
+    return values
+
+
+# Lookup table from ASCII code to 2-bit base code, -1 for anything else
+_BASE_CODES = np.full(256, -1, dtype="int8")
+for _code, _bases in enumerate(["Aa", "Cc", "Gg", "Tt"]):
+    for _base in _bases:
+        _BASE_CODES[ord(_base)] = _code
+
+
+def sequence_to_bytes(sequence):
+    """
+    Return the bases of `sequence` as a bytes object.
+
+    Accepts str, bytes, SciKit Bio sequences (anything with a `values` array)
+    and Biopython Seq/SeqRecord objects.
+    """
+    if isinstance(sequence, bytes):
+        return sequence
+    if isinstance(sequence, str):
+        return sequence.encode("ascii")
+    if hasattr(sequence, "values"):
+        return np.asarray(sequence.values).tobytes()
+    if hasattr(sequence, "seq"):
+        sequence = sequence.seq
+    return str(sequence).encode("ascii")
+
+
+def encode_bases(sequence):
+    """
+    Encode a sequence as an int8 array of 2-bit codes (A=0, C=1, G=2, T=3).
+
+    Bases other than ACGT are encoded as -1.
+    """
+    raw = np.frombuffer(sequence_to_bytes(sequence), dtype="uint8")
+    return _BASE_CODES[raw]
+
+
+def kmer_codes(sequence, k):
+    """
+    Return the integer code of every k-mer in `sequence`.
+
+    The code of a k-mer is its 2-bit encoding read as a base 4 number, so
+    codes sort in the same order as the k-mer strings. K-mers containing
+    anything other than ACGT get the code -1.
+    """
+    bases = encode_bases(sequence)
+    n = len(bases) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype="int64")
+    codes = np.zeros(n, dtype="int64")
+    invalid = np.zeros(n, dtype="bool")
+    for j in range(k):
+        window = bases[j:j + n]
+        codes = codes * 4 + window
+        invalid |= window < 0
+    codes[invalid] = -1
+    return codes
@@ -20,6 +20,7 @@ requirements = [
     'h5py',
     'requests',
     'feather-format',
+    'pyarrow',
     'biopython',
     'click',
 ]
@@ -30,6 +31,7 @@ test_requirements = [
     'h5py',
     'requests',
     'feather-format',
+    'pyarrow',
     'Click',
     'pytest',
 ]
@@ -49,6 +51,7 @@ setup(
                  'porekit'},
     include_package_data=True,
     install_requires=requirements,
+    python_requires='>=3.7',
     license="BSD",
     zip_safe=False,
     keywords='porekit, oxford, nanopore, minion',
@@ -57,7 +60,7 @@ setup(
         'Intended Audience :: Developers',
         'License :: OSI Approved :: BSD',
         'Natural Language :: English',
-        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3.7',
     ],
     entry_points='''
         [console_scripts]
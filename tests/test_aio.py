@@ -0,0 +1,70 @@
+import asyncio
+import pytest
+import porekit
+from porekit.aio import AsyncReader, aopen_fast5, aopen_fast5_files
+
+
+test_data_path = "tests/data/"
+
+
+def test_aopen_fast5_files_matches_sync():
+    expected = []
+    for fast5 in porekit.open_fast5_files(test_data_path):
+        expected.append((fast5.filename, fast5.get_read_id()))
+        fast5.close()
+
+    async def collect():
+        result = []
+        async with AsyncReader(max_workers=2, max_pending=2) as reader:
+            async for fast5 in aopen_fast5_files(test_data_path, reader=reader, prefetch=3):
+                async with fast5:
+                    result.append((fast5.filename, await fast5.get_read_id()))
+        return result
+
+    assert asyncio.run(collect()) == expected
+
+
+def test_concurrent_reads():
+    file_names = list(porekit.find_fast5_files(test_data_path))[:8]
+
+    async def read_all():
+        async with AsyncReader(max_workers=2, max_pending=3) as reader:
+            events = await asyncio.gather(*[reader.read_events(f) for f in file_names])
+            fast5 = await aopen_fast5(file_names[0], reader=reader)
+            async with fast5:
+                first = await fast5.get_events()
+                fastq = await fast5.get_fastq()
+        return events, first, fastq
+
+    events, first, fastq = asyncio.run(read_all())
+    for file_name, frame in zip(file_names, events):
+        with porekit.Fast5File(file_name) as fast5:
+            assert frame.equals(fast5.get_events())
+            if file_name == file_names[0]:
+                assert fastq == fast5.get_fastq()
+    assert first.equals(events[0])
+
+
+def test_reader_limits():
+    with pytest.raises(ValueError):
+        AsyncReader(max_workers=0)
+
+    async def count_running():
+        import threading
+        import time
+        lock = threading.Lock()
+        state = {"running": 0, "peak": 0}
+
+        def work():
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            time.sleep(0.01)
+            with lock:
+                state["running"] -= 1
+
+        async with AsyncReader(max_workers=8, max_pending=2) as reader:
+            await asyncio.gather(*[reader.run(work) for i in range(10)])
+        return state["peak"]
+
+    assert asyncio.run(count_running()) <= 2
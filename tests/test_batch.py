@@ -0,0 +1,57 @@
+import numpy as np
+import porekit
+from porekit.batch import EventBatch, read_event_batch
+
+
+test_data_path = "tests/data/"
+
+
+def small_batch():
+    dtype = [("start", "float64"), ("length", "float64"), ("mean", "float64"), ("stdv", "float64")]
+    a = np.zeros(3, dtype=dtype)
+    a["mean"] = [1, 2, 3]
+    a["start"] = [0, 1, 2]
+    a["length"] = 1
+    b = np.zeros(0, dtype=dtype)
+    c = np.zeros(2, dtype=dtype)
+    c["mean"] = [10, 20]
+    return EventBatch.from_arrays([a, b, c], [b"a", b"b", b"c"])
+
+
+def test_views_and_reductions():
+    batch = small_batch()
+    assert len(batch) == 3
+    assert list(batch.lengths) == [3, 0, 2]
+    view = batch["c"]
+    assert np.shares_memory(view, batch.events)
+    assert list(view["mean"]) == [10, 20]
+    assert list(batch.sum("mean")) == [6, 0, 30]
+    assert np.allclose(batch.mean("mean"), [2, np.nan, 15], equal_nan=True)
+    assert np.allclose(batch.max("mean"), [3, np.nan, 20], equal_nan=True)
+    assert np.allclose(batch.std("mean")[[0, 2]], [np.std([1, 2, 3]), 5])
+    assert batch.durations()[0] == 3
+
+
+def test_save_load(tmpdir):
+    batch = EventBatch.concatenate([small_batch(), small_batch()])
+    assert len(batch) == 6
+    path = str(tmpdir.join("events.pkev"))
+    batch.save(path)
+    loaded = EventBatch.load(path)
+    assert isinstance(loaded.events, np.memmap)
+    assert np.array_equal(loaded.events, batch.events)
+    assert np.array_equal(loaded.offsets, batch.offsets)
+    assert list(loaded.read_ids) == list(batch.read_ids)
+    assert np.array_equal(EventBatch.load(path, mmap=False)[4]["mean"], batch[4]["mean"])
+
+
+def test_read_event_batch():
+    file_names = sorted(porekit.find_fast5_files(test_data_path))[:10]
+    batch = read_event_batch(file_names, workers=2)
+    assert len(batch) == 10
+    for file_name in file_names[:3]:
+        with porekit.Fast5File(file_name) as fast5:
+            events = fast5.get_events()
+            read = batch[fast5.get_read_id()]
+        assert np.allclose(read["mean"], events["mean"])
+        assert np.allclose(read["start"], events["start"])
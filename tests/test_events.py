@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+import porekit
+
+
+test_data_path = "tests/data/"
+
+
+def test_events_time_window():
+    for fast5 in porekit.open_fast5_files(test_data_path):
+        try:
+            events = fast5.get_events()
+            scale = fast5.get_event_time_scale()
+            seconds = (events.start - events.start.iloc[0]) / scale
+            for start, end in [(None, 2.0), (1.0, 3.5), (5.0, None), (1000.0, None)]:
+                window = fast5.get_events(start, end)
+                mask = np.ones(len(events), dtype=bool)
+                if start is not None:
+                    mask &= seconds.values >= start
+                if end is not None:
+                    mask &= seconds.values < end
+                expected = events[mask]
+                assert list(window.index) == list(expected.index)
+                assert np.all(window.values == expected.values)
+        finally:
+            fast5.close()
+
+
+def test_events_by_index():
+    fast5 = porekit.Fast5File(test_data_path + "2016_3_4_3507_1_ch120_read635_strand.fast5")
+    try:
+        events = fast5.get_events()
+        window = fast5.get_events_by_index(100, 200)
+        assert list(window.index) == list(range(100, 200))
+        assert np.all(window.values == events.iloc[100:200].values)
+        assert len(fast5.get_events_by_index(-10)) == 10
+        assert len(fast5.get_events_by_index(200, 100)) == 0
+    finally:
+        fast5.close()
@@ -0,0 +1,35 @@
+import glob
+import os
+import numpy as np
+import pyarrow.parquet as pq
+import porekit
+from porekit.export import export_events, load_events
+
+
+test_data_path = "tests/data/"
+
+
+def test_export_events(tmpdir):
+    file_names = sorted(porekit.find_fast5_files(test_data_path))[:12]
+    output = str(tmpdir.join("events"))
+    reads, events = export_events(file_names, output, workers=2, row_group_size=1000)
+    assert reads == len(file_names)
+
+    for part in glob.glob(os.path.join(output, "*.parquet")):
+        metadata = pq.ParquetFile(part).metadata
+        sizes = [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)]
+        assert all(size == 1000 for size in sizes[:-1])
+
+    df = load_events(output)
+    assert len(df) == events
+    with porekit.Fast5File(file_names[3]) as fast5:
+        read_id = fast5.get_read_id()
+        channel = fast5.get_channel_info()["channel_number"]
+        expected = fast5.get_events()
+    selected = load_events(output, columns=["channel", "mean"], filters=[("read_id", "=", read_id)])
+    assert (selected.channel == channel).all()
+    assert np.array_equal(selected["mean"].values, expected["mean"].values)
+
+    # A second export replaces the first
+    export_events(file_names[:2], output)
+    assert load_events(output, columns=["read_id"]).read_id.nunique() == 2
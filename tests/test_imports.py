@@ -0,0 +1,55 @@
+import subprocess
+import sys
+import pytest
+
+
+# Wall clock budget for `import porekit` in a fresh interpreter, in seconds.
+# The heavy dependencies are loaded lazily, so the real cost is far below
+# this; the budget is generous to keep the test stable on slow machines.
+IMPORT_TIME_BUDGET = 0.25
+
+HEAVY_MODULES = ['pandas', 'h5py', 'Bio', 'matplotlib']
+
+
+def run_python(code):
+    output = subprocess.check_output([sys.executable, "-c", code])
+    return output.decode("ascii").strip()
+
+
+def test_import_is_lazy():
+    code = ("import sys, porekit, porekit.scripts.main;"
+            "print(','.join(m for m in %r if m in sys.modules))" % HEAVY_MODULES)
+    assert run_python(code) == ""
+
+
+def test_attribute_access_loads_module():
+    code = ("import sys, porekit;"
+            "porekit.gather_metadata;"
+            "print('h5py' in sys.modules, 'matplotlib' in sys.modules)")
+    assert run_python(code) == "True False"
+
+
+def test_import_time_budget():
+    code = ("import time; t = time.perf_counter(); import porekit;"
+            "print(time.perf_counter() - t)")
+    timings = [float(run_python(code)) for i in range(3)]
+    assert min(timings) < IMPORT_TIME_BUDGET
+
+
+def test_public_api():
+    import porekit
+    for name in ['Fast5File', 'gather_metadata', 'open_fast5_files', 'plots',
+                 'plugins', 'repack']:
+        assert name in dir(porekit)
+        assert getattr(porekit, name) is not None
+    assert callable(porekit.repack)
+    with pytest.raises(AttributeError):
+        porekit.does_not_exist
+
+
+def test_attributes_are_not_shadowed_by_submodules():
+    import porekit
+    assert not set(porekit._attributes) & set(porekit._submodules)
+    code = ("import porekit, porekit.packing;"
+            "print(callable(porekit.repack), porekit.repack is porekit.packing.repack)")
+    assert run_python(code) == "True True"
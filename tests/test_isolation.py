@@ -0,0 +1,108 @@
+import os
+import time
+import shutil
+import pytest
+import porekit
+from porekit import plugins
+from porekit.isolation import Quarantine
+
+
+test_data_path = "tests/data/"
+
+
+class Faulty(plugins.Read):
+    """ Hangs, crashes or fails on the files named in the class attributes. """
+    hang = crash = fail = None
+
+    def run_on_fast5(self, fast5):
+        name = os.path.basename(fast5.filename)
+        if name == Faulty.hang:
+            time.sleep(60)
+        if name == Faulty.crash:
+            os._exit(3)
+        if name == Faulty.fail:
+            raise ValueError("broken read")
+        return super().run_on_fast5(fast5)
+
+
+@pytest.fixture
+def files(tmpdir):
+    names = sorted(os.listdir(test_data_path))
+    names = [name for name in names if name.endswith(".fast5")][:6]
+    for name in names:
+        shutil.copy(os.path.join(test_data_path, name), str(tmpdir))
+    with open(str(tmpdir.join("truncated.fast5")), "wb") as f:
+        with open(os.path.join(test_data_path, names[0]), "rb") as source:
+            f.write(source.read(1000))
+    Faulty.hang, Faulty.crash, Faulty.fail = names[1], names[2], names[3]
+    yield str(tmpdir), names
+    Faulty.hang = Faulty.crash = Faulty.fail = None
+
+
+def test_timeout_crash_and_quarantine(files):
+    path, names = files
+    quarantine_file = os.path.join(path, "quarantine.json")
+    t = time.monotonic()
+    df = porekit.gather_metadata(path, workers=2, plugins=[plugins.Channel(), Faulty()],
+                                 timeout=2, quarantine=quarantine_file)
+    assert time.monotonic() - t < 30
+    assert len(df) == len(names) + 1
+
+    errors = porekit.porekit.metadata_errors(df).set_index("absolute_filename")
+    stages = {os.path.basename(f): stage for f, stage in errors.stage.items()}
+    assert stages == {names[1]: "timeout", names[2]: "crash", names[3]: "read",
+                      "truncated.fast5": "open"}
+    ok = df[df.errors.isnull()]
+    assert ok.read_id.notnull().all() and len(ok) == len(names) - 3
+
+    quarantine = Quarantine(quarantine_file)
+    assert sorted(os.path.basename(f) for f in quarantine.entries) == \
+        sorted([names[1], names[2], "truncated.fast5"])
+
+    # Quarantined files are skipped until they change
+    Faulty.hang = Faulty.crash = None
+    again = porekit.gather_metadata(path, plugins=[plugins.Channel(), Faulty()],
+                                    quarantine=quarantine_file)
+    assert len(again) == len(names) - 2
+    shutil.copy(os.path.join(test_data_path, names[1]), path)
+    again = porekit.gather_metadata(path, plugins=[plugins.Channel(), Faulty()],
+                                    quarantine=quarantine_file)
+    assert len(again) == len(names) - 1
+    assert len(Quarantine(quarantine_file)) == 2
+
+
+def test_plugin_errors_are_recorded():
+    class Failing(plugins.Read):
+        def run_on_fast5(self, fast5):
+            raise KeyError("Events")
+
+    df = porekit.gather_metadata(test_data_path, plugins=[plugins.Channel(), Failing()])
+    errors = porekit.porekit.metadata_errors(df)
+    assert len(errors) == len(df)
+    assert (errors.stage == "read").all() and (errors.type == "KeyError").all()
+    with pytest.raises(KeyError):
+        porekit.gather_metadata(test_data_path, plugins=[Failing()], raise_errors=True)
+
+
+def test_unexpected_errors_are_recorded(files, monkeypatch):
+    path, names = files
+    original = porekit.porekit.get_fast5_metadata
+
+    def broken(fast5, file_name, *args, **kwargs):
+        if os.path.basename(file_name) == names[0]:
+            raise RuntimeError("index out of bound")
+        return original(fast5, file_name, *args, **kwargs)
+
+    monkeypatch.setattr(porekit.porekit, "get_fast5_metadata", broken)
+    for kwargs in [{}, {"workers": 2, "timeout": 5}]:
+        quarantine = Quarantine()
+        df = porekit.gather_metadata(path, plugins=[plugins.Channel()], quarantine=quarantine,
+                                     **kwargs)
+        assert len(df) == len(names) + 1
+        errors = porekit.porekit.metadata_errors(df)
+        failed = errors[errors.type == "RuntimeError"]
+        assert [os.path.basename(f) for f in failed.absolute_filename] == [names[0]]
+        assert (failed.stage == "file").all()
+        assert os.path.join(path, names[0]) in quarantine.entries
+    with pytest.raises(RuntimeError):
+        porekit.gather_metadata(path, plugins=[plugins.Channel()], raise_errors=True)
@@ -0,0 +1,70 @@
+import numpy as np
+import porekit
+from porekit.kmers import KmerCounts, count_fast5, count_kmers
+
+
+test_data_path = "tests/data/"
+test_file = test_data_path + "2016_3_4_3507_1_ch120_read635_strand.fast5"
+
+
+def test_counts_small():
+    counts = KmerCounts(2).add_sequences([b"AACCGT", b"", b"GGGNTT"])
+    kmers = dict(zip(counts.kmer_strings(), counts.kmers))
+    assert kmers[b"AA"] == 1 and kmers[b"GG"] == 2 and kmers[b"TT"] == 1
+    assert counts.kmers.sum() == 5 + 3
+    assert list(counts.bases) == [2, 2, 4, 3, 1]
+    assert counts.reads == 2
+    assert counts.homopolymers[2, 3] == 1   # GGG
+    assert counts.homopolymers[0, 2] == 1   # AA
+    assert list(np.flatnonzero(counts.gc_histogram)) == [50, 60]
+
+
+def test_merge_and_save(tmpdir):
+    a = KmerCounts(3).add_sequences([b"ACGTACGT"])
+    b = KmerCounts(3).add_sequences([b"TTTTGA"])
+    both = KmerCounts(3).add_sequences([b"ACGTACGT", b"TTTTGA"])
+    merged = a + b
+    assert np.array_equal(merged.kmers, both.kmers)
+    assert np.array_equal(merged.homopolymers, both.homopolymers)
+    path = str(tmpdir.join("counts.npz"))
+    merged.save(path)
+    loaded = KmerCounts.load(path)
+    assert loaded.k == 3 and loaded.reads == 2
+    assert np.array_equal(loaded.kmers, merged.kmers)
+
+
+def test_count_files():
+    file_names = sorted(porekit.find_fast5_files(test_data_path))
+    single = count_kmers(file_names, k=4)
+    parallel = count_kmers(file_names, k=4, workers=2)
+    assert np.array_equal(single.kmers, parallel.kmers)
+    assert np.array_equal(single.gc_histogram, parallel.gc_histogram)
+    with porekit.Fast5File(test_file) as fast5:
+        one = count_fast5(fast5, k=4, strands=['template'])
+        assert one.bases.sum() == len(fast5.get_template_fastq().split("\n")[1])
+
+
+def test_complement_from_1d_basecall():
+    from porekit.kmers import read_basecalls
+    plugin = porekit.plugins.Basecall()
+    with porekit.Fast5File(test_file) as fast5:
+        expected = plugin.run_on_fast5(fast5)
+        sequences = read_basecalls(fast5, strands=['complement'])
+        assert [len(s) for s in sequences] == [expected['complement_length']]
+        assert len(read_basecalls(fast5)) == 3
+
+
+def test_failed_files_are_counted(tmpdir):
+    import shutil
+    import h5py
+    broken = str(tmpdir.join("broken.fast5"))
+    shutil.copy(test_file, broken)
+    with h5py.File(broken, "r+") as f:
+        path = "Analyses/Basecall_1D_000/BaseCalled_template/Fastq"
+        del f[path]
+        f[path] = "not a fastq record"
+    missing = str(tmpdir.join("missing.fast5"))
+    counts = count_kmers([test_file, broken, missing], k=3)
+    assert counts.failed_files == 2
+    with porekit.Fast5File(test_file) as fast5:
+        assert counts.reads == len(porekit.kmers.read_basecalls(fast5))
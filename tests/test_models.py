@@ -0,0 +1,151 @@
+import numpy as np
+import pytest
+import porekit
+from porekit.models import ModelRegistry, registry
+
+
+test_data_path = "tests/data/"
+
+
+def test_models_are_deduplicated():
+    models = ModelRegistry()
+    found = []
+    for fast5 in porekit.open_fast5_files(test_data_path):
+        try:
+            found.append(fast5.get_kmer_model(registry=models))
+        except KeyError:
+            pass
+        finally:
+            fast5.close()
+    assert len(found) > len(models)
+    assert len(set(id(model) for model in found)) == len(models)
+
+
+def test_get_model_frame():
+    fast5 = porekit.Fast5File(test_data_path + "2016_3_4_3507_1_ch120_read635_strand.fast5")
+    try:
+        model = fast5.get_model()
+        assert model.index[0] == b"AAAAAA"
+        assert list(model.columns[:3]) == ["kmer", "level_mean", "level_stdv"]
+        assert fast5.get_kmer_model().digest in registry
+    finally:
+        fast5.close()
+
+
+def test_make_squiggle():
+    fast5 = porekit.Fast5File(test_data_path + "2016_3_4_3507_1_ch120_read635_strand.fast5")
+    try:
+        model = fast5.get_model()
+    finally:
+        fast5.close()
+    sequence = "ACGTTGCAAGGCTTACCAGT"
+    np.random.seed(1)
+    squiggle = porekit.make_squiggle(sequence, model, std_multiplier=0.0)
+    assert len(squiggle) == len(sequence) - 6
+    for i, level in enumerate(squiggle):
+        assert level == model.loc[sequence[i:i + 6].encode("ascii")].level_mean
+    with pytest.raises(KeyError):
+        porekit.make_squiggle("ACGTTGCANGGCTT", model)
+
+
+def test_save_and_load(tmpdir):
+    models = ModelRegistry()
+    fast5 = porekit.Fast5File(test_data_path + "2016_3_4_3507_1_ch120_read635_strand.fast5")
+    try:
+        model = fast5.get_kmer_model(registry=models)
+    finally:
+        fast5.close()
+    file_name = str(tmpdir.join("models.npz"))
+    models.save(file_name)
+    loaded = ModelRegistry()
+    assert [m.digest for m in loaded.load(file_name)] == [model.digest]
+    assert np.all(loaded.get(model.digest).level_mean == model.level_mean)
+
+
+def test_models_differing_anywhere_are_distinct(tmpdir):
+    import shutil
+    import h5py
+    source = test_data_path + "2016_3_4_3507_1_ch120_read635_strand.fast5"
+    changed = {}
+    for field in ["level_mean", "sd_mean", "weight"]:
+        file_name = str(tmpdir.join(field + ".fast5"))
+        shutil.copy(source, file_name)
+        with porekit.Fast5File(file_name, "r+") as fast5:
+            node = fast5.get_model_node()
+            records = node[:]
+            records[field][1] += 25.0
+            node[...] = records
+        changed[field] = file_name
+
+    models = ModelRegistry()
+    with porekit.Fast5File(source) as fast5:
+        original = fast5.get_kmer_model(registry=models)
+    for field, file_name in changed.items():
+        with porekit.Fast5File(file_name) as fast5:
+            model = fast5.get_kmer_model(registry=models)
+            expected = fast5.get_model_node()[field][1]
+        assert model is not original
+        assert model.records[field][1] == expected
+    assert len(models) == 4
+
+
+def count_dataset_reads(monkeypatch):
+    import h5py
+    reads = []
+    original = h5py.Dataset.__getitem__
+
+    def counting_getitem(self, args, *rest):
+        if self.name.endswith("/Model"):
+            reads.append(self.name)
+        return original(self, args, *rest)
+
+    monkeypatch.setattr(h5py.Dataset, "__getitem__", counting_getitem)
+    return reads
+
+
+def test_known_models_are_not_read_again(monkeypatch):
+    models = ModelRegistry()
+    reads = count_dataset_reads(monkeypatch)
+    with porekit.Fast5File(test_data_path + "2016_3_4_3507_1_ch120_read635_strand.fast5") as fast5:
+        first = fast5.get_kmer_model(registry=models)
+        assert fast5.get_kmer_model(registry=models) is first
+    with porekit.Fast5File(test_data_path + "2016_3_4_3507_1_ch120_read635_strand.fast5") as fast5:
+        assert fast5.get_kmer_model(registry=models) is first
+    assert len(reads) == 1
+
+
+def test_packed_models_are_found_by_digest(tmpdir, monkeypatch):
+    packed = str(tmpdir)
+    container_name, = porekit.repack(test_data_path, packed)
+    models = ModelRegistry()
+    with porekit.Fast5Container(container_name) as container:
+        reads = count_dataset_reads(monkeypatch)
+        found = []
+        for read in container:
+            try:
+                found.append(read.get_kmer_model(registry=models))
+            except KeyError:
+                pass
+    assert len(found) > len(models)
+    assert len(reads) == len(models)
+
+
+def test_digest_of_string_columns():
+    records = np.array([(b"AAAAAA", 50.0, 1.0, "x")],
+                       dtype=[("kmer", "S6"), ("level_mean", "f8"), ("level_stdv", "f8"),
+                              ("label", "U4")])
+    other = records.copy()
+    other["label"] = "y"
+    assert porekit.models.model_digest(records) != porekit.models.model_digest(other)
+
+
+def test_conversions_are_not_registered():
+    import pandas as pd
+    from porekit.models import as_kmer_model
+    frame = pd.DataFrame({"kmer": [b"AA", b"AC"], "level_mean": [50.0, 60.0],
+                          "level_stdv": [1.0, 1.5]})
+    before = len(registry)
+    model = as_kmer_model(frame)
+    assert as_kmer_model(frame) is model
+    assert model.digest not in registry
+    assert len(registry) == before
@@ -37,3 +37,67 @@ def test_all_plugins_basic():
        for file_name in os.listdir("tests/data"):
            result = check_plugin_default(plugin_class, "tests/data/"+file_name)
 
+
+def test_bulk_attributes_match_attrs():
+    fast5 = porekit.Fast5File("tests/data/2016_3_4_3507_1_ch120_read635_strand.fast5")
+    try:
+        attrs = fast5['UniqueGlobalKey/tracking_id'].attrs
+        bulk = fast5.get_attributes('tracking', ['run_id', 'asic_temp'])
+        assert bulk['run_id'].decode('ascii') == attrs['run_id']
+        assert bulk['asic_temp'].decode('ascii') == attrs['asic_temp']
+        read = fast5.get_attributes('read', ['read_number', 'read_id'])
+        assert read['read_number'] == fast5.get_read_node().attrs['read_number']
+        assert read['read_id'] == fast5.get_read_node().attrs['read_id']
+        with pytest.raises(KeyError):
+            fast5.get_attributes('channel', ['does_not_exist'])
+    finally:
+        fast5.close()
+
+
+def test_empty_reads_group(tmpdir):
+    import shutil
+    import h5py
+    file_name = str(tmpdir.join("empty_reads.fast5"))
+    shutil.copy("tests/data/2016_3_4_3507_1_ch120_read635_strand.fast5", file_name)
+    with h5py.File(file_name, "r+") as f:
+        reads = f["Analyses/EventDetection_000/Reads"]
+        for key in list(reads.keys()):
+            del reads[key]
+
+    with porekit.Fast5File(file_name) as fast5:
+        with pytest.raises(KeyError):
+            fast5.get_read_node_path()
+        with pytest.raises(KeyError):
+            fast5.get_read_id()
+
+    record = porekit.get_fast5_file_metadata(file_name)
+    assert record["channel_number"] == 120
+    assert "read_id" not in record
+    df = porekit.gather_metadata(str(tmpdir))
+    assert len(df) == 1 and df.channel_number.iloc[0] == 120
+
+
+def test_bulk_attributes_distinguish_types(tmpdir):
+    import h5py
+    import numpy as np
+    from porekit.utils import read_attributes
+    file_name = str(tmpdir.join("types.h5"))
+    with h5py.File(file_name, "w") as f:
+        node = f.create_group("node")
+        node.attrs.create("signed", -5, dtype="<i4")
+        node.attrs.create("unsigned", 4000000000, dtype="<u4")
+        node.attrs.create("big_endian", 7, dtype=">i4")
+        node.attrs.create("ascii", np.bytes_("ab"))
+        node.attrs.create("utf8", "é".encode("utf-8"), dtype=h5py.string_dtype("utf-8", 2))
+        node.attrs.create("pair", [1, 2], dtype="<i4")
+    with h5py.File(file_name, "r") as f:
+        for names in [["signed", "unsigned", "big_endian", "pair"],
+                      ["unsigned", "signed", "pair", "big_endian"]]:
+            values = read_attributes(f.id, "node", names)
+            assert values["signed"] == -5
+            assert values["unsigned"] == 4000000000
+            assert values["big_endian"] == 7
+            assert list(values["pair"]) == [1, 2]
+        values = read_attributes(f.id, "node", ["ascii", "utf8"])
+        assert values["ascii"] == b"ab"
+        assert values["utf8"] == "é".encode("utf-8")
@@ -0,0 +1,42 @@
+import pytest
+import porekit
+from porekit.profiles import OpenProfile, PROFILES, get_profile, set_default_profile, benchmark_profiles
+
+
+test_data_path = "tests/data/"
+test_file = test_data_path + "2016_3_4_3507_1_ch120_read635_strand.fast5"
+
+
+def test_profile_kwargs():
+    assert PROFILES["default"].kwargs() == {}
+    assert PROFILES["core"].kwargs() == {"driver": "core", "backing_store": False, "locking": False}
+    assert "backing_store" not in PROFILES["core"].kwargs(mode="a")
+    with pytest.raises(ValueError):
+        get_profile("no-such-profile")
+
+
+def test_open_with_profiles():
+    for name in PROFILES:
+        with porekit.open_fast5(test_file, profile=name) as fast5:
+            assert fast5.driver == (PROFILES[name].driver or "sec2")
+            assert len(fast5.get_events()) > 0
+    profile = OpenProfile(rdcc_nbytes=8 << 20)
+    with porekit.Fast5File(test_file, profile=profile) as fast5:
+        assert fast5.id.get_access_plist().get_cache()[2] == 8 << 20
+
+
+def test_default_profile_and_metadata():
+    old = set_default_profile("core")
+    try:
+        with porekit.open_fast5(test_file) as fast5:
+            assert fast5.driver == "core"
+        df = porekit.gather_metadata(test_data_path, workers=2)
+        assert len(df) > 0
+    finally:
+        set_default_profile(old)
+
+
+def test_benchmark_profiles():
+    results = benchmark_profiles([test_file], profiles=["default", "core"], repeat=1)
+    assert sorted(name for name, seconds in results) == ["core", "default"]
+    assert results[0][1] <= results[1][1]
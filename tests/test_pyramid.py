@@ -0,0 +1,100 @@
+import os
+import shutil
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+import porekit
+from porekit.pyramid import SignalPyramid, events_pyramid, pyramid_cache_name
+
+
+test_data_path = "tests/data/"
+test_file = test_data_path + "2016_3_4_3507_1_ch120_read635_strand.fast5"
+
+
+def test_pyramid_levels():
+    rng = np.random.RandomState(1)
+    values = rng.normal(size=1001)
+    pyramid = SignalPyramid(np.arange(1001) * 0.5, values, factor=4)
+    level = pyramid.levels[2]
+    for i in [0, 7, len(level['time']) - 1]:
+        chunk = values[i * 16:(i + 1) * 16]
+        assert level['min'][i] == chunk.min()
+        assert level['max'][i] == chunk.max()
+        assert np.isclose(level['sum'][i] / level['count'][i], chunk.mean())
+    assert len(pyramid.levels[-1]['time']) == 1
+    assert pyramid.levels[-1]['count'][0] == 1001
+
+
+def test_pyramid_window_size():
+    pyramid = SignalPyramid(np.arange(100000), np.zeros(100000), factor=4)
+    for start, end in [(None, None), (1000, 60000), (500, 900)]:
+        level, time, low, high, mean = pyramid.window(start, end, width=200)
+        assert len(time) <= 4 * 200 + 2
+        if end is not None and end - start >= 200:
+            assert len(time) >= 200
+    assert pyramid.window(10, 20, width=200)[0] == 0
+
+
+def test_pyramid_cache(tmpdir):
+    file_name = str(tmpdir.join("read.fast5"))
+    shutil.copy(test_file, file_name)
+    with porekit.Fast5File(file_name) as fast5:
+        pyramid = events_pyramid(fast5, cache=True)
+        cache_name = pyramid_cache_name(fast5)
+        assert os.path.exists(cache_name)
+        cached = events_pyramid(fast5, cache=True)
+        assert len(cached.levels) == len(pyramid.levels)
+        assert np.all(cached.levels[3]['max'] == pyramid.levels[3]['max'])
+        assert len(pyramid) == len(fast5.get_events())
+
+
+def test_squiggle_dots_pyramid():
+    import matplotlib.pyplot as plt
+    f, ax = porekit.plots.squiggle_dots(test_file, pyramid=True)
+    view = ax.pyramid_view
+    full_level = view.level
+    assert full_level > 0
+    ax.set_xlim(1.0, 1.05)
+    assert view.level < full_level
+    plt.close(f)
+
+
+def test_windowed_pyramid_reads_only_the_window(monkeypatch):
+    import matplotlib.pyplot as plt
+    with porekit.Fast5File(test_file) as fast5:
+        full = events_pyramid(fast5)
+        start_index, end_index = fast5.find_event_range(2.0, 4.0)
+        window = events_pyramid(fast5, start=2.0, end=4.0)
+    assert len(window) == end_index - start_index < len(full)
+    level_0 = full.levels[0]
+    assert np.allclose(window.levels[0]['time'], level_0['time'][start_index:end_index])
+
+    requested = []
+    get_events = porekit.porekit.Fast5Base.get_events
+
+    def recording_get_events(self, start=None, end=None):
+        requested.append((start, end))
+        return get_events(self, start, end)
+
+    monkeypatch.setattr(porekit.porekit.Fast5Base, "get_events", recording_get_events)
+    f, ax = porekit.plots.squiggle_dots(test_file, start=2.0, end=4.0, pyramid=True)
+    assert requested == [(2.0, 4.0)]
+    low, high = ax.get_xlim()
+    assert 2.0 <= low and high < 4.0
+    plt.close(f)
+
+
+def test_squiggle_dots_window_with_cache(tmpdir):
+    import shutil
+    import matplotlib.pyplot as plt
+    file_name = str(tmpdir.join("read.fast5"))
+    shutil.copy(test_file, file_name)
+    with porekit.Fast5File(file_name) as fast5:
+        start_index, end_index = fast5.find_event_range(2.0, 4.0)
+        expected = fast5.get_events(2.0, 4.0)["mean"].values
+    for cache in [False, True, True]:
+        f, ax = porekit.plots.squiggle_dots(file_name, start=2.0, end=4.0, pyramid=True, cache=cache)
+        drawn = ax.collections[0].get_offsets()
+        assert len(drawn) == end_index - start_index
+        assert np.allclose(np.asarray(drawn)[:, 1], expected)
+        plt.close(f)
@@ -0,0 +1,113 @@
+import os
+import numpy as np
+import pytest
+import porekit
+
+
+test_data_path = "tests/data/"
+
+
+@pytest.fixture(scope="module")
+def packed_path(tmpdir_factory):
+    path = str(tmpdir_factory.mktemp("packed"))
+    porekit.repack(test_data_path, path, reads_per_container=30)
+    return path
+
+
+def test_containers_written(packed_path):
+    containers = sorted(porekit.find_fast5_containers(packed_path))
+    assert len(containers) == 3
+    total = 0
+    for name in containers:
+        with porekit.Fast5Container(name) as container:
+            total += len(container)
+    assert total == len(list(porekit.open_fast5_files(test_data_path)))
+
+
+def test_open_packed_reads(packed_path):
+    originals = {os.path.split(f)[-1]: f for f in porekit.find_fast5_files(test_data_path)}
+    for read in porekit.open_fast5_files(packed_path):
+        original = porekit.Fast5File(originals[read.original_filename])
+        try:
+            assert read.get_read_id() == original.get_read_id()
+            assert read.get_fastq() == original.get_fastq()
+            assert np.all(read.get_events().values == original.get_events().values)
+        finally:
+            original.close()
+            read.close()
+
+
+def test_gather_metadata_from_containers(packed_path):
+    df1 = porekit.gather_metadata(test_data_path)
+    df2 = porekit.gather_metadata(packed_path)
+    assert df1.shape == df2.shape
+    assert sorted(df1.filename) == sorted(df2.filename)
+    fast5 = porekit.open_fast5(df2.absolute_filename.iloc[0])
+    assert isinstance(fast5, porekit.PackedFast5Read)
+    fast5.close()
+
+
+def test_repack_with_workers(tmpdir):
+    containers = porekit.repack(test_data_path, str(tmpdir), reads_per_container=30, workers=2)
+    assert [os.path.basename(name) for name in containers] == \
+        ["data_%04d.fast5pack" % i for i in range(3)]
+    total = 0
+    for name in containers:
+        with porekit.Fast5Container(name) as container:
+            total += len(container)
+    assert total == len(list(porekit.open_fast5_files(test_data_path)))
+
+
+def test_stale_packed_reads(tmpdir):
+    import shutil
+    source = tmpdir.mkdir("source")
+    names = sorted(porekit.find_fast5_files(test_data_path))[:2]
+    for name in names:
+        shutil.copy(name, str(source))
+    packed = str(tmpdir.mkdir("packed"))
+    container_name, = porekit.repack(str(source), packed)
+    references = list(porekit.find_fast5_references(packed))
+    assert len(references) == 2
+
+    # Rewrite the first source file
+    changed = str(source.join(os.path.basename(names[0])))
+    stat = os.stat(changed)
+    os.utime(changed, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    with pytest.raises(porekit.StalePackedReadError):
+        porekit.open_fast5(references[0], check_stale=True)
+    porekit.open_fast5(references[1], check_stale=True).close()
+    assert [read.original_filename for read in porekit.open_fast5_files(packed, check_stale=True)] == \
+        [os.path.basename(names[1])]
+
+    # Without checking, the sources are never looked at
+    porekit.open_fast5(references[0]).close()
+    assert len(list(porekit.open_fast5_files(packed))) == 2
+
+    # Without the source, the packed copy is all there is
+    os.remove(changed)
+    porekit.open_fast5(references[0], check_stale=True).close()
+
+
+def test_container_checks_sources_once(tmpdir, monkeypatch):
+    import shutil
+    source = tmpdir.mkdir("source")
+    for name in sorted(porekit.find_fast5_files(test_data_path))[:3]:
+        shutil.copy(name, str(source))
+    packed = str(tmpdir.mkdir("packed"))
+    container_name, = porekit.repack(str(source), packed)
+    stats = []
+    real_stat = os.stat
+
+    def counting_stat(path, *args, **kwargs):
+        if str(path).startswith(str(source)):
+            stats.append(path)
+        return real_stat(path, *args, **kwargs)
+
+    monkeypatch.setattr(os, "stat", counting_stat)
+    with porekit.Fast5Container(container_name) as container:
+        assert len(list(container)) == 3
+    assert stats == []
+    with porekit.Fast5Container(container_name, check_stale=True) as container:
+        assert len(list(container)) == 3
+        assert len(list(container)) == 3
+    assert len(stats) == 3
@@ -0,0 +1,41 @@
+import os
+import pytest
+import porekit
+from porekit.report import report, split_runs, PLOTS
+
+
+test_data_path = "tests/data/"
+
+
+@pytest.fixture(scope="module")
+def metadata():
+    return porekit.gather_metadata(test_data_path)
+
+
+def test_split_runs(metadata):
+    runs = dict(split_runs(metadata))
+    assert len(runs) == metadata.channel_run_id.nunique()
+    frame = next(iter(runs.values()))
+    assert "template_length" in frame.columns
+    assert frame.read_end_time.is_monotonic_increasing
+
+
+def test_report_cached(metadata, tmpdir):
+    output = str(tmpdir.join("report"))
+    subset = metadata[metadata.channel_run_id.isin(metadata.channel_run_id.unique()[:2])]
+    results = report(subset, output, formats=("png", "svg"), workers=2)
+    assert len(results) == 2
+    for run_id, (file_names, errors) in results.items():
+        assert not errors
+        assert len(file_names) == 2 * len(PLOTS)
+        assert all(os.path.exists(f) for f in file_names)
+
+    again = report(subset, output, formats=("png", "svg"), workers=2)
+    assert all(file_names == [] for file_names, errors in again.values())
+
+    changed = subset.copy()
+    first_run = changed.channel_run_id.iloc[0]
+    changed.loc[changed.channel_run_id == first_run, "read_end_time"] += 1
+    rerun = report(changed, output, formats=("png", "svg"))
+    assert len(rerun[first_run][0]) == 2 * len(PLOTS)
+    assert sum(1 for file_names, errors in rerun.values() if file_names) == 1
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+import porekit
+from porekit import scoring
+
+
+model_file = "tests/data/2016_3_4_3507_1_ch120_read635_strand.fast5"
+
+
+def get_model():
+    fast5 = porekit.Fast5File(model_file)
+    try:
+        return fast5["Analyses/Basecall_1D_000/BaseCalled_template/Model"][:]
+    finally:
+        fast5.close()
+
+
+def test_kmer_codes():
+    codes = porekit.utils.kmer_codes("ACGTNA", 2)
+    assert list(codes) == [1, 6, 11, -1, -1]
+
+
+def test_expected_levels():
+    import pandas as pd
+    model = pd.DataFrame(get_model())
+    sequence = "ACGTACGTTTGACA"
+    means, stdvs = scoring.expected_levels(sequence, model)
+    assert len(means) == len(sequence) - 5
+    for i in range(len(means)):
+        row = model[model.kmer == sequence[i:i + 6].encode("ascii")].iloc[0]
+        assert means[i] == row.level_mean
+        assert stdvs[i] == row.level_stdv
+
+
+def test_score_matrix_matches_loop():
+    rng = np.random.RandomState(0)
+    levels = rng.normal(60, 10, size=(3, 40))
+    stdvs = rng.uniform(0.5, 2, size=(3, 40))
+    events = rng.normal(60, 10, size=(2, 30))
+    ll, shift, scale, n = scoring.score_matrix(events, levels, stdvs, fit=False)
+    for i in range(2):
+        for j in range(3):
+            expected = scoring.event_log_likelihoods(events[i], levels[j, :30], stdvs[j, :30]).sum()
+            assert ll[i, j] == pytest.approx(expected)
+            assert n[i, j] == 30
+
+
+def test_fit_recovers_shift_and_scale():
+    rng = np.random.RandomState(1)
+    levels = rng.normal(60, 10, size=(1, 200))
+    stdvs = np.ones((1, 200))
+    events = levels * 1.1 + 5
+    ll, shift, scale, n = scoring.score_matrix(events, levels, stdvs, fit=True)
+    assert scale[0, 0] == pytest.approx(1.1)
+    assert shift[0, 0] == pytest.approx(5)
+
+
+def test_classify_simulated_reads():
+    import pandas as pd
+    model = pd.DataFrame(get_model())
+    rng = np.random.RandomState(2)
+    candidates = ["".join(rng.choice(list("ACGT"), 300)) for i in range(4)]
+    reads = []
+    for candidate in candidates:
+        means, stdvs = scoring.expected_levels(candidate, model)
+        reads.append(rng.normal(means, stdvs) * 0.9 + 3)
+    assert list(scoring.classify(reads, candidates, model)) == [0, 1, 2, 3]
+
+
+def test_classify_candidates_of_unequal_length():
+    import pandas as pd
+    model = pd.DataFrame(get_model())
+    rng = np.random.RandomState(3)
+    long_candidate = "".join(rng.choice(list("ACGT"), 300))
+    # A prefix of the true sequence with a mutation every 8 bases
+    short_candidate = "".join("ACGT"[("ACGT".index(base) + 1) % 4] if i % 8 == 0 else base
+                              for i, base in enumerate(long_candidate[:40]))
+    means, stdvs = scoring.expected_levels(long_candidate, model)
+    read = rng.normal(means, stdvs)
+    candidates = [short_candidate, long_candidate]
+    raw = scoring.score_batch([read], candidates, model, normalize=False)
+    # The summed log-likelihood of the short candidate covers fewer events
+    assert raw.values[0, 0] > raw.values[0, 1]
+    scores = scoring.score_batch([read], candidates, model, min_overlap=0)
+    expected = [scoring.expected_levels(candidate, model) for candidate in candidates]
+    levels = scoring.pad_rows([levels for levels, stdvs in expected], len(read))
+    stdvs = scoring.pad_rows([stdvs for levels, stdvs in expected], len(read))
+    ll, shift, scale, n = scoring.score_matrix(read[None, :], levels, stdvs)
+    assert np.allclose(scores.values, ll / n)
+    assert list(scoring.classify([read], candidates, model)) == [1]
+
+
+def test_short_decoy_does_not_win():
+    import pandas as pd
+    model = pd.DataFrame(get_model())
+    rng = np.random.RandomState(4)
+    true_candidate = "".join(rng.choice(list("ACGT"), 300))
+    means, stdvs = scoring.expected_levels(true_candidate, model)
+    read = rng.normal(means, stdvs) * 0.9 + 3
+    # A few k-mers of the truth, which shift and scale fit almost perfectly
+    decoy = true_candidate[:9]
+    candidates = [decoy, true_candidate]
+    per_event = scoring.score_batch([read], candidates, model, min_overlap=0)
+    assert per_event.values[0, 0] > per_event.values[0, 1]
+    scores = scoring.score_batch([read], candidates, model)
+    assert scores.values[0, 0] == -np.inf
+    assert list(scoring.classify([read], candidates, model)) == [1]
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+import porekit
+from porekit.segmentation import EventDetector, detect_events, segment_fast5, segment_files
+
+
+test_data_path = "tests/data/"
+raw_file = (test_data_path + "COLLES_L160692_20160605_FNFAD13031_MN16453_sequencing_run_"
+            "Zika_Flowcell1_12plex_35408_ch103_read188_strand.fast5")
+
+
+def test_detect_steps():
+    signal = np.repeat([100, 200, 150, 300], 50)
+    events = detect_events(signal + np.tile([0, 1], 100), start=1000)
+    assert list(events['start']) == [1000, 1050, 1100, 1150]
+    assert list(events['length']) == [50] * 4
+    assert np.allclose(events['mean'], [100.5, 200.5, 150.5, 300.5])
+
+
+def test_chunked_matches_whole():
+    with porekit.open_fast5(raw_file) as fast5:
+        raw = fast5.get_raw_signal(scaled=False)
+    whole = detect_events(raw)
+    assert whole['length'].sum() == len(raw)
+    for chunk_size in [1, 13, 4096]:
+        detector = EventDetector()
+        chunks = [detector.feed(raw[i:i + chunk_size]) for i in range(0, len(raw), chunk_size)]
+        chunked = np.concatenate(chunks + [detector.finish()])
+        assert np.array_equal(whole, chunked)
+
+
+def test_segment_fast5():
+    with porekit.open_fast5(raw_file) as fast5:
+        events = segment_fast5(fast5, chunk_size=1000)
+        node = fast5.get_raw_node()
+        assert events['start'][0] == node.attrs['start_time']
+        assert events['length'].sum() == len(node['Signal'])
+        reference = fast5.get_events()
+    # Roughly in the range of the events of the upstream software
+    assert abs(np.median(events['mean']) - reference['mean'].median()) < 20
+
+
+def test_segment_files_workers():
+    names = [raw_file] * 3
+    single = list(segment_files(names, workers=1))
+    parallel = list(segment_files(names, workers=2))
+    assert [name for name, events in parallel] == names
+    for (a, events_a), (b, events_b) in zip(single, parallel):
+        assert np.array_equal(events_a, events_b)
+
+
+def test_segment_files_skips_failing_files(tmpdir):
+    no_raw = "tests/data/2016_3_4_3507_1_ch120_read635_strand.fast5"
+    missing = str(tmpdir.join("missing.fast5"))
+    names = [raw_file, no_raw, missing, raw_file]
+    for workers in [1, 2]:
+        errors = []
+        results = list(segment_files(names, workers=workers, errors=errors))
+        assert [name for name, events in results] == [raw_file, raw_file]
+        assert [(error["absolute_filename"], error["stage"]) for error in errors] == \
+            [(no_raw, "file"), (missing, "open")]
+    with pytest.raises(KeyError):
+        list(segment_files([no_raw], raise_errors=True))
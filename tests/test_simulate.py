@@ -0,0 +1,50 @@
+import os
+import numpy as np
+import porekit
+from porekit.batch import EventBatch
+from porekit.simulate import read_fasta, load_model, simulate_reads, simulate
+
+
+test_file = "tests/data/2016_3_4_3507_1_ch120_read635_strand.fast5"
+
+
+def references():
+    rng = np.random.default_rng(0)
+    sequence = np.frombuffer(b"ACGT", dtype="uint8")[rng.integers(0, 4, 20000)].tobytes()
+    return [(b"chr1", sequence), (b"chr2", b"ACGTN" * 500)]
+
+
+def test_read_fasta(tmpdir):
+    path = str(tmpdir.join("ref.fa"))
+    with open(path, "w") as f:
+        f.write(">one description\nACGT\nAC\n>two\n\nGGG\n")
+    assert read_fasta(path) == [(b"one", b"ACGTAC"), (b"two", b"GGG")]
+
+
+def test_deterministic_across_workers():
+    model = load_model(test_file)
+    batch, labels = simulate_reads(references(), model, 30, seed=7, shard_size=7, mean_length=500)
+    again, labels_again = simulate_reads(references(), model, 30, seed=7, workers=2,
+                                         shard_size=4, mean_length=500)
+    assert np.array_equal(batch.events, again.events)
+    assert labels.equals(labels_again)
+    assert list(batch.lengths) == list(labels.n_events)
+    other, other_labels = simulate_reads(references(), model, 30, seed=8, mean_length=500)
+    assert not labels.read_id.equals(other_labels.read_id)
+
+
+def test_simulate_fast5(tmpdir):
+    output = str(tmpdir.join("sim"))
+    labels = simulate(references(), load_model(test_file), output, 6, seed=1, shard_size=4,
+                      fast5=True, mean_length=300)
+    assert sorted(os.listdir(output)) == ["events_00000000.pkev", "events_00000004.pkev",
+                                          "fast5", "labels.feather"]
+    batch = EventBatch.load(os.path.join(output, "events_00000004.pkev"))
+    assert len(batch) == 2
+    df = porekit.gather_metadata(os.path.join(output, "fast5"))
+    assert sorted(df.read_id) == sorted(labels.read_id)
+    with porekit.open_fast5(os.path.join(output, "fast5", "simulated_read5.fast5")) as fast5:
+        events = fast5.get_events()
+        assert np.allclose(events["mean"], batch[1]["mean"])
+        signal = fast5.get_raw_signal()
+        assert len(signal) == events["length"].sum()
@@ -0,0 +1,88 @@
+import os
+import pytest
+import matplotlib
+matplotlib.use("Agg")
+import porekit
+from porekit.storage import write_metadata, write_metadata_dataset, read_metadata, load_metadata
+
+
+test_data_path = "tests/data/"
+
+
+@pytest.fixture(scope="module")
+def metadata():
+    return porekit.gather_metadata(test_data_path)
+
+
+@pytest.fixture(scope="module")
+def dataset(metadata, tmpdir_factory):
+    path = str(tmpdir_factory.mktemp("storage").join("metadata"))
+    write_metadata_dataset(metadata, path, {"Channel": 2})
+    return path
+
+
+def test_dataset_roundtrip(metadata, dataset):
+    runs = [name for name in os.listdir(dataset) if name.startswith("channel_run_id=")]
+    assert len(runs) == metadata.channel_run_id.nunique()
+    df, versions = read_metadata(dataset)
+    assert versions == {"Channel": 2}
+    assert list(df.columns) == list(metadata.columns)
+    assert sorted(df.read_id) == sorted(metadata.read_id)
+
+
+def test_load_metadata_filters(metadata, dataset):
+    run_id = metadata.channel_run_id.iloc[0]
+    filters = [("channel_run_id", "=", run_id), ("channel_number", "<", 200)]
+    df = load_metadata(dataset, columns=["read_id", "channel_number", "read_hour"], filters=filters)
+    expected = metadata[(metadata.channel_run_id == run_id) & (metadata.channel_number < 200)]
+    assert list(df.columns) == ["read_id", "channel_number", "read_hour"]
+    assert sorted(df.read_id) == sorted(expected.read_id)
+
+    df = load_metadata(dataset, filters=[("read_hour", "=", 0)])
+    assert "read_hour" not in df.columns
+    assert len(df) < len(metadata)
+
+
+def test_load_metadata_feather(metadata, tmpdir):
+    path = str(tmpdir.join("metadata.feather"))
+    write_metadata(metadata, path)
+    df = load_metadata(path, columns=["read_id"], filters=[("channel_number", "<", 100)])
+    assert len(df) == (metadata.channel_number < 100).sum()
+
+
+def test_plots_accept_loaded_metadata(dataset):
+    from porekit import plots
+    df = load_metadata(dataset)
+    for plot in [plots.read_length_distribution, plots.template_vs_complement,
+                 plots.reads_vs_time, plots.occupancy, plots.yield_curves]:
+        f, ax = plot(df)
+        matplotlib.pyplot.close(f)
+
+
+def test_dataset_refuses_foreign_directory(metadata, tmpdir):
+    results = tmpdir.mkdir("results")
+    results.join("notes.txt").write("keep me")
+    with pytest.raises(ValueError):
+        write_metadata_dataset(metadata, str(results))
+    assert results.join("notes.txt").read() == "keep me"
+
+
+def test_dataset_rewrite_keeps_other_files(metadata, tmpdir):
+    path = tmpdir.join("metadata")
+    write_metadata_dataset(metadata, str(path))
+    path.join("notes.txt").write("keep me")
+    first_run = metadata.channel_run_id.iloc[0]
+    write_metadata_dataset(metadata[metadata.channel_run_id == first_run], str(path))
+    assert path.join("notes.txt").read() == "keep me"
+    assert load_metadata(str(path)).channel_run_id.unique().tolist() == [first_run]
+
+
+def test_collect_refuses_foreign_directory(tmpdir):
+    from click.testing import CliRunner
+    from porekit.scripts.main import main
+    results = tmpdir.mkdir("results")
+    results.join("notes.txt").write("keep me")
+    for args in [[], ["--partition"]]:
+        result = CliRunner().invoke(main, ["collect", test_data_path, str(results)] + args)
+        assert result.exit_code != 0
+    assert results.listdir() == [results.join("notes.txt")]
@@ -0,0 +1,85 @@
+import pytest
+import porekit
+from porekit import plugins
+from porekit.storage import read_metadata, write_metadata
+from porekit.plugins import plugin_versions
+
+
+test_data_path = "tests/data/"
+
+
+class CountingChannel(plugins.Channel):
+    calls = 0
+
+    def run_on_fast5(self, fast5):
+        CountingChannel.calls += 1
+        return super().run_on_fast5(fast5)
+
+
+def test_update_runs_only_stale_plugins(tmpdir):
+    first = [CountingChannel(), plugins.Read()]
+    df = porekit.gather_metadata(test_data_path, plugins=first)
+    file_name = str(tmpdir.join("meta.feather"))
+    write_metadata(df, file_name, plugin_versions(first))
+
+    df, versions = read_metadata(file_name)
+    assert versions == {"CountingChannel": 2, "Read": 2}
+    CountingChannel.calls = 0
+    second = [CountingChannel(), plugins.Read(), plugins.Tracking()]
+    updated, versions = porekit.update_metadata(df, versions, plugins=second)
+    assert CountingChannel.calls == 0
+    assert versions["Tracking"] == 1
+    assert len(updated) == len(df)
+    assert updated.channel_run_id.notnull().all()
+    assert (updated.channel_number == df.channel_number).all()
+
+
+def test_update_reruns_changed_plugin():
+    df = porekit.gather_metadata(test_data_path, plugins=[CountingChannel()])
+    CountingChannel.calls = 0
+    updated, versions = porekit.update_metadata(df, {"CountingChannel": 1},
+                                                plugins=[CountingChannel()])
+    assert CountingChannel.calls == len(df)
+    assert list(updated.columns) == list(df.columns)
+
+
+def test_update_adds_new_files():
+    df = porekit.gather_metadata(test_data_path, plugins=[plugins.Read()])
+    partial = df.iloc[:10]
+    updated, versions = porekit.update_metadata(partial, {"Read": 2}, path=test_data_path,
+                                                plugins=[plugins.Read()])
+    assert sorted(updated.absolute_filename) == sorted(df.absolute_filename)
+
+
+class Flaky(plugins.Plugin):
+    base_name = "flaky"
+    expected_keys = ["ok"]
+    broken = True
+
+    def run_on_fast5(self, fast5):
+        if Flaky.broken:
+            raise ValueError("broken")
+        return {"ok": 1}
+
+
+class Failing(plugins.Plugin):
+    base_name = "failing"
+    expected_keys = ["ok"]
+
+    def run_on_fast5(self, fast5):
+        raise ValueError("always broken")
+
+
+def test_update_refreshes_errors():
+    Flaky.broken = True
+    df = porekit.gather_metadata(test_data_path, plugins=[Flaky(), Failing()])
+    errors = porekit.porekit.metadata_errors(df)
+    assert sorted(set(errors.stage)) == ["failing", "flaky"]
+
+    Flaky.broken = False
+    updated, versions = porekit.update_metadata(df, {"Flaky": 0, "Failing": 1},
+                                                plugins=[Flaky(), Failing()])
+    assert (updated.flaky_ok == 1).all()
+    errors = porekit.porekit.metadata_errors(updated)
+    assert set(errors.stage) == {"failing"}
+    assert len(errors) == len(df)
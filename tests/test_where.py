@@ -0,0 +1,101 @@
+import pytest
+import porekit
+from porekit.plugins import Basecall, Channel, Read
+
+
+test_data_path = "tests/data/"
+
+
+class CountingBasecall(Basecall):
+    calls = 0
+
+    def run_on_fast5(self, fast5):
+        CountingBasecall.calls += 1
+        return super().run_on_fast5(fast5)
+
+
+def channel_below_100(record):
+    return record["channel_number"] < 100
+
+
+def test_where_expression():
+    full = porekit.gather_metadata(test_data_path)
+    selected = porekit.gather_metadata(test_data_path, where="channel_number < 100")
+    expected = full[full.channel_number < 100]
+    assert sorted(selected.absolute_filename) == sorted(expected.absolute_filename)
+    assert 0 < len(selected) < len(full)
+    assert selected.basecall_template_length.notnull().any()
+
+
+def test_where_skips_expensive_plugins():
+    CountingBasecall.calls = 0
+    plugins = [Channel(), Read(), CountingBasecall()]
+    df = porekit.gather_metadata(test_data_path, plugins=plugins,
+                                 where='read_number > 0 and channel_number != -1')
+    assert CountingBasecall.calls == len(df)
+    CountingBasecall.calls = 0
+    df = porekit.gather_metadata(test_data_path, plugins=plugins, where=channel_below_100)
+    assert CountingBasecall.calls == len(df)
+    assert (df.channel_number < 100).all()
+
+
+def test_where_workers():
+    single = porekit.gather_metadata(test_data_path, where=channel_below_100)
+    parallel = porekit.gather_metadata(test_data_path, where="channel_number < 100", workers=2)
+    assert sorted(single.absolute_filename) == sorted(parallel.absolute_filename)
+
+
+def test_where_unknown_column():
+    with pytest.raises(ValueError):
+        porekit.gather_metadata(test_data_path, where="basecall_template_length > 1000")
+
+
+class BrokenChannel(Channel):
+    def run_on_fast5(self, fast5):
+        raise OSError("truncated")
+
+
+def test_where_keeps_failing_files(tmpdir):
+    import shutil
+    source = tmpdir.mkdir("source")
+    file_names = sorted(porekit.find_fast5_files(test_data_path))[:3]
+    for name in file_names:
+        shutil.copy(name, str(source))
+    broken = source.join("broken.fast5")
+    broken.write("not an HDF5 file")
+    df = porekit.gather_metadata(str(source), where="channel_number < 10000")
+    errors = porekit.porekit.metadata_errors(df)
+    assert list(errors.absolute_filename) == [str(broken)]
+    assert list(errors.stage) == ["open"]
+    assert len(df) == 4
+
+    CountingBasecall.calls = 0
+    df = porekit.gather_metadata(str(source), plugins=[BrokenChannel(), Read(), CountingBasecall()],
+                                 where="channel_number < 10000")
+    errors = porekit.porekit.metadata_errors(df)
+    assert len(df) == 4
+    assert sorted(set(errors.stage)) == ["channel", "open", "where"]
+    assert CountingBasecall.calls == 0
+
+
+def test_where_expression_syntax():
+    from porekit.porekit import WherePredicate
+    record = {"channel_number": 12, "read_number": 3, "run": "abc"}
+    assert WherePredicate("channel_number in (12, 13) and not read_number > 5")(record)
+    assert WherePredicate("0 < read_number <= 3 or run == 'x'")(record)
+    assert not WherePredicate("channel_number != -12 and run is None")(record)
+    for expression in ["__import__('os').system('true')",
+                       "().__class__.__bases__[0].__subclasses__()",
+                       "run.upper() == 'ABC'",
+                       "channel_number + 1 > 3",
+                       "[x for x in run]",
+                       "channel_number <"]:
+        with pytest.raises(ValueError):
+            WherePredicate(expression)
+
+
+def test_where_predicate_pickles():
+    import pickle
+    from porekit.porekit import WherePredicate
+    predicate = pickle.loads(pickle.dumps(WherePredicate("channel_number < 100")))
+    assert predicate({"channel_number": 5})